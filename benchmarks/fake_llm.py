@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the prompt-generation LLM: an OpenAI-compatible
+/v1/chat/completions endpoint that streams a <visuals> document for the
+script it receives, with configurable latency and failure rate.
+
+    python -m benchmarks.fake_llm --port 8100 --first-token 0.5 --token-delay 0.002
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words used to pad prompts up to the system prompt's word limits
+FILLER = ("cinematic lighting, ultra detailed textures, realistic depth, soft shadows, "
+          "natural colors, sharp focus, wide composition, atmospheric haze").split()
+
+def _words(text: str, count: int) -> str:
+    words = re.sub(r"[^A-Za-z ]", " ", text).split() or ["scene"]
+    out = []
+    while len(out) < count:
+        out.extend(words)
+        out.extend(FILLER)
+    return " ".join(out[:count]).rstrip(",") + "."
+
+SENTENCE = re.compile(r"<sentence_(\d+)>(.*?)</sentence_\1>", re.DOTALL)
+
+def VisualsFor(script: str, think: bool = True) -> str:
+    """
+    Builds a response in the format the system prompt asks for, one block per
+    script sentence, with prompts inside the word limits.
+    """
+    # Numbered <sentence_N> blocks keep their numbers, like the real model
+    numbered = [(int(n), text) for n, text in SENTENCE.findall(script)]
+    if not numbered:
+        numbered = list(enumerate((s for s in re.split(r"(?<=[.!?])\s+", script.strip()) if s), 1))
+    parts = ["<think>\nPlanning <sentence_1> visuals.\n</think>\n"] if think else []
+    parts.append("<visuals>\n")
+    for number, sentence in numbered:
+        parts.append(
+            f"<sentence_{number}>\n"
+            f"<image_generator_prompt>{_words(sentence, 160)}</image_generator_prompt>\n"
+            f"<image_to_video_prompt>{_words(sentence, 50)}</image_to_video_prompt>\n"
+            f"<image_to_video_negative_prompt>{_words('blurry distorted low quality', 35)}"
+            f"</image_to_video_negative_prompt>\n"
+            f"</sentence_{number}>\n"
+        )
+    parts.append("</visuals>\n")
+    return "".join(parts)
+
+class Settings:
+    first_token = 0.5      # seconds before the first chunk
+    token_delay = 0.002    # seconds between chunks
+    chunk_chars = 4        # characters per streamed chunk
+    failure_rate = 0.0     # probability a request fails (HTTP 503 or a cut stream)
+    think = True
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests_served = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with Handler.lock:
+            Handler.requests_served += 1
+
+        if random.random() < Settings.failure_rate / 2:
+            self.send_error(503, "Simulated overload")
+            return
+
+        script = next((m["content"] for m in reversed(body.get("messages", []))
+                       if m.get("role") == "user"), "")
+        text = VisualsFor(script, Settings.think)
+        cut_at = len(text) // 2 if random.random() < Settings.failure_rate / 2 else None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(Settings.first_token)
+        model = body.get("model", "fake")
+        for start in range(0, len(text), Settings.chunk_chars):
+            if cut_at is not None and start >= cut_at:
+                # Drop the connection mid-stream like a flaky provider
+                self.close_connection = True
+                return
+            self._event({
+                "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text[start:start + Settings.chunk_chars]},
+                             "finish_reason": None}],
+            })
+            time.sleep(Settings.token_delay)
+        self._event({
+            "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        })
+        self._write(b"data: [DONE]\n\n")
+        self._write(b"")
+
+    def _event(self, payload: dict):
+        self._write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _write(self, data: bytes):
+        # HTTP/1.1 chunked transfer encoding; an empty write ends the body
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+def Serve(port: int = 8100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Starts the server on a background thread and returns it (call shutdown()).
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible streaming chat server.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--first-token", type=float, default=Settings.first_token)
+    parser.add_argument("--token-delay", type=float, default=Settings.token_delay)
+    parser.add_argument("--chunk-chars", type=int, default=Settings.chunk_chars)
+    parser.add_argument("--failure-rate", type=float, default=Settings.failure_rate)
+    parser.add_argument("--no-think", action="store_true")
+    args = parser.parse_args()
+
+    Settings.first_token = args.first_token
+    Settings.token_delay = args.token_delay
+    Settings.chunk_chars = args.chunk_chars
+    Settings.failure_rate = args.failure_rate
+    Settings.think = not args.no_think
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Fake LLM listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the two Gradio Spaces, serving the sample files in
+generated_images/ and generated_videos/ as results:
+
+    python -m benchmarks.fake_spaces image --port 7861 --latency 2 --failure-rate 0.1
+    python -m benchmarks.fake_spaces video --port 7862 --latency 8
+
+Point the pipeline at them with IMAGE_SPACE_URL / VIDEO_SPACE_URL (comma-separated
+for several instances) and USE_TOR=0.
+The endpoints accept the same arguments as the real /process_image and
+/generate_video APIs.
+"""
+import os
+import glob
+import time
+import random
+import argparse
+import itertools
+
+import gradio as gr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_FIXTURES = sorted(glob.glob(os.path.join(ROOT, "generated_images", "*.png")))
+VIDEO_FIXTURES = sorted(glob.glob(os.path.join(ROOT, "generated_videos", "*.mp4")))
+
+class Knobs:
+    latency = 1.0        # mean seconds per job
+    jitter = 0.25        # +/- fraction of latency
+    failure_rate = 0.0   # probability a job raises
+
+def _simulate_work():
+    time.sleep(max(0.0, Knobs.latency * random.uniform(1 - Knobs.jitter, 1 + Knobs.jitter)))
+    if random.random() < Knobs.failure_rate:
+        raise gr.Error("Simulated GPU failure")
+
+def ImageApp() -> gr.Blocks:
+    if not IMAGE_FIXTURES:
+        raise FileNotFoundError("No fixture images in generated_images/")
+    fixtures = itertools.cycle(IMAGE_FIXTURES)
+
+    def process_image(height, width, steps, scales, prompt, seed):
+        _simulate_work()
+        return next(fixtures)
+
+    with gr.Blocks() as app:
+        inputs = [gr.Number(label="height"), gr.Number(label="width"), gr.Number(label="steps"),
+                  gr.Number(label="scales"), gr.Textbox(label="prompt"), gr.Number(label="seed")]
+        output = gr.Image(type="filepath")
+        gr.Button().click(process_image, inputs, output, api_name="process_image")
+    return app
+
+def VideoApp() -> gr.Blocks:
+    if not VIDEO_FIXTURES:
+        raise FileNotFoundError("No fixture videos in generated_videos/")
+    fixtures = itertools.cycle(VIDEO_FIXTURES)
+
+    def generate_video(input_image, prompt, negative_prompt, height, width, duration_seconds,
+                       guidance_scale, steps, seed, randomize_seed):
+        _simulate_work()
+        return next(fixtures), seed
+
+    with gr.Blocks() as app:
+        inputs = [gr.Image(type="filepath", label="input_image"), gr.Textbox(label="prompt"),
+                  gr.Textbox(label="negative_prompt"), gr.Number(label="height"),
+                  gr.Number(label="width"), gr.Number(label="duration_seconds"),
+                  gr.Number(label="guidance_scale"), gr.Number(label="steps"),
+                  gr.Number(label="seed"), gr.Checkbox(label="randomize_seed")]
+        outputs = [gr.Video(), gr.Number()]
+        gr.Button().click(generate_video, inputs, outputs, api_name="generate_video")
+    return app
+
+APPS = {"image": ImageApp, "video": VideoApp}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gradio Space with latency and failure knobs.")
+    parser.add_argument("app", choices=sorted(APPS))
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--latency", type=float, default=Knobs.latency)
+    parser.add_argument("--jitter", type=float, default=Knobs.jitter)
+    parser.add_argument("--failure-rate", type=float, default=Knobs.failure_rate)
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs the Space runs at once")
+    args = parser.parse_args()
+
+    Knobs.latency = args.latency
+    Knobs.jitter = args.jitter
+    Knobs.failure_rate = args.failure_rate
+
+    app = APPS[args.app]()
+    app.queue(default_concurrency_limit=args.concurrency)
+    app.launch(server_name="127.0.0.1", server_port=args.port, show_error=True)
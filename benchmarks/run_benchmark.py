@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of main.py's stages.
+
+Starts the local stand-ins (benchmarks/fake_llm.py and benchmarks/fake_spaces.py),
+points the pipeline at them, runs the selected stages in a scratch directory
+and reports per-stage wall time, throughput, peak RSS and disk usage:
+
+    python -m benchmarks.run_benchmark --repeat 4 --image-latency 2 --video-latency 8
+    python -m benchmarks.run_benchmark --stages prompts,pipeline --failure-rate 0.1
+
+Everything runs without network access, Tor or HF tokens. The stand-ins
+return the sample files in generated_images/ and generated_videos/.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Benchmark stage -> main.py wrappers it runs, in order
+STAGES = {
+    "prompts": ("GeneratePromptsWrapper", "ExtractPromptsWrapper", "ValidatePromptsWrapper"),
+    "images": ("GenerateImagesWrapper",),
+    "videos": ("VideoGenWrapper",),
+    "pipeline": ("PipelineWrapper",),
+    "enhance": ("EnhanceVideosWrapper",),
+    "assemble": ("AssembleVideosWrapper",),
+}
+
+class PeakRSS:
+    """
+    Samples the resident memory of this process and its descendants (minus
+    the stand-in services) and keeps the peak since the last reset().
+    """
+
+    def __init__(self, exclude=(), interval: float = 0.05):
+        self.exclude = set(exclude)
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _descendants(self, pid: int) -> list:
+        pids = [pid]
+        try:
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    for child in f.read().split():
+                        if int(child) not in self.exclude:
+                            pids.extend(self._descendants(int(child)))
+        except OSError:
+            pass
+        return pids
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            total = sum(self._rss(pid) for pid in self._descendants(os.getpid()))
+            self.peak = max(self.peak, total)
+            self._stop.wait(self.interval)
+
+    def reset(self):
+        self.peak = 0
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+def DiskUsage(path: str) -> int:
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
+
+def _wait_for(url: str, proc, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Stand-in for {url} exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(url, timeout=2)
+            return
+        except OSError as e:
+            # Any HTTP answer (even 404/405) means the server is up
+            if hasattr(e, "code"):
+                return
+            time.sleep(0.5)
+    raise TimeoutError(f"Stand-in at {url} did not come up")
+
+def StartServices(args) -> list:
+    """
+    Launches the three stand-ins as subprocesses and waits until they answer.
+    """
+    python = sys.executable
+    services = [
+        ([python, "-m", "benchmarks.fake_llm", "--port", str(args.llm_port),
+          "--first-token", str(args.llm_first_token), "--token-delay", str(args.llm_token_delay),
+          "--failure-rate", str(args.failure_rate)],
+         f"http://127.0.0.1:{args.llm_port}/"),
+        ([python, "-m", "benchmarks.fake_spaces", "image", "--port", str(args.image_port),
+          "--latency", str(args.image_latency), "--failure-rate", str(args.failure_rate),
+          "--concurrency", str(args.space_concurrency)],
+         f"http://127.0.0.1:{args.image_port}/"),
+        ([python, "-m", "benchmarks.fake_spaces", "video", "--port", str(args.video_port),
+          "--latency", str(args.video_latency), "--failure-rate", str(args.failure_rate),
+          "--concurrency", str(args.space_concurrency)],
+         f"http://127.0.0.1:{args.video_port}/"),
+    ]
+    procs = []
+    try:
+        for command, url in services:
+            proc = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+            procs.append(proc)
+            _wait_for(url, proc)
+    except BaseException:
+        StopServices(procs)
+        raise
+    return procs
+
+def StopServices(procs):
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def _configure_main(args):
+    # main.py reads the Space URLs and the Tor switch at import time
+    os.environ["IMAGE_SPACE_URL"] = f"http://127.0.0.1:{args.image_port}/"
+    os.environ["VIDEO_SPACE_URL"] = f"http://127.0.0.1:{args.video_port}/"
+    os.environ["USE_TOR"] = "0"
+    sys.path.insert(0, ROOT)
+    import main
+
+    main.HF_TOKEN_1 = "benchmark"
+    main.PROMPT_BASE_URL = f"http://127.0.0.1:{args.llm_port}/v1"
+    main.PROMPT_CHUNK_SIZE = args.chunk_size
+    main.MAX_JOBS_IN_FLIGHT = args.max_in_flight
+    main.STAGE_LIMITS.update(image=args.max_in_flight, video=args.max_in_flight)
+    # Cold runs: no caches or manifest carried over from earlier runs
+    main.ARTIFACT_CACHE_DIR = None
+    main.PROMPT_CACHE = None
+    main.RUN_MANIFEST = None
+    # Stand-ins fail on purpose; retry them quickly instead of waiting for Tor
+    main.ConfigureRetries(main.RetryPolicy(base_delay=0.2, max_delay=2, job_timeout=120))
+    return main
+
+def RunBenchmark(args) -> list:
+    """
+    Runs the selected stages once and returns one result dict per stage.
+    """
+    procs = StartServices(args)
+    work_dir = tempfile.mkdtemp(prefix="bench_", dir=args.scratch_root)
+    previous_dir = os.getcwd()
+    sampler = PeakRSS(exclude=[proc.pid for proc in procs])
+    rows = []
+    try:
+        main = _configure_main(args)
+        script = main.read_file_as_string(os.path.join(ROOT, "script.txt"))
+        os.chdir(work_dir)
+        with open("script.txt", "w", encoding="utf-8") as f:
+            f.write(" ".join([script.strip()] * args.repeat))
+        sentences = len(main.SplitScriptSentences(main.read_file_as_string("script.txt")))
+
+        for stage in args.stages:
+            sampler.reset()
+            start = time.monotonic()
+            ok = True
+            for name in STAGES[stage]:
+                result = getattr(main, name)()
+                if result is False:
+                    ok = False
+                    break
+            seconds = time.monotonic() - start
+            rows.append({
+                "stage": stage,
+                "ok": ok,
+                "seconds": seconds,
+                "sentences_per_second": sentences / seconds if seconds else 0.0,
+                "peak_rss_bytes": sampler.peak,
+                "disk_bytes": DiskUsage(work_dir),
+            })
+            if not ok:
+                print(f"❌ Stage {stage} failed, stopping.")
+                break
+    finally:
+        os.chdir(previous_dir)
+        sampler.close()
+        StopServices(procs)
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"📁 Outputs kept in {work_dir}")
+
+    PrintReport(rows, sentences)
+    return rows
+
+def PrintReport(rows, sentences):
+    print(f"📊 Benchmark over {sentences} sentences")
+    print(f"   {'stage':<10} {'ok':<3} {'wall s':>8} {'sent/s':>8} {'peak RSS MB':>12} {'disk MB':>9}")
+    for row in rows:
+        print(f"   {row['stage']:<10} {'✅' if row['ok'] else '❌':<3} {row['seconds']:>8.2f} "
+              f"{row['sentences_per_second']:>8.2f} {row['peak_rss_bytes'] / 2 ** 20:>12.1f} "
+              f"{row['disk_bytes'] / 2 ** 20:>9.1f}")
+
+def _stage_list(text: str) -> list:
+    stages = [stage for stage in text.split(",") if stage]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stages {unknown}, choose from {list(STAGES)}")
+    return stages
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark.")
+    parser.add_argument("--stages", type=_stage_list, default=["prompts", "images", "videos"],
+                        help=f"comma-separated, from {','.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=1, help="repeat script.txt this many times")
+    parser.add_argument("--chunk-size", type=int, default=None, help="PROMPT_CHUNK_SIZE")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-first-token", type=float, default=0.5)
+    parser.add_argument("--llm-token-delay", type=float, default=0.002)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--video-latency", type=float, default=3.0)
+    parser.add_argument("--space-concurrency", type=int, default=4)
+    parser.add_argument("--llm-port", type=int, default=8100)
+    parser.add_argument("--image-port", type=int, default=7861)
+    parser.add_argument("--video-port", type=int, default=7862)
+    parser.add_argument("--scratch-root", default=None)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = RunBenchmark(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
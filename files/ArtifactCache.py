@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+from contextlib import contextmanager, closing
+
+DEFAULT_CACHE_DIR = ".artifact_cache"
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+def FileDigest(path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+@contextmanager
+def SqliteTransaction(path: str):
+    """
+    Opens the SQLite database at path for one transaction: commits it (or
+    rolls it back on an error) and always closes the connection.
+    """
+    with closing(sqlite3.connect(path, timeout=30)) as db, db:
+        yield db
+
+def DeterministicSeed(*parts, low: int = 1000, high: int = 9999) -> int:
+    """
+    Derives a stable seed in [low, high] from the given values (e.g. the prompt),
+    so reruns of an unchanged sentence ask the endpoint for the same output.
+    """
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).digest()
+    return low + int.from_bytes(digest[:8], "big") % (high - low + 1)
+
+def PlaceFile(source: str, dest: str, link: bool = False):
+    """
+    Places source at dest atomically via a temp file next to dest and a rename.
+    With link=True the temp file is a hardlink when both paths share a
+    filesystem; only use that when neither side is rewritten in place later.
+    """
+    dest_dir = os.path.dirname(os.path.abspath(dest))
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=dest_dir)
+    os.close(fd)
+    try:
+        os.unlink(tmp)
+        linked = False
+        if link:
+            try:
+                os.link(source, tmp)
+                linked = True
+            except OSError:
+                pass
+        if not linked:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+class ArtifactCache:
+    """
+    Content-addressed on-disk cache for generated images and videos.
+
+    Artifacts are keyed by a hash of everything that determines them (prompts,
+    input file digests, endpoint, generation parameters). The index lives in a
+    small SQLite database next to the objects; once the cache grows past
+    max_bytes the least recently used artifacts are evicted.
+    Connections are opened per call, so one cache can be shared by threads and
+    worker processes alike. Artifacts are copied in and out (never hardlinked)
+    because ffmpeg and shutil.copy rewrite their outputs in place.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite")
+        with SqliteTransaction(self.index_path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def key(kind: str, **params) -> str:
+        """
+        Builds a cache key from an artifact kind and its generation parameters.
+        """
+        payload = json.dumps({"kind": kind, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, dest: str) -> bool:
+        """
+        Places the cached artifact for key at dest. Returns False on a miss.
+        """
+        with SqliteTransaction(self.index_path) as db:
+            row = db.execute("SELECT path FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            path = os.path.join(self.root, row[0])
+            if not os.path.isfile(path):
+                db.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+                return False
+            db.execute("UPDATE artifacts SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        PlaceFile(path, dest)
+        return True
+
+    def put(self, key: str, source: str):
+        """
+        Stores a copy of source under key and evicts old entries if needed.
+        """
+        ext = os.path.splitext(source)[1]
+        rel_path = os.path.join("objects", key[:2], key + ext)
+        PlaceFile(source, os.path.join(self.root, rel_path))
+        size = os.path.getsize(source)
+
+        with SqliteTransaction(self.index_path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO artifacts (key, path, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, rel_path, size, time.time()),
+            )
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used artifacts until the cache fits in max_bytes.
+        """
+        with SqliteTransaction(self.index_path) as db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = db.execute("SELECT key, path, size FROM artifacts ORDER BY last_used").fetchall()
+            for key, rel_path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, rel_path))
+                except FileNotFoundError:
+                    pass
+                db.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+                total -= size
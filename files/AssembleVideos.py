@@ -0,0 +1,141 @@
+import os
+import json
+import shutil
+import subprocess
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, astuple
+
+from files.FrameStream import FINAL_PROFILE
+from files.EnhanceVideos import ListVideos, _sentence_number
+
+@dataclass(frozen=True)
+class ClipFormat:
+    """
+    Everything the concat demuxer needs to match between clips for a stream copy.
+    """
+    codec: str
+    profile: str
+    level: int
+    pix_fmt: str
+    width: int
+    height: int
+    fps: str
+    time_base: str
+
+def ProbeFormat(path: str) -> ClipFormat:
+    """
+    Reads the codec parameters of a clip's first video stream with ffprobe.
+    """
+    output = subprocess.check_output([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,profile,level,pix_fmt,width,height,r_frame_rate,time_base",
+        "-of", "json", path
+    ])
+    stream = json.loads(output)["streams"][0]
+    return ClipFormat(
+        codec=stream["codec_name"],
+        profile=stream.get("profile", ""),
+        level=int(stream.get("level", 0)),
+        pix_fmt=stream.get("pix_fmt", ""),
+        width=int(stream["width"]),
+        height=int(stream["height"]),
+        fps=stream["r_frame_rate"],
+        time_base=stream["time_base"],
+    )
+
+def NormaliseClip(input_path: str, output_path: str, target: ClipFormat,
+                  profile=FINAL_PROFILE):
+    """
+    Re-encodes one clip to the target size and frame rate with the pinned
+    encoder settings, so it can be stream-copied alongside the others.
+    """
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y", "-i", input_path,
+        "-vf", f"scale={target.width}:{target.height},fps={target.fps}",
+        "-an", *profile.args(),
+        output_path
+    ], check=True)
+
+def ConcatClips(clip_paths: list, output_path: str, scratch_dir: str):
+    """
+    Joins clips with the ffmpeg concat demuxer and stream copy (no re-encode).
+    """
+    list_path = os.path.join(scratch_dir, "clips.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in clip_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-c", "copy", "-movflags", "+faststart",
+        output_path
+    ], check=True)
+
+def _normalise_clips(clips, formats, target, work_dir, profile) -> list:
+    # Paths to concatenate: the original clip where it already matches target
+    paths = []
+    for _, path in clips:
+        if formats[path] != target:
+            print(f"🔧 Normalising {os.path.basename(path)}: "
+                  f"{astuple(formats[path])} -> {astuple(target)}")
+            normalised = os.path.join(work_dir, os.path.basename(path))
+            NormaliseClip(path, normalised, target, profile)
+            path = normalised
+        paths.append(path)
+    return paths
+
+def AssembleVideos(input_videos_folder, output_video_path, numbers=None,
+                   scratch_root=None, profile=FINAL_PROFILE) -> bool:
+    """
+    Concatenates the video_N.mp4 clips of input_videos_folder in sentence order
+    into output_video_path without re-encoding them.
+
+    Clips are probed first. Any clip whose format differs from the most common
+    one (codec, profile, level, pixel format, size, frame rate or timebase) is
+    re-encoded once into a scratch directory, which is only expected for clips
+    produced outside FrameEncoder's pinned settings. numbers limits assembly to
+    those sentences (e.g. the ones in prompts.txt). profile is the
+    EncodeProfile the clips were encoded with.
+
+    Returns True if the output was written, False otherwise.
+    """
+    clips = sorted((_sentence_number(path), path)
+                   for path, _ in ListVideos(input_videos_folder, input_videos_folder))
+    if numbers is not None:
+        numbers = set(numbers)
+        missing = sorted(numbers - {number for number, _ in clips})
+        if missing:
+            print(f"❌ Cannot assemble: no clip for sentences {missing}")
+            return False
+        clips = [(number, path) for number, path in clips if number in numbers]
+    if not clips:
+        print(f"❌ No clips to assemble in {input_videos_folder}")
+        return False
+
+    formats = {path: ProbeFormat(path) for _, path in clips}
+    target, _ = Counter(formats.values()).most_common(1)[0]
+
+    work_dir = tempfile.mkdtemp(prefix="assemble_", dir=scratch_root)
+    try:
+        paths = _normalise_clips(clips, formats, target, work_dir, profile)
+
+        # A majority format the pinned encoder settings cannot reproduce (e.g.
+        # clips from an older encoder) is replaced by the normalised format
+        normalised = [path for path in paths if path.startswith(work_dir)]
+        if normalised and ProbeFormat(normalised[0]) != target:
+            target = ProbeFormat(normalised[0])
+            paths = _normalise_clips(clips, formats, target, work_dir, profile)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_video_path)), exist_ok=True)
+        ConcatClips(paths, output_video_path, work_dir)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"❌ Assembly failed: {e}")
+        return False
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"🎬 Assembled {len(paths)} clips into {output_video_path}")
+    return True
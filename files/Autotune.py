@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import socket
+import argparse
+
+from files.FrameStream import ProbeVideo, DecodeFrames
+from files.UpscaleService import (UpscalerPool, ResolutionProfile, DEFAULT_MODEL, DEFAULT_TILESIZE,
+                                  MODEL_SCALES, VERTICAL_1080P)
+
+# Best Real-ESRGAN settings found per host and model
+TUNING_FILE = os.environ.get("ENHANCE_TUNING_FILE", ".enhance_tuning.json")
+
+# Default search grid (0 = no tiling)
+TILESIZES = (0, 64, 128, 256, 512)
+
+# Stand-in frame size when no sample clip is available (the video Space's output)
+SAMPLE_SIZE = (640, 1152)
+
+def LoadSampleFrame(sample_path=None, sample_folder="generated_videos"):
+    """
+    Returns (frame, width, height) of a representative raw RGB frame: the
+    first frame of sample_path (a video or an image), else of the first clip
+    in sample_folder, else random pixels of SAMPLE_SIZE.
+    """
+    if sample_path is None and os.path.isdir(sample_folder):
+        clips = sorted(f for f in os.listdir(sample_folder) if f.endswith(".mp4"))
+        if clips:
+            sample_path = os.path.join(sample_folder, clips[0])
+
+    if sample_path is None:
+        width, height = SAMPLE_SIZE
+        return os.urandom(width * height * 3), width, height
+
+    if sample_path.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+        from PIL import Image
+        with Image.open(sample_path) as img:
+            img = img.convert("RGB")
+            return img.tobytes(), img.width, img.height
+
+    info = ProbeVideo(sample_path)
+    frames = DecodeFrames(sample_path, info)
+    try:
+        frame = next(frames)
+    finally:
+        frames.close()
+    return frame, info.width, info.height
+
+def BenchmarkConfig(frame, width, height, tilesize, threads, workers, frames=8,
+                    model=DEFAULT_MODEL, target=None) -> float:
+    """
+    Times Real-ESRGAN with one setting and returns frames per second. Every
+    worker is its own spawned process, so each run gets a fresh ncnn thread pool.
+    """
+    frames = max(frames, workers * 2)
+    with UpscalerPool(workers=workers, model=model, tilesize=tilesize,
+                      threads_per_worker=threads, target=target) as pool:
+        # The first call pays for pipeline and shader setup
+        pool.upscale_batch([frame] * workers, width, height)
+        start = time.monotonic()
+        pool.upscale_batch([frame] * frames, width, height)
+        return frames / (time.monotonic() - start)
+
+def _default_threads(cpus: int) -> list:
+    options = {1, cpus}
+    n = 2
+    while n < cpus:
+        options.add(n)
+        n *= 2
+    return sorted(options)
+
+def _default_workers(cpus: int) -> list:
+    return [n for n in (1, 2, 4, 8) if n <= cpus]
+
+def _host_entries(data: dict, host: str) -> dict:
+    # {model index: settings} of one host; older files hold a single x4 entry
+    entries = data.get(host or socket.gethostname()) or {}
+    if "tilesize" in entries:
+        return {str(entries.get("model", DEFAULT_MODEL)): entries}
+    return entries
+
+def LoadTuning(path: str = TUNING_FILE, host: str = None, model: int = DEFAULT_MODEL):
+    """
+    Returns the settings tuned on this host for model, or None.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return _host_entries(json.load(f), host).get(str(model))
+    except (OSError, ValueError):
+        return None
+
+def SaveTuning(config: dict, path: str = TUNING_FILE, host: str = None):
+    # Kept next to the host's entries for its other models
+    data = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        pass
+    entries = _host_entries(data, host)
+    entries[str(config["model"])] = config
+    data[host or socket.gethostname()] = entries
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def Autotune(sample_path=None, tilesizes=TILESIZES, threads=None, workers=None, frames=8,
+             model=None, path: str = TUNING_FILE, target=VERTICAL_1080P) -> dict:
+    """
+    Benchmarks every tile size x threads per worker x worker count combination
+    that fits the machine's cores on a sample frame, prints the results and
+    saves the fastest configuration for this host and model. Returns that
+    configuration. model defaults to the one the enhance stage runs towards
+    target (a ResolutionProfile, None = the full x4 model) for the sample's
+    size, and frames are fitted to target as they are at runtime.
+    """
+    cpus = os.cpu_count() or 1
+    threads = threads or _default_threads(cpus)
+    workers = workers or _default_workers(cpus)
+    frame, width, height = LoadSampleFrame(sample_path)
+    if model is None:
+        model = target.model_for(width, height) if target is not None else DEFAULT_MODEL
+    print(f"🔬 Tuning the x{MODEL_SCALES[model]} Real-ESRGAN model on a {width}x{height} "
+          f"frame ({cpus} cores)")
+
+    best = None
+    for worker_count in workers:
+        for thread_count in threads:
+            if worker_count * thread_count > cpus:
+                continue
+            for tilesize in tilesizes:
+                try:
+                    fps = BenchmarkConfig(frame, width, height, tilesize, thread_count,
+                                          worker_count, frames, model, target)
+                except Exception as e:
+                    print(f"   tile {tilesize:>4} x {thread_count:>3} threads x "
+                          f"{worker_count} workers: failed ({e})")
+                    continue
+                print(f"   tile {tilesize:>4} x {thread_count:>3} threads x "
+                      f"{worker_count} workers: {fps:.3f} frames/s")
+                if best is None or fps > best["fps"]:
+                    best = {"model": model, "tilesize": tilesize,
+                            "threads_per_worker": thread_count, "workers": worker_count,
+                            "fps": fps}
+
+    if best is None:
+        raise RuntimeError("Every benchmark configuration failed")
+
+    best.update(frame=f"{width}x{height}", cpus=cpus, measured=time.time())
+    SaveTuning(best, path)
+    print(f"🏁 Best: tile {best['tilesize']}, {best['threads_per_worker']} threads x "
+          f"{best['workers']} workers ({best['fps']:.3f} frames/s), saved to {path}")
+    return best
+
+def CpuBudget(workers, threads_per_worker, cpus):
+    """
+    Fits workers x threads_per_worker into cpus cores (None = no limit): at
+    most one worker per core, and the threads of each capped to its share.
+    """
+    if cpus is None:
+        return workers, threads_per_worker
+    workers = min(workers or max(1, cpus // 4), cpus)
+    threads = max(1, cpus // workers)
+    return workers, min(threads_per_worker or threads, threads)
+
+def TunedUpscalerPool(workers=None, path: str = TUNING_FILE, target=None,
+                      source_size=SAMPLE_SIZE, cpus=None) -> UpscalerPool:
+    """
+    UpscalerPool with this host's tuned tile size and thread count (the
+    defaults when the host has not been tuned). workers overrides the tuned count.
+    With a target ResolutionProfile the model is the one that reaches it from
+    source_size-d clips (the video Space's output by default), and the settings
+    are the ones tuned for that model. cpus limits the cores the pool may use
+    (see CpuBudget).
+    """
+    model = target.model_for(*source_size) if target is not None else DEFAULT_MODEL
+    tuning = LoadTuning(path, model=model) or {}
+    workers, threads_per_worker = CpuBudget(workers or tuning.get("workers"),
+                                            tuning.get("threads_per_worker"), cpus)
+    return UpscalerPool(
+        workers=workers,
+        model=model,
+        tilesize=tuning.get("tilesize", DEFAULT_TILESIZE),
+        threads_per_worker=threads_per_worker,
+        target=target,
+    )
+
+def _int_list(text: str) -> list:
+    return [int(part) for part in text.split(",") if part]
+
+def _target(text: str):
+    # "1080x1920" -> ResolutionProfile, "none" -> None (the full x4 model)
+    if text.lower() == "none":
+        return None
+    width, height = text.lower().split("x")
+    return ResolutionProfile(int(width), int(height))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the fastest Real-ESRGAN settings for this host.")
+    parser.add_argument("--sample", help="video or image to benchmark on")
+    parser.add_argument("--tilesizes", type=_int_list, default=list(TILESIZES))
+    parser.add_argument("--threads", type=_int_list, help="threads per worker to try")
+    parser.add_argument("--workers", type=_int_list, help="worker counts to try")
+    parser.add_argument("--frames", type=int, default=8, help="frames timed per configuration")
+    parser.add_argument("--target", type=_target, default=VERTICAL_1080P,
+                        help="enhance output size as WIDTHxHEIGHT, which picks the model "
+                             "to tune (default 1080x1920, 'none' = the full x4 model)")
+    parser.add_argument("--output", default=TUNING_FILE)
+    args = parser.parse_args()
+
+    Autotune(args.sample, args.tilesizes, args.threads, args.workers, args.frames,
+             path=args.output, target=args.target)
@@ -0,0 +1,450 @@
+import os
+import glob
+import time
+import random
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from gradio_client import handle_file
+
+from files.GradioClients import CLIENT_POOL
+from files.Metrics import METRICS
+from files.RetryPolicy import BREAKERS, CircuitOpenError, RetryableError, IsRetryable
+from files.TorProxy import USE_TOR, use_tor_proxy, tor_ip_ok, change_ip, print_exit_node_country
+
+# Default Spaces, overridable with a comma-separated list of URLs to spread jobs over
+# (e.g. local stand-in apps)
+IMAGE_SPACE_URLS = os.environ.get("IMAGE_SPACE_URL",
+                                  "https://bytedance-hyper-flux-8steps-lora.hf.space").split(",")
+VIDEO_SPACE_URLS = os.environ.get("VIDEO_SPACE_URL",
+                                  "https://multimodalart-wan2-1-fast.hf.space").split(",")
+
+# Generation parameters of the default models, sent with every job
+HYPER_FLUX_PARAMS = dict(height=1152, width=648, steps=8, scales=3.5)
+WAN_PARAMS = dict(height=1152, width=640, duration_seconds=3.4, guidance_scale=1, steps=4)
+
+class Backend(ABC):
+    """
+    One endpoint that generates images or videos. submit() starts a job and
+    returns a Future whose result references the output file in a shape
+    GradioClients.ResultFile understands (a path, a URL, a tuple or a dict).
+
+    Backends serving the same model with the same params produce
+    interchangeable outputs, so caches key on (model, params), not the endpoint.
+    """
+    kind = ""
+
+    def __init__(self, name: str, model: str, params: dict):
+        self.name = name
+        self.model = model
+        self.params = dict(params)
+
+    def health_check(self) -> bool:
+        """
+        Returns True if the endpoint looks able to take jobs.
+        """
+        return True
+
+    def reset(self):
+        """
+        Drops connection state after a failed job, so the next one starts fresh.
+        """
+
+class ImageBackend(Backend):
+    kind = "image"
+
+    @abstractmethod
+    def submit(self, prompt: str, seed: int):
+        ...
+
+class VideoBackend(Backend):
+    kind = "video"
+
+    @abstractmethod
+    def submit(self, input_image: str, prompt: str, negative_prompt: str, seed: int = None):
+        """
+        seed=None lets the endpoint pick a random seed.
+        """
+
+class _GradioBackend:
+    # Shared by the Gradio image and video backends
+    def _client(self):
+        if self.tor:
+            use_tor_proxy()
+        return CLIENT_POOL.get(self.url)
+
+    def health_check(self) -> bool:
+        if self.tor:
+            if not tor_ip_ok():
+                return False
+            print_exit_node_country()
+        try:
+            self._client()
+            return True
+        except Exception as e:
+            print(f"❌ {self.name} is not reachable: {e}")
+            return False
+
+    def reset(self):
+        CLIENT_POOL.reset(self.url)
+        if self.tor:
+            change_ip()
+
+class GradioImageBackend(_GradioBackend, ImageBackend):
+    """
+    A Gradio Space with a Hyper-FLUX style /process_image endpoint
+    (height, width, steps, scales, prompt, seed).
+    """
+
+    def __init__(self, url: str, model: str = "hyper-flux-8steps-lora",
+                 params: dict = HYPER_FLUX_PARAMS, api_name: str = "/process_image",
+                 tor: bool = USE_TOR):
+        super().__init__(url, model, params)
+        self.url = url
+        self.api_name = api_name
+        self.tor = tor
+
+    def submit(self, prompt: str, seed: int):
+        return self._client().submit(**self.params, prompt=prompt, seed=seed,
+                                     api_name=self.api_name)
+
+class GradioVideoBackend(_GradioBackend, VideoBackend):
+    """
+    A Gradio Space with a Wan 2.1 style /generate_video endpoint, returning (video, seed).
+    """
+
+    def __init__(self, url: str, model: str = "wan2.1-fast", params: dict = WAN_PARAMS,
+                 api_name: str = "/generate_video", tor: bool = USE_TOR):
+        super().__init__(url, model, params)
+        self.url = url
+        self.api_name = api_name
+        self.tor = tor
+
+    def submit(self, input_image: str, prompt: str, negative_prompt: str, seed: int = None):
+        return self._client().submit(
+            input_image=handle_file(input_image),
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            **self.params,
+            seed=seed if seed is not None else 42,
+            randomize_seed=seed is None,
+            api_name=self.api_name,
+        )
+
+def _save_response(response, suffix: str):
+    # A JSON answer is passed on as the result ({"url": ...} / {"path": ...});
+    # raw bytes are written to a private temp folder, like gradio_client does
+    if response.headers.get("Content-Type", "").startswith("application/json"):
+        return response.json()
+    folder = tempfile.mkdtemp(prefix="backend_")
+    path = os.path.join(folder, "output" + suffix)
+    with open(path, "wb") as f:
+        for block in response.iter_content(chunk_size=1024 * 1024):
+            f.write(block)
+    return path
+
+class _ThreadedBackend:
+    # Runs blocking calls on the backend's own pool, at most `concurrency` at once
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                thread_name_prefix=f"{self.kind}-backend")
+            return self._pool
+
+    def _init_pool(self, concurrency: int):
+        self.concurrency = concurrency
+        self._pool = None
+        self._executor_lock = threading.Lock()
+
+class HttpImageBackend(_ThreadedBackend, ImageBackend):
+    """
+    A plain HTTP endpoint: POSTs {"prompt", "seed", **params} as JSON to url
+    and expects the image bytes (or JSON pointing at the file) back.
+    health_url, if given, must answer GET with a status below 500.
+    """
+
+    def __init__(self, url: str, model: str, params: dict = HYPER_FLUX_PARAMS,
+                 headers: dict = None, health_url: str = None, timeout: float = 600,
+                 concurrency: int = 4):
+        super().__init__(url, model, params)
+        self.url = url
+        self.headers = headers or {}
+        self.health_url = health_url
+        self.timeout = timeout
+        self._init_pool(concurrency)
+
+    def _call(self, prompt, seed):
+        with requests.post(self.url, json=dict(self.params, prompt=prompt, seed=seed),
+                           headers=self.headers, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            return _save_response(response, ".png")
+
+    def submit(self, prompt: str, seed: int):
+        return self._executor().submit(self._call, prompt, seed)
+
+    def health_check(self) -> bool:
+        return _http_health(self)
+
+class HttpVideoBackend(_ThreadedBackend, VideoBackend):
+    """
+    A plain HTTP endpoint: POSTs the input image as multipart "input_image"
+    with prompt, negative_prompt, seed and params as form fields, and
+    expects the video bytes (or JSON pointing at the file) back.
+    """
+
+    def __init__(self, url: str, model: str, params: dict = WAN_PARAMS,
+                 headers: dict = None, health_url: str = None, timeout: float = 600,
+                 concurrency: int = 4):
+        super().__init__(url, model, params)
+        self.url = url
+        self.headers = headers or {}
+        self.health_url = health_url
+        self.timeout = timeout
+        self._init_pool(concurrency)
+
+    def _call(self, input_image, prompt, negative_prompt, seed):
+        data = dict(self.params, prompt=prompt, negative_prompt=negative_prompt)
+        if seed is not None:
+            data["seed"] = seed
+        with open(input_image, "rb") as image:
+            with requests.post(self.url, data=data, files={"input_image": image},
+                               headers=self.headers, timeout=self.timeout,
+                               stream=True) as response:
+                response.raise_for_status()
+                return _save_response(response, ".mp4")
+
+    def submit(self, input_image: str, prompt: str, negative_prompt: str, seed: int = None):
+        return self._executor().submit(self._call, input_image, prompt, negative_prompt, seed)
+
+    def health_check(self) -> bool:
+        return _http_health(self)
+
+def _http_health(backend) -> bool:
+    if not backend.health_url:
+        return True
+    try:
+        return requests.get(backend.health_url, headers=backend.headers, timeout=10).status_code < 500
+    except requests.RequestException as e:
+        print(f"❌ {backend.name} health check failed: {e}")
+        return False
+
+class _MockBackend(_ThreadedBackend):
+    # Returns copies of fixture files after a simulated delay
+    def _init_mock(self, fixtures: str, pattern: str, latency: float, failure_rate: float,
+                   concurrency: int):
+        self.files = sorted(glob.glob(os.path.join(fixtures, pattern)))
+        if not self.files:
+            raise FileNotFoundError(f"No {pattern} fixtures in {fixtures}")
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._next = 0
+        self._lock = threading.Lock()
+        self._init_pool(concurrency)
+
+    def _call(self):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError(f"Simulated failure on {self.name}")
+        with self._lock:
+            source = self.files[self._next % len(self.files)]
+            self._next += 1
+        # A copy, since saving the result moves the file away
+        folder = tempfile.mkdtemp(prefix="mock_")
+        return shutil.copy(source, folder)
+
+class MockImageBackend(_MockBackend, ImageBackend):
+    """
+    Serves the sample images in `fixtures` in turn, for runs without any endpoint.
+    """
+
+    def __init__(self, fixtures: str = "generated_images", latency: float = 0.0,
+                 failure_rate: float = 0.0, concurrency: int = 4, name: str = "mock-image"):
+        super().__init__(name, "mock", HYPER_FLUX_PARAMS)
+        self._init_mock(fixtures, "*.png", latency, failure_rate, concurrency)
+
+    def submit(self, prompt: str, seed: int):
+        return self._executor().submit(self._call)
+
+class MockVideoBackend(_MockBackend, VideoBackend):
+    """
+    Serves the sample clips in `fixtures` in turn, for runs without any endpoint.
+    """
+
+    def __init__(self, fixtures: str = "generated_videos", latency: float = 0.0,
+                 failure_rate: float = 0.0, concurrency: int = 4, name: str = "mock-video"):
+        super().__init__(name, "mock", WAN_PARAMS)
+        self._init_mock(fixtures, "*.mp4", latency, failure_rate, concurrency)
+
+    def submit(self, input_image: str, prompt: str, negative_prompt: str, seed: int = None):
+        return self._executor().submit(self._call)
+
+class NoHealthyEndpoint(RetryableError):
+    """
+    Raised when every endpoint whose circuit is closed failed its health
+    check (e.g. the Tor connection test). Each was reset on the way, so a
+    retry after the backoff finds a fresh Tor circuit.
+    """
+
+class _EndpointStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.latency = None  # moving average of job seconds, None until measured
+        self.jobs = 0
+        self.failures = 0
+        self.dirty = True    # needs reset/health check before its next job
+
+class EndpointRouter:
+    """
+    Spreads jobs over a pool of interchangeable backends. Each job goes to
+    the healthy backend with the lowest expected wait, estimated as its
+    moving-average job latency times (jobs in flight + 1), so a slow endpoint
+    receives proportionally fewer jobs instead of setting the pace.
+    Backends without a measurement yet are tried first.
+
+    Every backend is health-checked before its first job and again after a
+    failed one; a backend that failed a job or a health check is reset first
+    (new client, new Tor circuit). Failures feed the endpoint's shared
+    CircuitBreaker; while a circuit is open the backend is skipped, and once
+    it half-opens a health check decides whether it gets a trial job. When
+    no backend is usable, submit() raises the retryable NoHealthyEndpoint if
+    some circuit is still closed, else CircuitOpenError with the seconds
+    until the first circuit half-opens.
+    """
+
+    def __init__(self, backends: list, smoothing: float = 0.3):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self.configure(backends)
+
+    def configure(self, backends: list):
+        """
+        Replaces the pool. Every backend must serve the same model and params.
+        """
+        if not backends:
+            raise ValueError("EndpointRouter needs at least one backend")
+        identities = {(b.kind, b.model, tuple(sorted(b.params.items()))) for b in backends}
+        if len(identities) > 1:
+            raise ValueError(f"Routed backends must share kind, model and params: {identities}")
+        with self._lock:
+            self.backends = list(backends)
+            self._stats = {id(b): _EndpointStats() for b in backends}
+
+    @property
+    def kind(self) -> str:
+        return self.backends[0].kind
+
+    @property
+    def model(self) -> str:
+        return self.backends[0].model
+
+    @property
+    def params(self) -> dict:
+        return self.backends[0].params
+
+    def _expected_wait(self, backend) -> float:
+        stats = self._stats[id(backend)]
+        return (stats.latency or 0.0) * (stats.in_flight + 1)
+
+    def _pick(self):
+        with self._lock:
+            candidates = sorted(self.backends, key=lambda b: (self._expected_wait(b),
+                                                              self._stats[id(b)].in_flight))
+        unhealthy = []
+        for backend in candidates:
+            breaker = BREAKERS.get(backend.name)
+            if breaker.state == "open":
+                continue
+            stats = self._stats[id(backend)]
+            if stats.dirty or breaker.state == "half-open":
+                if stats.failures:
+                    backend.reset()
+                if not backend.health_check():
+                    breaker.record_failure()
+                    # Rotate the Tor circuit now, so the next attempt gets a new one
+                    backend.reset()
+                    stats.dirty = True
+                    if breaker.state == "closed":
+                        unhealthy.append(backend.name)
+                    continue
+                stats.dirty = False
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                continue
+            return backend
+
+        names = ", ".join(b.name for b in self.backends)
+        if unhealthy:
+            raise NoHealthyEndpoint(f"No healthy {self.kind} endpoint "
+                                    f"({', '.join(unhealthy)} failed the health check)")
+        retry_after = min(BREAKERS.get(b.name).retry_after() for b in self.backends)
+        raise CircuitOpenError(f"No healthy {self.kind} endpoint ({names}): every circuit "
+                               f"is open", retry_after=retry_after)
+
+    def submit(self, *args, **kwargs):
+        """
+        Submits the job to the best backend; arguments are those of its submit().
+        Returns the backend's Future.
+        """
+        backend = self._pick()
+        stats = self._stats[id(backend)]
+        with self._lock:
+            stats.in_flight += 1
+            stats.jobs += 1
+        start = time.time()
+        started = time.monotonic()
+        try:
+            future = backend.submit(*args, **kwargs)
+        except Exception as e:
+            self._finished(backend, start, started, e)
+            raise
+
+        def done(f):
+            if f.cancelled():
+                error = TimeoutError(f"{backend.name} job was cancelled")
+            else:
+                error = f.exception()
+            self._finished(backend, start, started, error)
+
+        future.add_done_callback(done)
+        return future
+
+    def _finished(self, backend, start, started, error):
+        seconds = time.monotonic() - started
+        stats = self._stats[id(backend)]
+        breaker = BREAKERS.get(backend.name)
+        with self._lock:
+            stats.in_flight -= 1
+            if error is None:
+                stats.latency = seconds if stats.latency is None else (
+                    self.smoothing * seconds + (1 - self.smoothing) * stats.latency)
+            else:
+                stats.failures += 1
+                stats.dirty = True
+        if error is None:
+            breaker.record_success()
+        elif IsRetryable(error):
+            breaker.record_failure()
+        else:
+            # A permanent error is about the request, not the endpoint's health
+            breaker.record_success()
+        METRICS.record_span("endpoint_job", start, seconds, error is None,
+                            stage=backend.kind, endpoint=backend.name)
+
+    def report(self):
+        print(f"📡 {self.kind} endpoints:")
+        with self._lock:
+            for backend in self.backends:
+                stats = self._stats[id(backend)]
+                latency = f"{stats.latency:.1f}s" if stats.latency is not None else "n/a"
+                print(f"   {backend.name}: {stats.jobs} jobs, {stats.failures} failed, "
+                      f"avg latency {latency}, circuit {BREAKERS.get(backend.name).state}")
+
+# Shared by every stage in the process; main.py can configure() other pools
+IMAGE_ROUTER = EndpointRouter([GradioImageBackend(url.strip()) for url in IMAGE_SPACE_URLS])
+VIDEO_ROUTER = EndpointRouter([GradioVideoBackend(url.strip()) for url in VIDEO_SPACE_URLS])
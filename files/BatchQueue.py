@@ -0,0 +1,335 @@
+import os
+import re
+import time
+import shutil
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager, closing
+from dataclasses import dataclass
+
+DEFAULT_QUEUE = "batch_queue.sqlite"
+DEFAULT_PROJECTS_ROOT = "projects"
+
+# Project states, in the order a project normally goes through them
+STATUSES = ("queued", "running", "done", "failed")
+
+# Returned by claim() when max_running projects are leased already
+AT_CAPACITY = object()
+
+# Seconds a runner without poll waits before asking again while at capacity
+CAPACITY_WAIT = 15
+
+@dataclass
+class Project:
+    id: int
+    name: str
+    directory: str
+    status: str
+    attempts: int
+    lease_owner: str = None
+    lease_expires: float = None
+    error: str = None
+
+_COLUMNS = "id, name, directory, status, attempts, lease_owner, lease_expires, error"
+
+def ProjectName(script_path: str) -> str:
+    # "Episode 12 (draft).txt" -> "episode-12-draft"
+    stem = os.path.splitext(os.path.basename(script_path))[0]
+    return re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-") or "project"
+
+def RunnerId() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class BatchQueue:
+    """
+    Persistent SQLite queue of projects. Every project is one script with its
+    own output tree (projects_root/<name>/, holding script.txt and everything
+    main.py writes next to it, including its run manifest).
+
+    A runner claims a project by taking a lease of lease_seconds and renews it
+    while working (see LeaseKeeper). If the runner dies, the lease runs out and
+    another runner reclaims the project; its run manifest makes the rerun skip
+    every finished item, so restarts neither lose nor repeat work. Claims are
+    made in an IMMEDIATE transaction, so two runners never get the same
+    project, and at most max_running projects hold a lease at once across all
+    runners sharing the queue file. Each runner works on one project at a
+    time (see RunQueue); parallelism comes from running several runners.
+    A project is given up (failed) after max_attempts claims that did not
+    finish it.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE, projects_root: str = DEFAULT_PROJECTS_ROOT,
+                 lease_seconds: float = 300, max_attempts: int = 3):
+        # Absolute, because runners change into project directories
+        self.path = os.path.abspath(path)
+        self.projects_root = os.path.abspath(projects_root)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS projects (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    directory TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        # Autocommit mode; _transaction() issues BEGIN IMMEDIATE itself
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def add(self, script_path: str, name: str = None):
+        """
+        Queues script_path as a new project and copies it into the project's
+        directory, so later edits to the original do not affect the run.
+        Returns the Project, or None if a project of that name already exists.
+        """
+        name = name or ProjectName(script_path)
+        if self.get(name) is not None:
+            print(f"⏭️  Project {name} is already queued, skipping {script_path}.")
+            return None
+
+        directory = os.path.join(self.projects_root, name)
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, ".script.txt.tmp")
+        shutil.copyfile(script_path, tmp)
+        os.replace(tmp, os.path.join(directory, "script.txt"))
+
+        now = time.time()
+        try:
+            with self._transaction() as db:
+                db.execute(
+                    "INSERT INTO projects (name, directory, status, created, updated) "
+                    "VALUES (?, ?, 'queued', ?, ?)", (name, directory, now, now))
+        except sqlite3.IntegrityError:
+            print(f"⏭️  Project {name} is already queued, skipping {script_path}.")
+            return None
+        print(f"📥 Queued {script_path} as project {name}")
+        return self.get(name)
+
+    def get(self, name: str):
+        with closing(self._connect()) as db:
+            row = db.execute(f"SELECT {_COLUMNS} FROM projects WHERE name = ?", (name,)).fetchone()
+        return Project(*row) if row else None
+
+    def projects(self) -> list:
+        with closing(self._connect()) as db:
+            rows = db.execute(f"SELECT {_COLUMNS} FROM projects ORDER BY id").fetchall()
+        return [Project(*row) for row in rows]
+
+    def claim(self, owner: str, max_running: int = None):
+        """
+        Leases the oldest queued project, or one whose lease expired, to owner.
+        Returns the Project, None if there is nothing to do, or AT_CAPACITY if
+        there is but max_running projects are already leased.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            # Projects whose runners keep dying are given up on
+            db.execute(
+                "UPDATE projects SET status = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                "error = 'lease expired ' || attempts || ' times', updated = ? "
+                "WHERE status = 'running' AND lease_expires <= ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            row = db.execute(
+                f"SELECT {_COLUMNS} FROM projects WHERE status = 'queued' "
+                "OR (status = 'running' AND lease_expires <= ?) ORDER BY id LIMIT 1",
+                (now,)).fetchone()
+            if row is None:
+                return None
+            if max_running is not None:
+                (running,) = db.execute(
+                    "SELECT COUNT(*) FROM projects WHERE status = 'running' AND lease_expires > ?",
+                    (now,)).fetchone()
+                if running >= max_running:
+                    return AT_CAPACITY
+            project = Project(*row)
+            project.status = "running"
+            project.attempts += 1
+            project.lease_owner = owner
+            project.lease_expires = now + self.lease_seconds
+            db.execute(
+                "UPDATE projects SET status = 'running', attempts = ?, lease_owner = ?, "
+                "lease_expires = ?, updated = ? WHERE id = ?",
+                (project.attempts, owner, project.lease_expires, now, project.id))
+        return project
+
+    def renew(self, project: Project, owner: str) -> bool:
+        """
+        Extends owner's lease on project. False if the lease was lost.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE projects SET lease_expires = ?, updated = ? "
+                "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (now + self.lease_seconds, now, project.id, owner))
+        return cursor.rowcount == 1
+
+    def finish(self, project: Project, owner: str, ok: bool, error: str = None) -> str:
+        """
+        Ends owner's lease. A failed project is queued again until it has used
+        max_attempts. Returns the new status (or the current one if owner had
+        lost the lease, in which case nothing is changed).
+        """
+        if ok:
+            status = "done"
+        elif project.attempts < self.max_attempts:
+            status = "queued"
+        else:
+            status = "failed"
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE projects SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                "error = ?, updated = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (status, error, time.time(), project.id, owner))
+            if cursor.rowcount != 1:
+                (status,) = db.execute("SELECT status FROM projects WHERE id = ?",
+                                       (project.id,)).fetchone()
+        return status
+
+    def release(self, project: Project, owner: str):
+        """
+        Gives a project back unfinished (e.g. on Ctrl+C) without using up an attempt.
+        """
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE projects SET status = 'queued', attempts = attempts - 1, "
+                "lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (time.time(), project.id, owner))
+
+    def retry(self, name: str) -> bool:
+        """
+        Queues a failed or finished project again with a fresh attempt budget.
+        Its run manifest still skips whatever is done and unchanged.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE projects SET status = 'queued', attempts = 0, error = NULL, updated = ? "
+                "WHERE name = ? AND status IN ('done', 'failed')", (time.time(), name))
+        return cursor.rowcount == 1
+
+    def print_summary(self):
+        projects = self.projects()
+        counts = {status: 0 for status in STATUSES}
+        for project in projects:
+            counts[project.status] = counts.get(project.status, 0) + 1
+        print(f"🗂️  Batch queue {self.path}: "
+              + ", ".join(f"{n} {status}" for status, n in counts.items()))
+        for project in projects:
+            lease = ""
+            if project.status == "running":
+                lease = f" (leased by {project.lease_owner}, {project.lease_expires - time.time():.0f}s left)"
+            error = f": {project.error}" if project.error else ""
+            print(f"   {project.name:<30} {project.status:<8} attempt {project.attempts}{lease}{error}")
+
+class LeaseKeeper:
+    """
+    Renews a project's lease every lease_seconds / 3 in a background thread
+    while the runner works on it. The lost event is set if a renewal fails
+    (the runner stalled past its lease and another runner took the project
+    over); the runner must then stop working on it.
+    """
+
+    def __init__(self, queue: BatchQueue, project: Project, owner: str):
+        self.queue = queue
+        self.project = project
+        self.owner = owner
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                renewed = self.queue.renew(self.project, self.owner)
+            except sqlite3.Error as e:
+                print(f"⚠️  Could not renew the lease on {self.project.name}: {e}")
+                continue
+            if not renewed:
+                print(f"⚠️  Lost the lease on {self.project.name}")
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def RunQueue(queue: BatchQueue, run_project, owner: str = None, max_running: int = None,
+             poll: float = None) -> bool:
+    """
+    Claims and runs projects one at a time until none is left.
+    run_project(project, cancelled) does the work and returns True on
+    success; it must stop once the cancelled event is set, which happens when
+    the lease is lost, and the result is then thrown away. Other
+    runner processes sharing the queue work on other projects concurrently,
+    up to max_running in total; while that many are leased, this runner
+    waits (poll seconds, else CAPACITY_WAIT) and tries again. With poll set,
+    the runner also keeps waiting for new projects instead of returning once
+    the queue is empty.
+
+    Returns True if every project this runner finished succeeded.
+    """
+    owner = owner or RunnerId()
+    ok = True
+    while True:
+        project = queue.claim(owner, max_running)
+        if project is AT_CAPACITY:
+            time.sleep(poll or CAPACITY_WAIT)
+            continue
+        if project is None:
+            if poll is None:
+                return ok
+            time.sleep(poll)
+            continue
+
+        print(f"🚚 Project {project.name} (attempt {project.attempts}/{queue.max_attempts})")
+        started = time.monotonic()
+        error = None
+        keeper = LeaseKeeper(queue, project, owner)
+        try:
+            with keeper:
+                success = run_project(project, keeper.lost)
+        except KeyboardInterrupt:
+            queue.release(project, owner)
+            print(f"⏸️  Project {project.name} released back to the queue.")
+            raise
+        except Exception as e:
+            success, error = False, str(e)
+        if keeper.lost.is_set():
+            print(f"🛑 Project {project.name} abandoned: another runner holds its lease now.")
+            continue
+        if not success and error is None:
+            error = "stage chain failed"
+
+        status = queue.finish(project, owner, success, error)
+        ok = ok and success
+        icon = "✅" if success else "❌"
+        print(f"{icon} Project {project.name}: {status} ({time.monotonic() - started:.0f}s)")
@@ -1,45 +1,91 @@
 import os
 import shutil
 import subprocess
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from PIL import Image
 from tqdm import tqdm
-from realesrgan_ncnn_py import Realesrgan
+from files.FrameStream import ProbeVideo, DecodeFrames, FrameEncoder, RunFramePipeline, FINAL_PROFILE
+from files.UpscaleService import LocalUpscaler, UpscalerWorker
+from files.FrameDedup import FrameDeduplicator
+from files.ArtifactCache import FileDigest
+from files.RunManifest import InputHash
+from files.UpscaleService import DEFAULT_MODEL, DEFAULT_TILESIZE, MODEL_SCALES
+from files.Autotune import LoadTuning, CpuBudget
+from files.Metrics import METRICS
 
-def EnhanceVideo(input_video_path, output_video_path):
+# Warm Real-ESRGAN model of a pool worker process, loaded on its first job
+_process_upscaler = None
+
+@dataclass
+class EnhanceResult:
+    input_path: str
+    output_path: str
+    ok: bool
+    seconds: float
+    error: str = ""
+    metrics: list = field(default_factory=list)  # events recorded in a pool worker
+
+def EnhanceVideo(input_video_path, output_video_path, scratch_root=None, upscaler=None,
+                 dedup_threshold=None, profile=FINAL_PROFILE, target=None):
     """
     Enhances a silent video using Real-ESRGAN (CPU only),
     saves output to given path, and cleans up temporary files.
     Shows a progress bar during enhancement.
+
+    Frames are kept in a private scratch directory (created under scratch_root,
+    or the system temp dir) so concurrent runs never share temp folders.
+    upscaler may be a warm LocalUpscaler/UpscalerWorker/UpscalerPool to reuse.
+    With dedup_threshold set, near-identical frames reuse an earlier enhanced frame.
+    profile is the EncodeProfile of the rebuilt video. target is a
+    ResolutionProfile used when no upscaler is passed in.
     """
     # Ensure output directory exists
     os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
 
-    # Temporary directories
-    temp_dir = "temp_frames"
-    enhanced_dir = "enhanced_frames"
+    # Temporary directories, unique to this job
+    work_dir = tempfile.mkdtemp(prefix="enhance_", dir=scratch_root)
+    temp_dir = os.path.join(work_dir, "temp_frames")
+    enhanced_dir = os.path.join(work_dir, "enhanced_frames")
 
     os.makedirs(temp_dir, exist_ok=True)
     os.makedirs(enhanced_dir, exist_ok=True)
 
     try:
         # Step 1: Extract frames from video
-        subprocess.run([
-            "ffmpeg", "-i", input_video_path, "-q:v", "2", f"{temp_dir}/frame_%04d.png"
-        ], check=True)
+        with METRICS.span("extract_frames"):
+            subprocess.run([
+                "ffmpeg", "-i", input_video_path, "-q:v", "2", f"{temp_dir}/frame_%04d.png"
+            ], check=True)
 
-        # Step 2: Initialize Real-ESRGAN
-        realesrgan = Realesrgan(gpuid=-1, model=2, tilesize=128)
+        # Step 2: Initialize Real-ESRGAN (unless a warm model was passed in)
+        if upscaler is None:
+            upscaler = _default_upscaler(input_video_path, target)
+        if dedup_threshold is not None:
+            upscaler = FrameDeduplicator(upscaler, threshold=dedup_threshold)
 
         # Step 3: Enhance each frame with progress bar
         frame_files = sorted(os.listdir(temp_dir))
         print(f"Enhancing {len(frame_files)} frames...")
 
-        for fname in tqdm(frame_files, desc="Enhancing Frames", unit="frame"):
-            in_path = os.path.join(temp_dir, fname)
-            out_path = os.path.join(enhanced_dir, fname)
-            with Image.open(in_path) as img:
-                enhanced = realesrgan.process_pil(img)
-                enhanced.save(out_path, quality=70)
+        with METRICS.span("upscale", frames=len(frame_files)):
+            for fname in tqdm(frame_files, desc="Enhancing Frames", unit="frame"):
+                in_path = os.path.join(temp_dir, fname)
+                out_path = os.path.join(enhanced_dir, fname)
+                with Image.open(in_path) as img:
+                    img = img.convert("RGB")
+                    enhanced = upscaler.upscale(img.tobytes(), img.width, img.height)
+                    size = upscaler.output_size(img.width, img.height)
+                    Image.frombytes("RGB", size, enhanced).save(out_path, quality=70)
+        METRICS.count("frames_processed", len(frame_files))
+
+        if dedup_threshold is not None:
+            METRICS.count("frames_reused", upscaler.hits)
+            print(upscaler.report())
 
         # Step 4: Get video FPS
         fps_str = subprocess.check_output([
@@ -53,30 +99,366 @@ def EnhanceVideo(input_video_path, output_video_path):
         ]).decode().strip())
 
         # Step 5: Rebuild enhanced video
-        subprocess.run([
-            "ffmpeg", "-framerate", str(fps),
-            "-i", f"{enhanced_dir}/frame_%04d.png",
-            "-c:v", "libx264", "-pix_fmt", "yuv420p",
-            output_video_path
-        ], check=True)
+        with METRICS.span("rebuild_video"):
+            subprocess.run([
+                "ffmpeg", "-framerate", str(fps),
+                "-i", f"{enhanced_dir}/frame_%04d.png",
+                *profile.args(),
+                output_video_path
+            ], check=True)
 
         print("✅ Silent video enhanced successfully:", output_video_path)
 
     finally:
-        # Clean up temporary directories
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        shutil.rmtree(enhanced_dir, ignore_errors=True)
+        # Clean up the job's scratch directory
+        shutil.rmtree(work_dir, ignore_errors=True)
 
-def EnhanceVideos(input_videos_folder, output_videos_folder):
+def EnhanceVideoStreaming(input_video_path, output_video_path, scratch_root=None,
+                          upscaler=None, queue_size=8, batch_size=4, dedup_threshold=None,
+                          profile=FINAL_PROFILE, target=None):
     """
-    Enhances all MP4 videos in the input_videos_folder and saves them with the same name
-    in the output_videos_folder.
+    Streaming variant of EnhanceVideo that never writes frames to disk.
+    ffmpeg decodes raw RGB frames onto a pipe, Real-ESRGAN upscales them in memory,
+    and the results are piped straight into the encoder's stdin. Bounded queues
+    between the stages keep memory flat regardless of the clip length.
+    scratch_root is accepted for signature parity with EnhanceVideo and unused.
+    Frames are handed to the upscaler in batches of batch_size.
+    With dedup_threshold set, near-identical frames reuse an earlier enhanced frame.
+    With a target ResolutionProfile (on the upscaler, or here when none is
+    passed in) frames are encoded at the target size instead of the model's.
     """
-    if not os.path.exists(output_videos_folder):
-        os.makedirs(output_videos_folder)
+    os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
+
+    if upscaler is None:
+        upscaler = _default_upscaler(input_video_path, target)
+    if dedup_threshold is not None:
+        upscaler = FrameDeduplicator(upscaler, threshold=dedup_threshold)
+
+    info = ProbeVideo(input_video_path)
+    out_width, out_height = upscaler.output_size(info.width, info.height)
+
+    encoder = FrameEncoder(output_video_path, out_width, out_height, info.fps, profile)
+    progress = tqdm(desc="Enhancing Frames", unit="frame")
+    # Busy time of each pipeline stage; the stages overlap, so these add up to
+    # more than the wall time and show which one is the bottleneck
+    timings = {"decode_seconds": 0.0, "upscale_seconds": 0.0, "encode_seconds": 0.0}
+
+    def decode():
+        frames = DecodeFrames(input_video_path, info)
+        try:
+            while True:
+                start = time.monotonic()
+                frame = next(frames, None)
+                timings["decode_seconds"] += time.monotonic() - start
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            frames.close()
+
+    def enhance(frames):
+        start = time.monotonic()
+        enhanced = upscaler.upscale_batch(frames, info.width, info.height)
+        timings["upscale_seconds"] += time.monotonic() - start
+        progress.update(len(frames))
+        return enhanced
+
+    def write(frame):
+        start = time.monotonic()
+        encoder.write(frame)
+        timings["encode_seconds"] += time.monotonic() - start
+
+    try:
+        written = RunFramePipeline(decode(), enhance, write, queue_size, batch_size)
+        encoder.close()
+    except BaseException:
+        encoder.abort()
+        raise
+    finally:
+        progress.close()
+        for name, seconds in timings.items():
+            METRICS.count(name, seconds)
+
+    METRICS.count("frames_processed", written)
+    if dedup_threshold is not None:
+        METRICS.count("frames_reused", upscaler.hits)
+        print(upscaler.report())
+    print("✅ Silent video enhanced successfully:", output_video_path)
 
-    for filename in os.listdir(input_videos_folder):
+def _default_upscaler(input_video_path, target=None) -> LocalUpscaler:
+    if target is None:
+        return LocalUpscaler()
+    info = ProbeVideo(input_video_path)
+    return LocalUpscaler(model=target.model_for(info.width, info.height), target=target)
+
+def _target_key(target):
+    return None if target is None else target.key()
+
+def EnhanceCacheKey(cache, input_path, upscaler, streaming, dedup_threshold,
+                    profile=FINAL_PROFILE) -> str:
+    """
+    Builds the ArtifactCache key of an enhanced video from its input and settings.
+    """
+    return cache.key("enhanced", input_video=FileDigest(input_path), model=upscaler.model,
+                     tilesize=upscaler.tilesize, streaming=streaming,
+                     dedup_threshold=dedup_threshold, encode=profile.args(),
+                     target=_target_key(upscaler.target))
+
+def _enhance_job(input_path, output_path, streaming, scratch_root, upscaler=None,
+                 dedup_threshold=None, cache=None, profile=FINAL_PROFILE,
+                 tilesize=DEFAULT_TILESIZE, model=DEFAULT_MODEL, target=None) -> EnhanceResult:
+    # Runs one video and turns any failure into a result instead of an exception
+    global _process_upscaler
+
+    enhance = EnhanceVideoStreaming if streaming else EnhanceVideo
+    start = time.monotonic()
+    try:
+        with METRICS.span("enhance_video", stage="enhance", video=os.path.basename(input_path)):
+            if upscaler is None:
+                # Pool workers keep their model warm across every job they run
+                settings = (model, tilesize, target)
+                if _process_upscaler is None or (_process_upscaler.model, _process_upscaler.tilesize,
+                                                 _process_upscaler.target) != settings:
+                    _process_upscaler = LocalUpscaler(model=model, tilesize=tilesize,
+                                                      target=target)
+                upscaler = _process_upscaler
+
+            if cache is not None:
+                cache_key = EnhanceCacheKey(cache, input_path, upscaler, streaming,
+                                            dedup_threshold, profile)
+                if cache.get(cache_key, output_path):
+                    print(f"♻️  Enhanced video served from cache: {output_path}")
+                    return EnhanceResult(input_path, output_path, True, time.monotonic() - start)
+
+            enhance(input_path, output_path, scratch_root=scratch_root, upscaler=upscaler,
+                    dedup_threshold=dedup_threshold, profile=profile)
+
+            if cache is not None:
+                cache.put(cache_key, output_path)
+        return EnhanceResult(input_path, output_path, True, time.monotonic() - start)
+    except Exception as e:
+        return EnhanceResult(input_path, output_path, False, time.monotonic() - start, str(e))
+
+def _pooled_enhance_job(*args) -> EnhanceResult:
+    # Pool workers have their own METRICS; ship what this job recorded back to the parent
+    result = _enhance_job(*args)
+    result.metrics = METRICS.drain()
+    return result
+
+@contextmanager
+def _ncnn_threads(threads: int):
+    # ncnn's CPU path runs on OpenMP, which reads OMP_NUM_THREADS when the
+    # library loads. Spawned workers inherit the environment at start-up.
+    previous = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = previous
+
+def ListVideos(input_videos_folder, output_videos_folder):
+    """
+    Returns (input_path, output_path) pairs for every video_*.mp4 in the input folder.
+    """
+    jobs = []
+    for filename in sorted(os.listdir(input_videos_folder)):
         if filename.endswith(".mp4") and filename.startswith("video_"):
             input_path = os.path.join(input_videos_folder, filename)
             output_path = os.path.join(output_videos_folder, filename)
-            EnhanceVideo(input_path, output_path)
+            jobs.append((input_path, output_path))
+    return jobs
+
+def _sentence_number(video_path) -> int:
+    # "video_12.mp4" -> 12
+    return int(os.path.splitext(os.path.basename(video_path))[0].split("_", 1)[1])
+
+def EnhanceInputHash(input_path, streaming, dedup_threshold, profile=FINAL_PROFILE,
+                     tilesize=DEFAULT_TILESIZE, model=DEFAULT_MODEL, target=None) -> str:
+    """
+    RunManifest input hash of an enhanced video: input digest plus settings.
+    """
+    return InputHash(input_video=FileDigest(input_path), model=model,
+                     tilesize=tilesize, streaming=streaming,
+                     dedup_threshold=dedup_threshold, encode=profile.args(),
+                     target=_target_key(target))
+
+def TargetModel(jobs, target) -> int:
+    """
+    Picks the model for a run towards target from its first video (clips of
+    one Space share a size) and prints the per-frame memory bound.
+    """
+    if target is None or not jobs:
+        return DEFAULT_MODEL
+    info = ProbeVideo(jobs[0][0])
+    model = target.model_for(info.width, info.height)
+    scale = MODEL_SCALES[model]
+    out_width, out_height = target.fit(info.width, info.height)
+    peak = target.peak_frame_bytes(info.width, info.height, scale)
+    print(f"🎯 Enhancing {info.width}x{info.height} to {out_width}x{out_height} with the "
+          f"x{scale} model (≤ {peak / 2 ** 20:.1f} MB per frame in flight)")
+    return model
+
+def _record_result(manifest, result, input_hash):
+    sentence = _sentence_number(result.input_path)
+    if result.ok:
+        manifest.mark_done("enhanced", sentence, input_hash, result.output_path)
+    else:
+        manifest.mark_failed("enhanced", sentence, input_hash, result.error)
+
+def EnhanceVideoJob(input_path, output_path, streaming=False, upscaler=None,
+                    dedup_threshold=None, cache=None, manifest=None,
+                    scratch_root=None, profile=FINAL_PROFILE) -> EnhanceResult:
+    """
+    Enhances a single video_N.mp4 with cache and RunManifest bookkeeping, for
+    callers that schedule videos one by one. upscaler may be shared between
+    concurrent calls if it is thread-safe (e.g. an UpscalerPool).
+    """
+    input_hash = None
+    if manifest is not None:
+        tilesize, model, target = DEFAULT_TILESIZE, DEFAULT_MODEL, None
+        if upscaler is not None:
+            tilesize, model, target = upscaler.tilesize, upscaler.model, upscaler.target
+        input_hash = EnhanceInputHash(input_path, streaming, dedup_threshold, profile, tilesize,
+                                      model, target)
+        if manifest.is_done("enhanced", _sentence_number(input_path), input_hash, output_path):
+            print(f"⏭️  {os.path.basename(output_path)} is up to date, skipping.")
+            return EnhanceResult(input_path, output_path, True, 0.0)
+
+    result = _enhance_job(input_path, output_path, streaming, scratch_root,
+                          upscaler, dedup_threshold, cache, profile)
+    if manifest is not None:
+        _record_result(manifest, result, input_hash)
+    return result
+
+def EnhanceVideosParallel(jobs, workers=None, threads_per_worker=None,
+                          streaming=False, scratch_root=None, dedup_threshold=None,
+                          cache=None, profile=FINAL_PROFILE,
+                          tilesize=DEFAULT_TILESIZE, model=DEFAULT_MODEL, target=None) -> list:
+    """
+    Enhances several videos at once in a process pool.
+
+    jobs is a list of (input_path, output_path) pairs. By default one worker is
+    started per 4 cores (capped at the number of videos) and the cores are split
+    evenly between the workers' ncnn thread pools. Every video gets its own
+    scratch directory. Returns one EnhanceResult per job; a failing video does
+    not stop the others. Each worker holds one model of the given index, with
+    the optional target ResolutionProfile.
+    """
+    if not jobs:
+        return []
+
+    cpus = os.cpu_count() or 1
+    if workers is None:
+        workers = max(1, cpus // 4)
+    workers = max(1, min(workers, len(jobs)))
+    if threads_per_worker is None:
+        threads_per_worker = max(1, cpus // workers)
+
+    print(f"🧵 Enhancing {len(jobs)} videos with {workers} workers x {threads_per_worker} threads")
+
+    results = []
+    # spawn (not fork) so each worker loads ncnn fresh with its own thread count
+    context = multiprocessing.get_context("spawn")
+    with _ncnn_threads(threads_per_worker):
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(_pooled_enhance_job, input_path, output_path, streaming, scratch_root,
+                            None, dedup_threshold, cache, profile, tilesize, model, target)
+                for input_path, output_path in jobs
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                METRICS.merge(result.metrics)
+                result.metrics = []
+                status = "✅" if result.ok else "❌"
+                print(f"{status} {os.path.basename(result.input_path)} ({result.seconds:.1f}s) {result.error}")
+                results.append(result)
+
+    return results
+
+def PrintEnhanceReport(results):
+    """
+    Prints a per-video summary of an enhancement run.
+    """
+    failed = [r for r in results if not r.ok]
+    print(f"📊 Enhanced {len(results) - len(failed)}/{len(results)} videos")
+    for r in failed:
+        print(f"   ❌ {r.input_path}: {r.error}")
+
+def EnhanceVideos(input_videos_folder, output_videos_folder, streaming=False,
+                  workers=1, threads_per_worker=None, scratch_root=None,
+                  dedup_threshold=None, cache=None, manifest=None,
+                  profile=FINAL_PROFILE, tilesize=None, target=None, cpus=None) -> bool:
+    """
+    Enhances all MP4 videos in the input_videos_folder and saves them with the same name
+    in the output_videos_folder. With streaming=True frames are piped through memory
+    instead of being written to temporary PNG folders. workers > 1 (or None for an
+    automatic count) enhances several videos at once in a process pool.
+    dedup_threshold enables reuse of near-identical frames (see FrameDeduplicator).
+    With an ArtifactCache, videos whose input and settings are unchanged are
+    served from the cache. With a RunManifest, videos already enhanced from the
+    same input and settings are skipped. profile is the EncodeProfile of the
+    enhanced videos (lossless when another local stage follows). target is an
+    optional ResolutionProfile: the model scale is picked to reach it and
+    frames are downscaled to it in memory before encoding (see ResolutionProfile
+    for the per-worker memory bound).
+    workers, threads_per_worker and tilesize left as None use the settings
+    saved for this host and model by files/Autotune.py, if any. cpus limits
+    the cores the workers may use together (None = all of them).
+
+    Returns True if every video was enhanced, False otherwise.
+    """
+    if not os.path.exists(output_videos_folder):
+        os.makedirs(output_videos_folder)
+
+    jobs = ListVideos(input_videos_folder, output_videos_folder)
+
+    model = TargetModel(jobs, target)
+    tuning = LoadTuning(model=model) or {}
+    if tilesize is None:
+        tilesize = tuning.get("tilesize", DEFAULT_TILESIZE)
+    if workers is None:
+        workers = tuning.get("workers")
+    if threads_per_worker is None:
+        threads_per_worker = tuning.get("threads_per_worker")
+    workers, threads_per_worker = CpuBudget(workers, threads_per_worker, cpus)
+
+    input_hashes = {}
+    if manifest is not None:
+        pending = []
+        for input_path, output_path in jobs:
+            input_hash = EnhanceInputHash(input_path, streaming, dedup_threshold, profile,
+                                          tilesize, model, target)
+            if manifest.is_done("enhanced", _sentence_number(input_path), input_hash, output_path):
+                print(f"⏭️  {os.path.basename(output_path)} is up to date, skipping.")
+                continue
+            input_hashes[input_path] = input_hash
+            pending.append((input_path, output_path))
+        jobs = pending
+
+    if workers == 1:
+        # One warm model for every video of the run. It runs in a spawned
+        # worker: OMP_NUM_THREADS only counts before ncnn loads, which may
+        # already have happened in this process.
+        results = []
+        if jobs:
+            with UpscalerWorker(model=model, tilesize=tilesize,
+                                threads=threads_per_worker or os.cpu_count() or 1,
+                                target=target) as upscaler:
+                for input_path, output_path in jobs:
+                    results.append(_enhance_job(input_path, output_path, streaming, scratch_root,
+                                                upscaler, dedup_threshold, cache, profile))
+    else:
+        results = EnhanceVideosParallel(jobs, workers, threads_per_worker, streaming,
+                                        scratch_root, dedup_threshold, cache, profile,
+                                        tilesize, model, target)
+
+    if manifest is not None:
+        for r in results:
+            _record_result(manifest, r, input_hashes[r.input_path])
+
+    PrintEnhanceReport(results)
+    return all(r.ok for r in results)
@@ -1,4 +1,27 @@
 import os
+import re
+import xml.etree.ElementTree as ET
+
+from files.PromptRecords import SentencePrompt, FIELD_TAGS
+
+# Tags of the prompt format; any other "<" in the text is literal
+FORMAT_TAG = re.compile(r"</?(?:visuals|sentence_\d+|%s)>" % "|".join(FIELD_TAGS.values()))
+STRAY_AMPERSAND = re.compile(r"&(?!(?:amp|lt|gt|quot|apos|#\d+|#x[0-9A-Fa-f]+);)")
+
+def EscapeStrayMarkup(text: str) -> str:
+    """
+    Escapes "&" and "<" that are not part of an entity or a tag of the prompt
+    format, so a prompt like "salt & pepper" still parses as XML.
+    """
+    text = STRAY_AMPERSAND.sub("&amp;", text)
+    parts = []
+    last = 0
+    for match in FORMAT_TAG.finditer(text):
+        parts.append(text[last:match.start()].replace("<", "&lt;"))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(text[last:].replace("<", "&lt;"))
+    return "".join(parts)
 
 def ExtractPrompts(input_file_string, output_file_string):
     try:
@@ -20,6 +43,7 @@ def ExtractPrompts(input_file_string, output_file_string):
 
         # Remove empty lines and strip extra surrounding whitespace
         cleaned = "\n".join(line for line in extracted.splitlines() if line.strip())
+        cleaned = EscapeStrayMarkup(cleaned)
 
         with open(output_file_string, 'w', encoding='utf-8') as outfile:
             outfile.write(cleaned.strip() + '\n')
@@ -28,3 +52,116 @@ def ExtractPrompts(input_file_string, output_file_string):
 
     except Exception:
         return False
+
+def SentenceFromElement(sentence_elem):
+    """
+    Turns a <sentence_N> element into a SentencePrompt record (missing prompts
+    are empty strings). Returns None if the tag is not a valid sentence tag.
+    """
+    tag = sentence_elem.tag
+    if not tag.startswith("sentence_"):
+        return None
+    try:
+        number = int(tag.split("_", 1)[1])
+    except (IndexError, ValueError):
+        print(f"Skipping element with invalid tag: {tag}")
+        return None
+
+    def text(name):
+        elem = sentence_elem.find(name)
+        return elem.text.strip() if elem is not None and elem.text else ""
+
+    return SentencePrompt(
+        number=number,
+        image_prompt=text("image_generator_prompt"),
+        video_prompt=text("image_to_video_prompt"),
+        negative_prompt=text("image_to_video_negative_prompt"),
+    )
+
+def LoadSentencePrompts(prompts_file: str) -> list:
+    """
+    Parses prompts.txt once into a list of SentencePrompt records, ordered by
+    sentence number.
+    """
+    root = ET.parse(prompts_file).getroot()
+    sentences = [SentenceFromElement(elem) for elem in root]
+    return sorted((s for s in sentences if s is not None), key=lambda s: s.number)
+
+def _split_partial(text: str, tag: str):
+    # Holds back a trailing fragment that could be the start of `tag`
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return text[:-size], text[-size:]
+    return text, ""
+
+class SentenceStreamParser:
+    """
+    Incremental parser over the LLM token stream. feed() returns the sentences
+    whose closing </sentence_N> tag has arrived, as SentencePrompt records,
+    so downstream stages can start while the model is still writing.
+
+    <think>...</think> reasoning is skipped (it often quotes the XML format),
+    and code fences around the <visuals> block are ignored because only
+    complete sentence blocks are extracted. Blocks without any prompt tag
+    (e.g. an echoed input sentence) are skipped too. Stray "&" and "<" are
+    escaped; a block that still does not parse is returned as a record
+    without prompts, so validation re-requests that sentence.
+    """
+
+    THINK_OPEN = "<think>"
+    THINK_CLOSE = "</think>"
+    SENTENCE = re.compile(r"<sentence_(\d+)>.*?</sentence_\1>", re.DOTALL)
+
+    def __init__(self):
+        self._pending = ""  # raw text not yet classified as think / content
+        self._content = ""  # content text not yet part of a complete sentence
+        self._in_think = False
+        self.blocks = []
+
+    def feed(self, text: str) -> list:
+        self._pending += text
+        while self._pending:
+            if self._in_think:
+                end = self._pending.find(self.THINK_CLOSE)
+                if end == -1:
+                    _, self._pending = _split_partial(self._pending, self.THINK_CLOSE)
+                    break
+                self._pending = self._pending[end + len(self.THINK_CLOSE):]
+                self._in_think = False
+            else:
+                start = self._pending.find(self.THINK_OPEN)
+                if start == -1:
+                    ready, self._pending = _split_partial(self._pending, self.THINK_OPEN)
+                    self._content += ready
+                    break
+                self._content += self._pending[:start]
+                self._pending = self._pending[start + len(self.THINK_OPEN):]
+                self._in_think = True
+
+        sentences = []
+        while True:
+            match = self.SENTENCE.search(self._content)
+            if match is None:
+                break
+            self._content = self._content[match.end():]
+            block = "\n".join(line.strip() for line in match.group(0).splitlines() if line.strip())
+            if not any(f"<{tag}>" in block for tag in FIELD_TAGS.values()):
+                continue
+            block = EscapeStrayMarkup(block)
+            try:
+                sentence = SentenceFromElement(ET.fromstring(block))
+            except ET.ParseError as e:
+                print(f"⚠️ Malformed <sentence_{match.group(1)}> block ({e}), passing it on "
+                      f"without prompts")
+                sentences.append(SentencePrompt(number=int(match.group(1))))
+                continue
+            if sentence is not None:
+                self.blocks.append(block)
+                sentences.append(sentence)
+        return sentences
+
+    def visuals_xml(self) -> str:
+        """
+        The sentences parsed so far as a prompts.txt-style <visuals> document.
+        """
+        return "<visuals>\n" + "".join(block + "\n" for block in self.blocks) + "</visuals>\n"
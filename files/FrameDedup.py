@@ -0,0 +1,94 @@
+from PIL import Image, ImageChops, ImageStat
+
+# Width of the grayscale thumbnail used to compare frames
+SIGNATURE_WIDTH = 64
+
+class FrameDeduplicator:
+    """
+    Wraps an upscaler (anything with upscale_batch) and skips Real-ESRGAN for
+    frames that are nearly identical to a frame it has already enhanced.
+
+    Every frame is reduced to a small grayscale thumbnail. If its mean absolute
+    difference to one of the last `history` enhanced frames is at most
+    `threshold` (0-255 scale) and no thumbnail pixel differs by more than
+    `max_pixel_diff`, the earlier enhanced output is reused as-is. Frames are
+    always compared against the frame that was actually enhanced, so slow drift
+    accumulates until it crosses the threshold and triggers a fresh upscale.
+
+    Each remembered output is a full enhanced frame, so memory grows by one
+    output frame per unit of history.
+    """
+
+    def __init__(self, upscaler, threshold=1.5, max_pixel_diff=24, history=2):
+        self.upscaler = upscaler
+        self.scale = upscaler.scale
+        self.threshold = threshold
+        self.max_pixel_diff = max_pixel_diff
+        self.history = history
+        self._references = []  # (signature, enhanced frame), newest last
+        self.hits = 0
+        self.misses = 0
+
+    def _signature(self, frame, width, height):
+        img = Image.frombuffer("RGB", (width, height), frame, "raw", "RGB", 0, 1)
+        thumb_height = max(1, round(height * SIGNATURE_WIDTH / width))
+        return img.convert("L").resize((SIGNATURE_WIDTH, thumb_height), Image.BILINEAR)
+
+    def _matches(self, signature, reference) -> bool:
+        diff = ImageChops.difference(signature, reference)
+        stat = ImageStat.Stat(diff)
+        return stat.mean[0] <= self.threshold and stat.extrema[0][1] <= self.max_pixel_diff
+
+    def _remember(self, signature, slot):
+        self._references.append((signature, slot))
+        if len(self._references) > self.history:
+            self._references.pop(0)
+
+    def upscale_batch(self, frames, width: int, height: int) -> list:
+        frames = list(frames)
+        outputs = [None] * len(frames)
+        # Each slot is a one-item list so reused frames can point at an output
+        # that is only produced once the batch's misses have been upscaled
+        slots = []
+        misses = []
+
+        for frame in frames:
+            signature = self._signature(frame, width, height)
+            slot = None
+            for reference, reference_slot in reversed(self._references):
+                if self._matches(signature, reference):
+                    slot = reference_slot
+                    break
+
+            if slot is None:
+                slot = [None]
+                misses.append((frame, slot))
+                self._remember(signature, slot)
+                self.misses += 1
+            else:
+                self.hits += 1
+            slots.append(slot)
+
+        if misses:
+            enhanced = self.upscaler.upscale_batch([f for f, _ in misses], width, height)
+            for (_, slot), output in zip(misses, enhanced):
+                slot[0] = output
+
+        for i, slot in enumerate(slots):
+            outputs[i] = slot[0]
+        return outputs
+
+    def upscale(self, frame, width: int, height: int) -> bytes:
+        return self.upscale_batch([frame], width, height)[0]
+
+    def output_size(self, width: int, height: int) -> tuple:
+        return self.upscaler.output_size(width, height)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self) -> str:
+        return (f"♻️  Reused {self.hits}/{self.hits + self.misses} frames "
+                f"({self.hit_rate:.0%} hit rate)")
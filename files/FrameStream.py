@@ -0,0 +1,231 @@
+import json
+import queue
+import subprocess
+import threading
+from dataclasses import dataclass
+from fractions import Fraction
+
+# Raw frames travel between ffmpeg and Python as packed 8-bit RGB
+PIX_FMT = "rgb24"
+CHANNELS = 3
+
+@dataclass(frozen=True)
+class EncodeProfile:
+    """
+    Encoder settings of one kind of output. preset and crf trade encode time
+    against size (crf 0 is lossless); threads=0 lets x264 decide. The codec
+    profile and the track timescale are pinned, so clips of the same size and
+    frame rate stay stream-compatible and can be concatenated without
+    re-encoding.
+    """
+    preset: str = "medium"
+    crf: int = 23
+    threads: int = 0
+    codec: str = "libx264"
+    pix_fmt: str = "yuv420p"
+    profile: str = "high"
+
+    def args(self) -> list:
+        args = ["-c:v", self.codec, "-pix_fmt", self.pix_fmt]
+        if self.profile:
+            args += ["-profile:v", self.profile]
+        return args + [
+            "-preset", self.preset, "-crf", str(self.crf), "-threads", str(self.threads),
+            "-video_track_timescale", "90000",
+        ]
+
+# Deliverable clips and videos
+FINAL_PROFILE = EncodeProfile()
+
+# Files handed from one local stage to the next: lossless RGB, fast to write
+INTERMEDIATE_PROFILE = EncodeProfile(preset="ultrafast", crf=0, codec="libx264rgb",
+                                     pix_fmt="rgb24", profile="")
+
+# Marks the end of a frame stream inside the pipeline queues
+_END = object()
+
+@dataclass
+class VideoInfo:
+    width: int
+    height: int
+    fps: Fraction
+
+    @property
+    def frame_size(self) -> int:
+        return self.width * self.height * CHANNELS
+
+def ProbeVideo(input_video_path: str) -> VideoInfo:
+    """
+    Reads width, height and frame rate of the first video stream with ffprobe.
+    """
+    output = subprocess.check_output([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate",
+        "-of", "json", input_video_path
+    ])
+    stream = json.loads(output)["streams"][0]
+    return VideoInfo(
+        width=int(stream["width"]),
+        height=int(stream["height"]),
+        fps=Fraction(stream["r_frame_rate"]),
+    )
+
+def DecodeFrames(input_video_path: str, info: VideoInfo):
+    """
+    Decodes a video with ffmpeg and yields every frame as raw RGB bytes
+    read straight from the decoder's stdout. Nothing touches the disk.
+    """
+    proc = subprocess.Popen([
+        "ffmpeg", "-v", "error", "-i", input_video_path,
+        "-f", "rawvideo", "-pix_fmt", PIX_FMT, "-"
+    ], stdout=subprocess.PIPE)
+
+    try:
+        while True:
+            frame = proc.stdout.read(info.frame_size)
+            if len(frame) < info.frame_size:
+                break
+            yield frame
+    except BaseException:
+        # Closed early (GeneratorExit) or failed: the rest is not wanted
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+        raise
+
+    # EOF: ffmpeg may still be exiting after closing its stdout, so wait
+    # for it rather than killing it
+    proc.stdout.close()
+    returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, "ffmpeg (decode)")
+
+class FrameEncoder:
+    """
+    Feeds raw RGB frames into an ffmpeg encoder through its stdin.
+    """
+
+    def __init__(self, output_video_path: str, width: int, height: int, fps: Fraction,
+                 profile: EncodeProfile = FINAL_PROFILE):
+        self.proc = subprocess.Popen([
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", PIX_FMT,
+            "-s", f"{width}x{height}", "-framerate", str(fps),
+            "-i", "-",
+            *profile.args(),
+            output_video_path
+        ], stdin=subprocess.PIPE)
+
+    def write(self, frame: bytes):
+        self.proc.stdin.write(frame)
+
+    def close(self):
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "ffmpeg (encode)")
+
+    def abort(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocks like q.put() but gives up once another stage has failed
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+def _batches(frames, batch_size: int):
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def RunFramePipeline(frames, process, write, queue_size: int = 8, batch_size: int = 1) -> int:
+    """
+    Runs decode -> process -> write as three concurrent stages joined by
+    bounded queues. At most 2 * queue_size batches are held in memory at any
+    time, however long the clip is.
+
+    frames:  iterable of input frames (consumed on a reader thread)
+    process: called on the current thread with a list of up to batch_size
+             frames, returns the list of output frames
+    write:   called on a writer thread for every output frame
+
+    Returns the number of frames written. The first error from any stage is re-raised.
+    """
+    in_q = queue.Queue(maxsize=queue_size)
+    out_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            for batch in _batches(frames, batch_size):
+                if not _put(in_q, batch, stop):
+                    break
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if hasattr(frames, "close"):
+                frames.close()
+            _put(in_q, _END, stop)
+
+    written = 0
+
+    def writer():
+        nonlocal written
+        try:
+            while True:
+                batch = _get(out_q, stop)
+                if batch is _END:
+                    break
+                for frame in batch:
+                    write(frame)
+                    written += 1
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    reader_thread = threading.Thread(target=reader, name="frame-reader", daemon=True)
+    writer_thread = threading.Thread(target=writer, name="frame-writer", daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+
+    try:
+        while True:
+            batch = _get(in_q, stop)
+            if batch is _END:
+                break
+            if not _put(out_q, process(batch), stop):
+                break
+        _put(out_q, _END, stop)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        writer_thread.join()
+        stop.set()
+        reader_thread.join()
+
+    if errors:
+        raise errors[0]
+    return written
@@ -1,180 +1,191 @@
 import os
-import shutil
 import subprocess
-import time
-import requests
 import random
 
-from stem import Signal
-from stem.control import Controller
-from gradio_client import Client, handle_file
 import xml.etree.ElementTree as ET
 
-# where Gradio dumps its temp images
-TMP_DIR = os.path.join(os.path.sep, "tmp", "gradio")
+from files.ArtifactCache import DeterministicSeed
+from files.Backends import IMAGE_ROUTER
+from files.GradioClients import SubmitMany, SaveResultFile
+from files.RunManifest import InputHash
+from files.ExtractPrompts import LoadSentencePrompts
+from files.Metrics import METRICS
+from files.RetryPolicy import RETRY_POLICY, CanRetryLater
+from files.ValidateOutputs import ValidateImage, ExpectedSize, IsValid
 
-# how long to wait after NEWNYM for Tor circuit to rebuild
-TOR_REBUILD_WAIT = 5
+def image_cache_key(cache, user_prompt: str, seed):
+    return cache.key("image", model=IMAGE_ROUTER.model, prompt=user_prompt, seed=seed,
+                     **IMAGE_ROUTER.params)
 
-def change_ip():
+def cached_image_ok(output_image: str) -> bool:
+    # Images cached before validation existed may be bad; those are regenerated
+    return IsValid(ValidateImage, output_image, ExpectedSize(IMAGE_ROUTER.params))
+
+def SaveImageResult(result, output_image: str) -> str:
     """
-    Signal Tor for a new circuit (NEWNYM) and wait a bit.
+    Moves the image returned by an image backend job to output_image and
+    validates it (decodable, about the requested size, not blank); a bad
+    image is deleted and raises the retryable ArtifactError.
+    Only the job's own result is used, so concurrent jobs never pick up each
+    other's files. Returns the destination path.
     """
-    pw = "this_is_my_password"
-    if not pw:
-        print("⚠️ TOR_CONTROL_PASSWORD not set — cannot change IP")
-        return
-
-    print("🔄 Requesting new Tor identity…")
-    try:
-        with Controller.from_port(port=9051) as ctrl:
-            ctrl.authenticate(password=pw)
-            ctrl.signal(Signal.NEWNYM)
-        # give Tor clients time to rebuild circuits
-        time.sleep(TOR_REBUILD_WAIT)
-        print("✅ Tor should have a new circuit now.")
-    except Exception as e:
-        print(f"❌ Failed to signal Tor NEWNYM: {e}")
+    dest = SaveResultFile(result, "image", output_image)
+    ValidateImage(dest, ExpectedSize(IMAGE_ROUTER.params), discard=True)
+    print(f"✅ Image saved to: {dest}")
+    return dest
 
-def tor_ip_ok():
+def GenerateImage(user_prompt: str, output_image: str, cache=None, deterministic_seed=False):
     """
-    Returns True if we can fetch our IP over Tor.
+    Generates an image for user_prompt on one of IMAGE_ROUTER's backends (the
+    Hyper-FLUX Space by default) and saves it to output_image.
+    Failures are retried under the shared RetryPolicy; RetryBudgetExceeded,
+    CircuitOpenError or a permanent error is raised when it gives up.
+    With deterministic_seed the seed is derived from the prompt instead of drawn at random.
+    If an ArtifactCache is given, an image with the same prompt and parameters is
+    served from the cache, and newly generated images are stored in it.
     """
-    try:
-        ip = requests.get("https://api.ipify.org", timeout=10).text
-        print(f"🌐 Current exit-node IP: {ip}")
-        return True
-    except Exception as e:
-        print(f"❌ Tor connection test failed: {e}")
-        return False
+    seed = DeterministicSeed(user_prompt) if deterministic_seed else None
 
-import os
-import shutil
-
-def delete_gradio_tmp():
-    target_dir = "/tmp/gradio"
-    for filename in os.listdir(target_dir):
-        file_path = os.path.join(target_dir, filename)
-        if os.path.isfile(file_path) or os.path.islink(file_path):
-            os.unlink(file_path)
-        elif os.path.isdir(file_path):
-            shutil.rmtree(file_path)
-
-def GenerateImage(user_prompt: str, output_image: str):
-    SPACE_URL = "https://bytedance-hyper-flux-8steps-lora.hf.space"
-
-    while True:
-        # 1) ensure Tor is running & our proxy env vars are set
-        os.environ["HTTP_PROXY"]  = "socks5h://127.0.0.1:9050"
-        os.environ["HTTPS_PROXY"] = "socks5h://127.0.0.1:9050"
-        os.environ["ALL_PROXY"]   = "socks5h://127.0.0.1:9050"
-
-        if not tor_ip_ok():
-            change_ip()
-            continue
+    cache_key = None
+    if cache is not None:
+        cache_key = image_cache_key(cache, user_prompt, seed)
+        if cache.get(cache_key, output_image) and cached_image_ok(output_image):
+            print(f"♻️  Image served from cache: {output_image}")
+            return
 
-        # record existing gradio subdirs
-        try:
-            before = set(os.listdir(TMP_DIR))
-        except FileNotFoundError:
-            before = set()
-
-        try:
-            print("🚀 Initializing Gradio client…")
-            client = Client(SPACE_URL)
-
-            seed = random.randint(1000, 9999)
-            print(f"🎬 Submitting job (seed={seed})…")
-            job = client.submit(
-                height=1152,
-                width=648,
-                steps=8,
-                scales=3.5,
-                prompt=user_prompt,
-                seed=seed,
-                api_name="/process_image"
-            )
+    def attempt(timeout):
+        job_seed = seed if seed is not None else random.randint(1000, 9999)
+        print(f"🎬 Submitting job (seed={job_seed})…")
+        with METRICS.span("remote_inference", api="image"):
+            job = IMAGE_ROUTER.submit(user_prompt, job_seed)
 
             print("⏳ Waiting for image to finish…")
-            result = job.result(timeout=300)
+            result = job.result(timeout=timeout)
 
-            # figure out where the image really lives
-            source_path = None
-            first = result[0]
+        dest = SaveImageResult(result, output_image)
+        if cache is not None:
+            cache.put(cache_key, dest)
 
-            # Case A: dict token → download it
-            if isinstance(first, dict) and "image" in first:
-                token = first["image"]
-                print("📥 Downloading image token via handle_file…")
-                tmp = handle_file(token)
-                source_path = tmp.name
+    def on_retry(error, attempt):
+        # The router resets (new client and Tor circuit) and health-checks a backend
+        # that failed a job or a health check before reusing it
+        METRICS.count("retries")
 
-            # Case B: direct file path string that exists
-            elif isinstance(first, str) and first.lower().endswith(".png") and os.path.isfile(first):
-                print(f"📂 Gradio gave us a file: {first}")
-                source_path = first
+    RETRY_POLICY.run(attempt, os.path.basename(output_image), on_retry=on_retry)
 
-            # Case C: fallback → scan /tmp/gradio for brand-new subdir
-            else:
-                print("🔍 Falling back to scan /tmp/gradio for new image…")
-                time.sleep(1)  # let it flush
-                try:
-                    after = set(os.listdir(TMP_DIR))
-                except FileNotFoundError:
-                    after = set()
-                new = sorted(after - before,
-                             key=lambda d: os.path.getmtime(os.path.join(TMP_DIR, d)),
-                             reverse=True)
-                if not new:
-                    raise RuntimeError(f"No new folder under {TMP_DIR}")
-                newest = new[0]
-                candidate = os.path.join(TMP_DIR, newest, "image.png")
-                if not os.path.isfile(candidate):
-                    raise FileNotFoundError(f"Expected image at {candidate}")
-                print(f"📂 Found {candidate}")
-                source_path = candidate
-
-            # sanity check
-            if not source_path or not os.path.isfile(source_path):
-                raise RuntimeError(f"Could not locate generated image (tried {source_path})")
-
-            # copy into cwd, creating directories if needed
-            dest = os.path.join(os.getcwd(), output_image)
-            dest_dir = os.path.dirname(dest)
-            if dest_dir and not os.path.exists(dest_dir):
-                os.makedirs(dest_dir, exist_ok=True)
-
-            shutil.copy(source_path, dest)
-            print(f"✅ Image saved to: {dest}")
-            # Clear out the directory
-            delete_gradio_tmp()
-            break  # done!
+def SubmitImageJobs(items: list, max_in_flight: int = 4, cache=None,
+                    deterministic_seed=False) -> dict:
+    """
+    Generates many images concurrently, spread over IMAGE_ROUTER's backends.
+    items is a list of (user_prompt, output_image) pairs; at most max_in_flight
+    image jobs run at once and results are saved as they complete.
+    Jobs that fail with a retryable error, or find every circuit open, are retried
+    one by one with GenerateImage.
+
+    Returns {output_image: error message or None}.
+    """
+    outcomes = {}
+    jobs = []
+    submitted = []
+    for user_prompt, output_image in items:
+        seed = DeterministicSeed(user_prompt) if deterministic_seed else random.randint(1000, 9999)
+        if cache is not None:
+            key = image_cache_key(cache, user_prompt, seed if deterministic_seed else None)
+            if cache.get(key, output_image) and cached_image_ok(output_image):
+                print(f"♻️  Image served from cache: {output_image}")
+                outcomes[output_image] = None
+                continue
+        jobs.append(dict(prompt=user_prompt, seed=seed))
+        submitted.append((user_prompt, output_image))
+
+    if jobs:
+        print(f"🎬 Submitting {len(jobs)} image jobs ({max_in_flight} in flight)…")
+
+    failed = []
+    tags = [{"output": output_image} for _, output_image in submitted]
+    for index, result, error in SubmitMany(IMAGE_ROUTER.submit, jobs, max_in_flight,
+                                           RETRY_POLICY.job_timeout, tags, "image"):
+        user_prompt, output_image = submitted[index]
+        if error is None:
+            try:
+                dest = SaveImageResult(result, output_image)
+                if cache is not None:
+                    cache.put(image_cache_key(cache, user_prompt,
+                                              jobs[index]["seed"] if deterministic_seed else None), dest)
+                outcomes[output_image] = None
+                continue
+            except Exception as e:
+                error = e
+        print(f"❌ {output_image}: {error}")
+        if not CanRetryLater(error):
+            outcomes[output_image] = str(error)
+            continue
+        failed.append((user_prompt, output_image))
 
+    # Retry failures through the resilient one-at-a-time path
+    for user_prompt, output_image in failed:
+        try:
+            GenerateImage(user_prompt, output_image, cache, deterministic_seed)
+            outcomes[output_image] = None
         except Exception as e:
-            print(f"❌ Generation/saving error: {e}")
-            # try a fresh IP next iteration
-            change_ip()
+            outcomes[output_image] = str(e)
 
-# Declare the loop for generating all the images
+    return outcomes
 
-def ImageGen(prompts_file: str, output_image_folder: str) -> bool:
+def ImageGenSentence(sentence_number: int, user_prompt: str, output_image_folder: str,
+                     cache=None, deterministic_seed=False, manifest=None) -> bool:
     """
-    Reads an XML-like prompts file, extracts each <image_generator_prompt> under
-    <sentence_{n}> elements, and generates an image for each sentence by calling
-    GenerateImage(user_prompt, output_image). Images are saved in output_image_folder
-    as image_<sentence_number>.png.
+    Generates image_<sentence_number>.png for one sentence, unless the RunManifest
+    says it is already done for the same prompt.
 
-    Returns True if all images were generated successfully, False otherwise.
+    Returns True if the image is available, False if generation failed.
     """
+    # Construct the output image path, e.g. "/path/to/output/image_1.png"
+    output_filename = f"image_{sentence_number}.png"
+    output_path = os.path.join(output_image_folder, output_filename)
+
+    input_hash = InputHash(prompt=user_prompt, deterministic_seed=deterministic_seed)
+    if manifest is not None and manifest.is_done("image", sentence_number, input_hash, output_path):
+        print(f"⏭️  {output_filename} is up to date, skipping.")
+        return True
+
     try:
-        # Parse the prompts XML file
-        tree = ET.parse(prompts_file)
-        root = tree.getroot()
-    except (ET.ParseError, FileNotFoundError, OSError) as e:
-        # Failed to read/parse the file
-        print(f"Error reading prompts file: {e}")
+        # Call the existing void function to generate and save the image
+        with METRICS.span("sentence", stage="image", sentence=sentence_number):
+            GenerateImage(user_prompt, output_path, cache, deterministic_seed)
+        if manifest is not None:
+            manifest.mark_done("image", sentence_number, input_hash, output_path)
+        return True
+    except Exception as e:
+        print(f"Error generating image for sentence_{sentence_number}: {e}")
+        if manifest is not None:
+            manifest.mark_failed("image", sentence_number, input_hash, str(e))
         return False
 
+# Declare the loop for generating all the images
+
+def ImageGen(prompts, output_image_folder: str, cache=None,
+             deterministic_seed=False, manifest=None, max_in_flight=1) -> bool:
+    """
+    Generates an image for each sentence's image prompt by calling
+    GenerateImage(user_prompt, output_image). prompts is a list of SentencePrompt
+    records, or the path of a prompts file which is parsed once into records.
+    Images are saved in output_image_folder as image_<sentence_number>.png.
+    cache and deterministic_seed are passed on to GenerateImage. With a
+    RunManifest, sentences whose image is already done for the same prompt are
+    skipped. max_in_flight > 1 submits that many jobs at once through SubmitImageJobs.
+
+    Returns True if all images were generated successfully, False otherwise.
+    """
+    if isinstance(prompts, str):
+        try:
+            # Parse the prompts XML file
+            prompts = LoadSentencePrompts(prompts)
+        except (ET.ParseError, FileNotFoundError, OSError) as e:
+            # Failed to read/parse the file
+            print(f"Error reading prompts file: {e}")
+            return False
+
     # Ensure the output directory exists
     try:
         os.makedirs(output_image_folder, exist_ok=True)
@@ -182,38 +193,52 @@ def ImageGen(prompts_file: str, output_image_folder: str) -> bool:
         print(f"Error creating output directory: {e}")
         return False
 
-    # Iterate over each sentence element
-    for sentence_elem in root:
-        tag = sentence_elem.tag  # e.g. "sentence_1", "sentence_2", etc.
-        if not tag.startswith("sentence_"):
-            # Skip any unexpected tags
-            continue
-
-        # Extract the sentence number
-        try:
-            sentence_number = int(tag.split("_", 1)[1])
-        except (IndexError, ValueError):
-            print(f"Skipping element with invalid tag: {tag}")
-            continue
+    # Sentences collected for concurrent submission (max_in_flight > 1)
+    pending = []
 
-        # Find the image generator prompt
-        prompt_elem = sentence_elem.find("image_generator_prompt")
-        if prompt_elem is None or not prompt_elem.text:
-            print(f"No <image_generator_prompt> found for {tag}, skipping.")
+    for record in prompts:
+        if not record.image_prompt:
+            print(f"No <image_generator_prompt> found for sentence_{record.number}, skipping.")
             continue
 
-        user_prompt = prompt_elem.text.strip()
-        # Construct the output image path, e.g. "/path/to/output/image_1.png"
-        output_filename = f"image_{sentence_number}.png"
-        output_path = os.path.join(output_image_folder, output_filename)
-
-        try:
-            # Call the existing void function to generate and save the image
-            GenerateImage(user_prompt, output_path)
-        except Exception as e:
-            # If any error occurs during image generation, abort
-            print(f"Error generating image for {tag}: {e}")
+        if max_in_flight > 1:
+            pending.append((record.number, record.image_prompt))
+        elif not ImageGenSentence(record.number, record.image_prompt, output_image_folder,
+                                  cache, deterministic_seed, manifest):
             return False
 
+    if pending:
+        return _image_gen_concurrent(pending, output_image_folder, cache,
+                                     deterministic_seed, manifest, max_in_flight)
+
     # If we reach here, all prompts have been processed successfully
     return True
+
+def _image_gen_concurrent(pending, output_image_folder, cache, deterministic_seed,
+                          manifest, max_in_flight) -> bool:
+    items = []
+    hashes = {}
+    for sentence_number, user_prompt in pending:
+        output_path = os.path.join(output_image_folder, f"image_{sentence_number}.png")
+        input_hash = InputHash(prompt=user_prompt, deterministic_seed=deterministic_seed)
+        if manifest is not None and manifest.is_done("image", sentence_number, input_hash, output_path):
+            print(f"⏭️  {os.path.basename(output_path)} is up to date, skipping.")
+            continue
+        hashes[output_path] = (sentence_number, input_hash)
+        items.append((user_prompt, output_path))
+
+    with METRICS.span("batch", stage="image", jobs=len(items)):
+        outcomes = SubmitImageJobs(items, max_in_flight, cache, deterministic_seed)
+
+    ok = True
+    for output_path, error in outcomes.items():
+        sentence_number, input_hash = hashes[output_path]
+        if error is not None:
+            ok = False
+            print(f"Error generating image for sentence_{sentence_number}: {error}")
+        if manifest is not None:
+            if error is None:
+                manifest.mark_done("image", sentence_number, input_hash, output_path)
+            else:
+                manifest.mark_failed("image", sentence_number, input_hash, error)
+    return ok
@@ -1,6 +1,15 @@
 from huggingface_hub import InferenceClient
 import traceback
+import threading
+import queue
+import time
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+
+from files.ExtractPrompts import SentenceStreamParser
+from files.PromptRecords import SplitScriptSentences, WritePromptRecords
+from files.Metrics import METRICS
 
 # Constant system prompt (single line with correct double-quote syntax)
 system_prompt = r"""
@@ -129,33 +138,94 @@ Finally:
 6. FOLLOW ALL THE ABOVE RULES (1 TO 5) STRICTLY. THESE ARE VERY IMPORTANT.
 """
 
-def GeneratePrompts(huggingface_api_key: str, user_prompt_input: str, temp_file: str) -> bool:
+# Model used for every prompt generation request
+MODEL = "Qwen/Qwen3-235B-A22B"
+
+def NumberedScript(sentences: list, numbers: list = None) -> str:
     """
-    Function to send user input to the AI and stream the response to temp.txt.
-    Returns True if successful, False otherwise.
+    The user message for a list of script sentences: each one in its own
+    <sentence_N> block, numbered by its place in the script (or by numbers),
+    so replies map back to sentences by number however the model would have
+    split the text itself.
     """
-    client = InferenceClient(
+    numbers = numbers or range(1, len(sentences) + 1)
+    blocks = "\n".join(f"<sentence_{number}>{escape(sentence)}</sentence_{number}>"
+                       for number, sentence in zip(numbers, sentences))
+    return ("Video script, one sentence per block. Use these sentence numbers "
+            "for the prompts:\n" + blocks)
+
+def _has_prompts(record) -> bool:
+    # A block the parser could not read comes back as a record without prompts
+    return bool(record.image_prompt or record.video_prompt or record.negative_prompt)
+
+def MakeClient(huggingface_api_key: str, base_url: str = None) -> InferenceClient:
+    """
+    Client for prompt generation. base_url points it at any OpenAI-compatible
+    server instead of the provider (e.g. a local stand-in for testing).
+    """
+    if base_url:
+        return InferenceClient(base_url=base_url, api_key=huggingface_api_key)
+    return InferenceClient(
         provider="novita",
         api_key=huggingface_api_key,
     )
 
+def StreamCompletion(client, user_prompt_input: str, max_tokens: int = 16000):
+    """
+    Yields the content pieces of a streamed chat completion for the script input.
+    Records an "llm_stream" span, the time to the first token and the bytes received.
+    """
+    start = time.time()
+    started = time.monotonic()
+    received = 0
+    ok = False
+    try:
+        for chunk in client.chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},  # <-- ensure this variable exists
+                {"role": "user", "content": user_prompt_input}
+            ],
+            max_tokens=max_tokens,
+            stream=True
+        ):
+            if chunk.choices and chunk.choices[0].delta.get("content"):
+                content = chunk.choices[0].delta["content"]
+                if not received:
+                    METRICS.record_span("llm_first_token", start, time.monotonic() - started,
+                                        stage="prompts")
+                received += len(content.encode("utf-8"))
+                yield content
+        ok = True
+    finally:
+        # Runs on early close too (e.g. RegenerateSentencePrompt stops at the first sentence)
+        METRICS.record_span("llm_stream", start, time.monotonic() - started, ok, stage="prompts")
+        METRICS.count("llm_bytes_received", received, stage="prompts")
+
+def GeneratePrompts(huggingface_api_key: str, user_prompt_input: str, temp_file: str,
+                    on_sentence=None, base_url: str = None) -> bool:
+    """
+    Function to send user input to the AI and stream the response to temp.txt.
+    The script is sent as NumberedScript, so sentence_N is the Nth sentence of
+    SplitScriptSentences. The file is written through a normal buffer (no
+    flush per token).
+    If on_sentence is given, it is called with each parsed SentencePrompt as soon
+    as the model closes its </sentence_N> tag.
+    Returns True if successful, False otherwise.
+    """
+    client = MakeClient(huggingface_api_key, base_url)
+    parser = SentenceStreamParser() if on_sentence is not None else None
+
     try:
         temp_file_path = os.path.join(temp_file)
 
         with open(temp_file_path, "w", encoding="utf-8") as f:
-            for chunk in client.chat.completions.create(
-                model="Qwen/Qwen3-235B-A22B",
-                messages=[
-                    {"role": "system", "content": system_prompt},  # <-- ensure this variable exists
-                    {"role": "user", "content": user_prompt_input}
-                ],
-                max_tokens=16000,
-                stream=True
-            ):
-                if chunk.choices and chunk.choices[0].delta.get("content"):
-                    content_piece = chunk.choices[0].delta["content"]
-                    f.write(content_piece)
-                    f.flush()
+            script = NumberedScript(SplitScriptSentences(user_prompt_input))
+            for content_piece in StreamCompletion(client, script):
+                f.write(content_piece)
+                if parser is not None:
+                    for sentence in parser.feed(content_piece):
+                        on_sentence(sentence)
 
         return True
 
@@ -163,3 +233,181 @@ def GeneratePrompts(huggingface_api_key: str, user_prompt_input: str, temp_file:
         print("An error occurred in GeneratePrompts:")
         traceback.print_exc()
         return False
+
+def _generate_chunk(client, sentences: list, numbers: list) -> dict:
+    # One streaming request for a batch of script sentences, sent under their
+    # global numbers. Returns {number: record} for the sentences the reply
+    # covers; blocks for numbers that were not asked for are dropped.
+    parser = SentenceStreamParser()
+    records = {}
+    for content_piece in StreamCompletion(client, NumberedScript(sentences, numbers)):
+        for record in parser.feed(content_piece):
+            if record.number not in numbers:
+                print(f"⚠️ Ignoring unexpected <sentence_{record.number}> in the reply "
+                      f"for sentence_{numbers[0]}-{numbers[-1]}")
+            elif _has_prompts(record):
+                records[record.number] = record
+    return records
+
+def GeneratePromptsChunked(huggingface_api_key: str, user_prompt_input: str, temp_file: str,
+                           chunk_size: int = 6, max_workers: int = 4, max_attempts: int = 3,
+                           on_sentence=None, base_url: str = None, cache=None) -> bool:
+    """
+    Splits the script into batches of chunk_size sentences and generates their
+    prompts with concurrent streaming requests, so a long script is bound by
+    the slowest chunk rather than one stream's token rate and no single
+    response risks hitting max_tokens. chunk_size=None sends every sentence
+    in one request.
+
+    Every chunk is sent as NumberedScript under the sentences' global
+    numbers, and the replies are merged by those numbers and written to
+    temp_file as a <visuals> document. A chunk whose request fails is sent
+    again; sentences a reply leaves out are sent again on their own, up to
+    max_attempts times each.
+    With a PromptCache, sentences whose text is unchanged reuse their cached
+    prompts and only the others are sent to the model.
+    on_sentence is called once per sentence, with the same record that is
+    cached and written to temp_file: cached sentences first, then each
+    chunk's sentences once its request has completed (a failed request
+    emits nothing).
+    Returns True if every sentence got its prompts.
+    """
+    sentences = SplitScriptSentences(user_prompt_input)
+    if not sentences:
+        print("❌ Script has no sentences.")
+        return False
+
+    def cache_key(number):
+        return cache.key(MODEL, system_prompt, sentences[number - 1], base_url or "")
+
+    records = {}
+    missing = []
+    for number in range(1, len(sentences) + 1):
+        record = cache.get(cache_key(number), number) if cache is not None else None
+        if record is None:
+            missing.append(number)
+        else:
+            records[number] = record
+            if on_sentence is not None:
+                on_sentence(record)
+    if cache is not None:
+        METRICS.count("prompt_cache_hits", len(records), stage="prompts")
+        METRICS.count("prompt_cache_misses", len(missing), stage="prompts")
+        cache.report()
+
+    chunk_size = chunk_size or len(missing) or 1
+    pending = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    if pending:
+        print(f"🧩 Generating prompts for {len(missing)} sentences in {len(pending)} chunks")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending))),
+                            thread_name_prefix="prompt-chunk") as executor:
+        for attempt in range(1, max_attempts + 1):
+            if not pending:
+                break
+            futures = {
+                executor.submit(_generate_chunk, MakeClient(huggingface_api_key, base_url),
+                                [sentences[n - 1] for n in numbers], numbers): numbers
+                for numbers in pending
+            }
+            failed = []
+            for future in as_completed(futures):
+                numbers = futures[future]
+                try:
+                    chunk_records = future.result()
+                except Exception as e:
+                    print(f"⚠️ Chunk at sentence_{numbers[0]} failed (attempt {attempt}): {e}")
+                    METRICS.count("retries", stage="prompts")
+                    failed.append(numbers)
+                    continue
+                left_out = [number for number in numbers if number not in chunk_records]
+                if left_out:
+                    print(f"⚠️ Reply for sentence_{numbers[0]} left out sentences {left_out} "
+                          f"(attempt {attempt})")
+                    METRICS.count("retries", len(left_out), stage="prompts")
+                    failed.extend([number] for number in left_out)
+                for record in (chunk_records[n] for n in numbers if n in chunk_records):
+                    records[record.number] = record
+                    if cache is not None:
+                        cache.put(cache_key(record.number), record)
+                    if on_sentence is not None:
+                        on_sentence(record)
+            pending = failed
+
+    if pending:
+        still_missing = sum(len(numbers) for numbers in pending)
+        print(f"❌ {still_missing} sentence(s) still without prompts after {max_attempts} attempts.")
+        return False
+
+    WritePromptRecords([records[number] for number in sorted(records)], temp_file)
+    return True
+
+def RegenerateSentencePrompt(huggingface_api_key: str, script_sentence: str,
+                             base_url: str = None):
+    """
+    Asks the model again for the prompts of a single script sentence, sent as
+    the only block of a NumberedScript. Returns the new SentencePrompt
+    (numbered 1), or None if the request failed.
+    """
+    client = MakeClient(huggingface_api_key, base_url)
+    parser = SentenceStreamParser()
+    try:
+        for content_piece in StreamCompletion(client, NumberedScript([script_sentence]),
+                                              max_tokens=4000):
+            for sentence in parser.feed(content_piece):
+                if sentence.number == 1 and _has_prompts(sentence):
+                    return sentence
+    except Exception as e:
+        print(f"❌ Re-request failed: {e}")
+    return None
+
+class PromptStream:
+    """
+    Iterable over the sentences of a live GeneratePrompts run. The LLM call runs
+    on a background thread and each sentence is yielded the moment its block is
+    complete, so image generation for sentence 1 can start while the model is
+    still writing later sentences. After iteration, `ok` tells whether the
+    whole response was received.
+
+    With chunk_size or a prompt cache set, the script is generated by
+    GeneratePromptsChunked and sentences arrive from the cache and then a
+    chunk at a time as each request completes, not in number order.
+    """
+
+    _DONE = object()
+
+    def __init__(self, huggingface_api_key: str, user_prompt_input: str, temp_file: str,
+                 chunk_size: int = None, max_workers: int = 4, base_url: str = None,
+                 cache=None):
+        self.ok = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(huggingface_api_key, user_prompt_input, temp_file,
+                  chunk_size, max_workers, base_url, cache),
+            name="prompt-stream",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _run(self, huggingface_api_key, user_prompt_input, temp_file,
+             chunk_size, max_workers, base_url, cache):
+        try:
+            if chunk_size or cache is not None:
+                self.ok = GeneratePromptsChunked(huggingface_api_key, user_prompt_input,
+                                                 temp_file, chunk_size, max_workers,
+                                                 on_sentence=self._queue.put,
+                                                 base_url=base_url, cache=cache)
+            else:
+                self.ok = GeneratePrompts(huggingface_api_key, user_prompt_input, temp_file,
+                                          on_sentence=self._queue.put, base_url=base_url)
+        finally:
+            self._queue.put(self._DONE)
+
+    def __iter__(self):
+        while True:
+            sentence = self._queue.get()
+            if sentence is self._DONE:
+                break
+            yield sentence
+        self._thread.join()
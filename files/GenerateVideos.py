@@ -1,169 +1,221 @@
 #!/usr/bin/env python3
 import os
-import time
-import glob
-import requests
-import shutil
-import random
-
-from stem import Signal
-from stem.control import Controller
-from gradio_client import Client, handle_file
-import xml.etree.ElementTree as ET
-
-# where Gradio dumps its temp videos (on your local root filesystem)
-TMP_DIR = os.path.join(os.path.sep, "tmp", "gradio")
 
-# how long to wait after NEWNYM for Tor circuit to rebuild
-TOR_REBUILD_WAIT = 5
+import xml.etree.ElementTree as ET
 
-def change_ip():
+from files.ArtifactCache import DeterministicSeed, FileDigest
+from files.Backends import VIDEO_ROUTER
+from files.GradioClients import SubmitMany, SaveResultFile
+from files.RunManifest import InputHash
+from files.ExtractPrompts import LoadSentencePrompts
+from files.Metrics import METRICS
+from files.RetryPolicy import RETRY_POLICY, CanRetryLater
+from files.ValidateOutputs import ValidateClip, ExpectedSize, IsValid
+
+def video_cache_key(cache, user_prompt, negative_user_prompt, image_digest, seed):
+    return cache.key("video", model=VIDEO_ROUTER.model, prompt=user_prompt,
+                     negative_prompt=negative_user_prompt, input_image=image_digest,
+                     seed=seed, **VIDEO_ROUTER.params)
+
+def clip_expectations() -> tuple:
+    # (size, duration) a clip from VIDEO_ROUTER should have
+    return ExpectedSize(VIDEO_ROUTER.params), VIDEO_ROUTER.params.get("duration_seconds")
+
+def cached_clip_ok(output_video: str) -> bool:
+    # Clips cached before validation existed may be bad; those are regenerated
+    return IsValid(ValidateClip, output_video, *clip_expectations())
+
+def SaveVideoResult(result, output_video_path: str):
     """
-    Signal Tor for a new circuit (NEWNYM) and wait a bit.
+    Moves the clip returned by a video backend job to output_video_path and
+    probes it (readable, about the requested size, frame count and duration);
+    a bad clip is deleted and raises the retryable ArtifactError.
+    Gradio Spaces return (video, seed); only this job's own result is used, so
+    concurrent jobs never pick up each other's clips.
     """
-    pw = "this_is_my_password"
-    if not pw:
-        print("⚠️ TOR_CONTROL_PASSWORD not set — cannot change IP")
-        return
-
-    print("🔄 Requesting new Tor identity…")
-    try:
-        with Controller.from_port(port=9051) as ctrl:
-            ctrl.authenticate(password=pw)
-            ctrl.signal(Signal.NEWNYM)
-        time.sleep(TOR_REBUILD_WAIT)
-        print("✅ Tor should have a new circuit now.")
-    except Exception as e:
-        print(f"❌ Failed to signal Tor NEWNYM: {e}")
+    SaveResultFile(result, "video", output_video_path)
+    ValidateClip(output_video_path, *clip_expectations(), discard=True)
+    print(f"✅ Video saved to: {output_video_path}")
 
-def tor_ip_ok():
+def SubmitVideoJobs(items: list, max_in_flight: int = 4, cache=None,
+                    deterministic_seed=False) -> dict:
     """
-    Returns True if we can fetch our IP over Tor.
+    Generates many clips concurrently, spread over VIDEO_ROUTER's backends.
+    items is a list of (user_prompt, negative_user_prompt, input_image, output_video)
+    tuples; at most max_in_flight video jobs run at once and each clip
+    is saved from its own job's result as soon as it completes. Jobs that fail
+    with a retryable error, or find every circuit open, are retried one by one
+    with GenerateVideo.
+
+    Returns {output_video: error message or None}.
     """
-    try:
-        resp = requests.get("https://api.ipify.org", timeout=10, 
-                            proxies={
-                              "http":  "socks5h://127.0.0.1:9050",
-                              "https": "socks5h://127.0.0.1:9050"
-                            })
-        ip = resp.text
-        print(f"🌐 Current exit-node IP: {ip}")
-        return True
-    except Exception as e:
-        print(f"❌ Tor connection test failed: {e}")
-        return False
-
-def CopyVideo(output_video_path):
-    TMP_DIR_PATH_MAIN = "/tmp/gradio"
-
-    try:
-        video_files = glob.glob(os.path.join(TMP_DIR_PATH_MAIN, "**", "*.mp4"), recursive=True)
-        if not video_files:
-            return
-
-        video_files.sort(key=os.path.getmtime, reverse=True)
-        latest_video = video_files[0]
-
-        os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
-        shutil.copy2(latest_video, output_video_path)
+    outcomes = {}
+    jobs = []
+    submitted = []
+    for user_prompt, negative_user_prompt, input_image, output_video in items:
+        image_digest = FileDigest(input_image)
+        seed = DeterministicSeed(user_prompt, negative_user_prompt, image_digest) if deterministic_seed else None
+        cache_key = None
+        if cache is not None:
+            cache_key = video_cache_key(cache, user_prompt, negative_user_prompt, image_digest, seed)
+            if cache.get(cache_key, output_video) and cached_clip_ok(output_video):
+                print(f"♻️  Video served from cache: {output_video}")
+                outcomes[output_video] = None
+                continue
+        jobs.append(dict(input_image=input_image, prompt=user_prompt,
+                         negative_prompt=negative_user_prompt, seed=seed))
+        submitted.append((user_prompt, negative_user_prompt, input_image, output_video, cache_key))
+
+    if jobs:
+        print(f"🎬 Submitting {len(jobs)} video jobs ({max_in_flight} in flight)…")
+
+    failed = []
+    tags = [{"output": output_video} for _, _, _, output_video, _ in submitted]
+    for index, result, error in SubmitMany(VIDEO_ROUTER.submit, jobs, max_in_flight,
+                                           RETRY_POLICY.job_timeout, tags, "video"):
+        user_prompt, negative_user_prompt, input_image, output_video, cache_key = submitted[index]
+        if error is None:
+            try:
+                SaveVideoResult(result, output_video)
+                if cache is not None:
+                    cache.put(cache_key, output_video)
+                outcomes[output_video] = None
+                continue
+            except Exception as e:
+                error = e
+        print(f"❌ {output_video}: {error}")
+        if not CanRetryLater(error):
+            outcomes[output_video] = str(error)
+            continue
+        failed.append((user_prompt, negative_user_prompt, input_image, output_video))
 
-        temp_folder = os.path.dirname(latest_video)
-        os.remove(latest_video)
-        shutil.rmtree(temp_folder)
+    # Retry failures through the resilient one-at-a-time path
+    for user_prompt, negative_user_prompt, input_image, output_video in failed:
+        try:
+            GenerateVideo(user_prompt, negative_user_prompt, input_image, output_video,
+                          cache, deterministic_seed)
+            outcomes[output_video] = None if os.path.isfile(output_video) else "no video produced"
+        except Exception as e:
+            outcomes[output_video] = str(e)
 
-        print(f"✅ Video copied to: {output_video_path}")
-    except:
-        pass  # Completely silent on any failure
+    return outcomes
 
-def print_exit_node_country():
+def GenerateVideo(user_prompt: str,
+                  negative_user_prompt: str,
+                  user_input_image: str,
+                  output_video: str,
+                  cache=None,
+                  deterministic_seed=False):
     """
-    Prints the current Tor exit node IP and its country using ipinfo.io.
+    Animates user_input_image on one of VIDEO_ROUTER's backends (the Wan 2.1
+    Space by default) and saves the clip to output_video.
+    With deterministic_seed the seed is derived from the prompts and input image
+    instead of being randomised by the Space. If an ArtifactCache is given, a clip
+    with the same inputs and parameters is served from the cache, and newly
+    generated clips are stored in it. Failures are retried under the shared
+    RetryPolicy; RetryBudgetExceeded, CircuitOpenError or a permanent error is
+    raised when it gives up.
     """
-    try:
-        response = requests.get("https://ipinfo.io/json", timeout=10,
-                                proxies={
-                                    "http": "socks5h://127.0.0.1:9050",
-                                    "https": "socks5h://127.0.0.1:9050"
-                                })
-        data = response.json()
-        ip = data.get("ip", "Unknown")
-        country = data.get("country", "Unknown")
-        print(f"🌐 Current Tor exit node IP: {ip}")
-        print(f"🗺️  Exit node country: {country}")
-    except Exception as e:
-        print(f"❌ Failed to fetch exit node country: {e}")
+    image_digest = FileDigest(user_input_image) if (cache is not None or deterministic_seed) else None
+    seed = DeterministicSeed(user_prompt, negative_user_prompt, image_digest) if deterministic_seed else None
+
+    cache_key = None
+    if cache is not None:
+        cache_key = video_cache_key(cache, user_prompt, negative_user_prompt, image_digest, seed)
+        if cache.get(cache_key, output_video) and cached_clip_ok(output_video):
+            print(f"♻️  Video served from cache: {output_video}")
+            return
 
+    def attempt(timeout):
+        print("🎬 Submitting job…")
+        with METRICS.span("remote_inference", api="video"):
+            job = VIDEO_ROUTER.submit(user_input_image, user_prompt, negative_user_prompt, seed)
 
-def GenerateVideo(user_prompt: str,
-                  negative_user_prompt: str,
-                  user_input_image: str,
-                  output_video: str):
-    SPACE_URL = "https://multimodalart-wan2-1-fast.hf.space"
+            print("⏳ Waiting for video to finish…")
+            result = job.result(timeout=timeout)
 
-    while True:
-        # 1) ensure Tor proxy env vars are set
-        os.environ["HTTP_PROXY"]  = "socks5h://127.0.0.1:9050"
-        os.environ["HTTPS_PROXY"] = "socks5h://127.0.0.1:9050"
-        os.environ["ALL_PROXY"]   = "socks5h://127.0.0.1:9050"
+        SaveVideoResult(result, output_video)
+        if cache is not None:
+            cache.put(cache_key, output_video)
 
-        if not tor_ip_ok():
-            change_ip()
-            continue
+    def on_retry(error, attempt):
+        # The router resets (new client and Tor circuit) and health-checks a backend
+        # that failed a job or a health check before reusing it
+        METRICS.count("retries")
 
-        # record existing gradio temp folders
-        before = set(os.listdir(TMP_DIR)) if os.path.isdir(TMP_DIR) else set()
+    RETRY_POLICY.run(attempt, os.path.basename(output_video), on_retry=on_retry)
 
-        try:
-            print("🚀 Initializing Gradio client…")
-            print_exit_node_country()
-            client = Client(SPACE_URL)
-
-            print("🎬 Submitting job…")
-            job = client.submit(
-                input_image=handle_file(user_input_image),
-                prompt=user_prompt,
-                negative_prompt=negative_user_prompt,
-                height=1152,
-                width=640,
-                duration_seconds=3.4,
-                guidance_scale=1,
-                steps=4,
-                seed=42,
-                randomize_seed=True,
-                api_name="/generate_video"
-            )
+def VideoGenSentence(sentence_number: int, user_prompt: str, negative_user_prompt: str,
+                     input_images_folder: str, output_videos_folder: str,
+                     cache=None, deterministic_seed=False, manifest=None) -> bool:
+    """
+    Generates video_<sentence_number>.mp4 from image_<sentence_number>.png for one
+    sentence, unless the RunManifest says it is already done for the same prompts
+    and input image.
 
-            print("⏳ Waiting for video to finish…")
-            result = job.result(timeout=300)
-            first = result[0]
+    Returns True if the video is available, False if generation failed.
+    """
+    # Construct the input images folder
+    input_image_file_now = f"image_{sentence_number}.png"
+    input_image_file_path = os.path.join(input_images_folder, input_image_file_now)
 
-            CopyVideo(output_video)
-            break  # success!
+    # Construct the output video path, e.g. "/path/to/output/video_1.mp4"
+    output_filename = f"video_{sentence_number}.mp4"
+    output_path = os.path.join(output_videos_folder, output_filename)
 
-        except Exception as e:
-            print(f"❌ Generation/saving error: {e}")
-            print("🔄 Will try again with a fresh Tor circuit…")
-            change_ip()
+    if not os.path.isfile(input_image_file_path):
+        print(f"No input image {input_image_file_path} for sentence_{sentence_number}.")
+        return False
+
+    input_hash = None
+    if manifest is not None:
+        input_hash = InputHash(prompt=user_prompt, negative_prompt=negative_user_prompt,
+                               input_image=FileDigest(input_image_file_path),
+                               deterministic_seed=deterministic_seed)
+        if manifest.is_done("video", sentence_number, input_hash, output_path):
+            print(f"⏭️  {output_filename} is up to date, skipping.")
+            return True
+
+    try:
+        # Call the existing void function to generate and save the video
+        with METRICS.span("sentence", stage="video", sentence=sentence_number):
+            GenerateVideo(user_prompt, negative_user_prompt, input_image_file_path, output_path,
+                          cache, deterministic_seed)
+        if not os.path.isfile(output_path):
+            raise FileNotFoundError(f"Expected video at {output_path}")
+        if manifest is not None:
+            manifest.mark_done("video", sentence_number, input_hash, output_path)
+        return True
+    except Exception as e:
+        print(f"Error generating video for sentence_{sentence_number}: {e}")
+        if manifest is not None:
+            manifest.mark_failed("video", sentence_number, input_hash, str(e))
+        return False
 
 # Declare the function to generate videos in a loop
 
-def VideoGen(prompts_file: str, input_images_folder: str, output_videos_folder: str) -> bool:
+def VideoGen(prompts, input_images_folder: str, output_videos_folder: str,
+             cache=None, deterministic_seed=False, manifest=None, max_in_flight=1) -> bool:
     """
-    Reads an XML-like prompts file, extracts each <image_to_video_prompt> under
-    <sentence_{n}> elements, and generates a video for each sentence by calling
-    GenerateVideo(user_prompt, output_image). Videos are saved in output_videos_folder
-    as video_<sentence_number>.png.
+    Generates a video for each sentence from its image and image-to-video prompts
+    by calling GenerateVideo. prompts is a list of SentencePrompt records, or the
+    path of a prompts file which is parsed once into records. Videos are saved in
+    output_videos_folder as video_<sentence_number>.mp4. cache and
+    deterministic_seed are passed on to GenerateVideo. With a RunManifest,
+    sentences whose video is already done for the same prompts and input image
+    are skipped. max_in_flight > 1 submits that many jobs at once through
+    SubmitVideoJobs.
 
     Returns True if all videos were generated successfully, False otherwise.
     """
-    try:
-        # Parse the prompts XML file
-        tree = ET.parse(prompts_file)
-        root = tree.getroot()
-    except (ET.ParseError, FileNotFoundError, OSError) as e:
-        # Failed to read/parse the file
-        print(f"Error reading prompts file: {e}")
-        return False
+    if isinstance(prompts, str):
+        try:
+            # Parse the prompts XML file
+            prompts = LoadSentencePrompts(prompts)
+        except (ET.ParseError, FileNotFoundError, OSError) as e:
+            # Failed to read/parse the file
+            print(f"Error reading prompts file: {e}")
+            return False
 
     # Ensure the output directory exists
     try:
@@ -172,51 +224,64 @@ def VideoGen(prompts_file: str, input_images_folder: str, output_videos_folder:
         print(f"Error creating output directory: {e}")
         return False
 
-    # Iterate over each sentence element
-    for sentence_elem in root:
-        tag = sentence_elem.tag  # e.g. "sentence_1", "sentence_2", etc.
-        if not tag.startswith("sentence_"):
-            # Skip any unexpected tags
-            continue
-
-        # Extract the sentence number
-        try:
-            sentence_number = int(tag.split("_", 1)[1])
-        except (IndexError, ValueError):
-            print(f"Skipping element with invalid tag: {tag}")
-            continue
+    # Sentences collected for concurrent submission (max_in_flight > 1)
+    pending = []
 
-        # Find the video generator prompt
-        prompt_elem = sentence_elem.find("image_to_video_prompt")
-        if prompt_elem is None or not prompt_elem.text:
-            print(f"No <image_to_video_prompt> found for {tag}, skipping.")
+    for record in prompts:
+        if not record.video_prompt:
+            print(f"No <image_to_video_prompt> found for sentence_{record.number}, skipping.")
             continue
-
-        user_prompt_main = prompt_elem.text.strip()
-
-        # Construct the negative user prompt
-        negative_user_prompt_from_file = sentence_elem.find("image_to_video_negative_prompt")
-        if negative_user_prompt_from_file is None or not negative_user_prompt_from_file.text:
-            print(f"No <image_to_video_negative_prompt> found for {tag}, skipping.")
+        if not record.negative_prompt:
+            print(f"No <image_to_video_negative_prompt> found for sentence_{record.number}, skipping.")
             continue
 
-        user_negative_prompt = negative_user_prompt_from_file.text.strip()
-
-        # Construct the input images folder
-        input_image_file_now = f"image_{sentence_number}.png"
-        input_image_file_path = os.path.join(input_images_folder, input_image_file_now)
-
-        # Construct the output video path, e.g. "/path/to/output/video_1.mp4"
-        output_filename = f"video_{sentence_number}.mp4"
-        output_path = os.path.join(output_videos_folder, output_filename)
-
-        try:
-            # Call the existing void function to generate and save the video
-            GenerateVideo(user_prompt_main, user_negative_prompt, input_image_file_path, output_path)
-        except Exception as e:
-            # If any error occurs during video generation, abort
-            print(f"Error generating video for {tag}: {e}")
+        if max_in_flight > 1:
+            pending.append((record.number, record.video_prompt, record.negative_prompt))
+        elif not VideoGenSentence(record.number, record.video_prompt, record.negative_prompt,
+                                  input_images_folder, output_videos_folder,
+                                  cache, deterministic_seed, manifest):
             return False
 
+    if pending:
+        return _video_gen_concurrent(pending, input_images_folder, output_videos_folder,
+                                     cache, deterministic_seed, manifest, max_in_flight)
+
     # If we reach here, all prompts have been processed successfully
-    return True
\ No newline at end of file
+    return True
+
+def _video_gen_concurrent(pending, input_images_folder, output_videos_folder, cache,
+                          deterministic_seed, manifest, max_in_flight) -> bool:
+    ok = True
+    items = []
+    hashes = {}
+    for sentence_number, user_prompt, negative_user_prompt in pending:
+        input_image = os.path.join(input_images_folder, f"image_{sentence_number}.png")
+        output_path = os.path.join(output_videos_folder, f"video_{sentence_number}.mp4")
+        if not os.path.isfile(input_image):
+            print(f"No input image {input_image} for sentence_{sentence_number}.")
+            ok = False
+            continue
+
+        input_hash = InputHash(prompt=user_prompt, negative_prompt=negative_user_prompt,
+                               input_image=FileDigest(input_image),
+                               deterministic_seed=deterministic_seed)
+        if manifest is not None and manifest.is_done("video", sentence_number, input_hash, output_path):
+            print(f"⏭️  {os.path.basename(output_path)} is up to date, skipping.")
+            continue
+        hashes[output_path] = (sentence_number, input_hash)
+        items.append((user_prompt, negative_user_prompt, input_image, output_path))
+
+    with METRICS.span("batch", stage="video", jobs=len(items)):
+        outcomes = SubmitVideoJobs(items, max_in_flight, cache, deterministic_seed)
+
+    for output_path, error in outcomes.items():
+        sentence_number, input_hash = hashes[output_path]
+        if error is not None:
+            ok = False
+            print(f"Error generating video for sentence_{sentence_number}: {error}")
+        if manifest is not None:
+            if error is None:
+                manifest.mark_done("video", sentence_number, input_hash, output_path)
+            else:
+                manifest.mark_failed("video", sentence_number, input_hash, error)
+    return ok
\ No newline at end of file
@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import requests
+from gradio_client import Client
+
+from files.Metrics import METRICS
+
+class GradioClientPool:
+    """
+    Keeps one gradio_client.Client per endpoint URL. Creating a Client fetches
+    the Space config and opens new connections, so it is done once per endpoint
+    and the client is reused for every job (Client.submit is thread-safe).
+    """
+
+    def __init__(self, client_factory=Client):
+        self._client_factory = client_factory
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Client:
+        with self._lock:
+            client = self._clients.get(url)
+            if client is None:
+                print(f"🚀 Initializing Gradio client for {url}…")
+                client = self._client_factory(url)
+                self._clients[url] = client
+            return client
+
+    def reset(self, url: str):
+        """
+        Drops the cached client, e.g. after its connection broke or the Tor
+        circuit changed. The next get() builds a fresh one.
+        """
+        with self._lock:
+            self._clients.pop(url, None)
+
+# Shared by every stage in the process
+CLIENT_POOL = GradioClientPool()
+
+def SubmitMany(submit, jobs: list, max_in_flight: int = 4, timeout: float = 300,
+               tags: list = None, name: str = "job"):
+    """
+    Submits jobs (a list of keyword-argument dicts for submit, which returns a
+    Future such as a gradio Job, e.g. EndpointRouter.submit), keeping at most
+    max_in_flight of them running at once.
+
+    Yields (index, result, error) as jobs complete, in completion order;
+    exactly one of result/error is None. A job that runs longer than timeout
+    seconds is cancelled and reported with a TimeoutError.
+
+    Each job records a "local_queue" span (waiting for a free slot) and a
+    "remote_job" span (submit to completion), tagged with tags[index] if given.
+    """
+    tags = tags or [{} for _ in jobs]
+
+    pending = list(enumerate(jobs))
+    pending.reverse()
+    in_flight = {}  # job -> (index, deadline)
+    started = time.time()
+    submitted_at = {}  # index -> (wall clock, monotonic) submit time
+
+    def finish(index, ok):
+        start, start_monotonic = submitted_at[index]
+        METRICS.record_span("remote_job", start, time.monotonic() - start_monotonic, ok,
+                            api=name, **tags[index])
+
+    while pending or in_flight:
+        while pending and len(in_flight) < max_in_flight:
+            index, kwargs = pending.pop()
+            METRICS.record_span("local_queue", started, time.time() - started,
+                                api=name, **tags[index])
+            submitted_at[index] = (time.time(), time.monotonic())
+            try:
+                job = submit(**kwargs)
+            except Exception as e:
+                finish(index, False)
+                yield index, None, e
+                continue
+            in_flight[job] = (index, time.monotonic() + timeout)
+
+        if not in_flight:
+            continue
+
+        next_deadline = min(deadline for _, deadline in in_flight.values())
+        done, _ = wait(list(in_flight), timeout=max(0.0, next_deadline - time.monotonic()),
+                       return_when=FIRST_COMPLETED)
+
+        for job in done:
+            index, _ = in_flight.pop(job)
+            try:
+                result = job.result()
+            except Exception as e:
+                finish(index, False)
+                yield index, None, e
+                continue
+            finish(index, True)
+            yield index, result, None
+
+        now = time.monotonic()
+        for job, (index, deadline) in list(in_flight.items()):
+            if deadline <= now:
+                job.cancel()
+                del in_flight[job]
+                finish(index, False)
+                yield index, None, TimeoutError(f"{name} job timed out after {timeout}s")
+
+def ResultFile(result, key: str):
+    """
+    Returns the file a job's result points at, as a local path or a URL.
+
+    Handles the shapes Spaces return: a (file, ...) tuple/list, a bare path,
+    {key: file} and gradio FileData dicts ({"path": ..., "url": ...}).
+    Raises RuntimeError (or FileNotFoundError) when it does not reference a file.
+    """
+    value = result
+    if isinstance(value, (list, tuple)) and value:
+        value = value[0]
+    if isinstance(value, dict) and key in value:
+        value = value[key]
+    if isinstance(value, dict):
+        path = value.get("path")
+        value = path if path and os.path.isfile(path) else value.get("url")
+    if not isinstance(value, str) or not value:
+        raise RuntimeError(f"Result does not reference a {key} file: {result!r}")
+    if not value.startswith(("http://", "https://")) and not os.path.isfile(value):
+        raise FileNotFoundError(f"Result {key} file does not exist: {value}")
+    return value
+
+def _temp_path_next_to(dest: str) -> str:
+    dest_dir = os.path.dirname(os.path.abspath(dest))
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.splitext(dest)[1], dir=dest_dir)
+    os.close(fd)
+    return tmp
+
+def MoveIntoPlace(source: str, dest: str):
+    """
+    Moves a downloaded result file to dest. On the same filesystem this is a
+    rename (no data copied); otherwise the file is copied next to dest first.
+    dest only ever appears complete. The job's own download folder is removed
+    if it is left empty; nothing else under /tmp/gradio is touched.
+    """
+    tmp = _temp_path_next_to(dest)
+    try:
+        try:
+            os.replace(source, tmp)
+        except OSError:
+            shutil.copyfile(source, tmp)
+            os.unlink(source)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+    try:
+        os.rmdir(os.path.dirname(source))
+    except OSError:
+        pass
+
+def DownloadTo(url: str, dest: str, timeout: float = 60):
+    """
+    Streams a result URL straight into a temp file next to dest, then renames it.
+    """
+    tmp = _temp_path_next_to(dest)
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(tmp, "wb") as f:
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(block)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def SaveResultFile(result, key: str, dest: str) -> str:
+    """
+    Puts the file referenced by a job result at dest, using only the result
+    itself (no scanning of shared temp folders). Returns dest.
+    """
+    source = ResultFile(result, key)
+    with METRICS.span("retrieve", kind=key):
+        if source.startswith(("http://", "https://")):
+            DownloadTo(source, dest)
+        else:
+            MoveIntoPlace(source, dest)
+    METRICS.count("bytes_transferred", os.path.getsize(dest))
+    return dest
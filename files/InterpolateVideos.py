@@ -0,0 +1,252 @@
+import os
+import queue
+import struct
+import subprocess
+import threading
+from contextlib import contextmanager
+from tqdm import tqdm
+from files.FrameStream import (ProbeVideo, DecodeFrames, FrameEncoder, RunFramePipeline, CHANNELS,
+                               FINAL_PROFILE)
+from files.ArtifactCache import FileDigest
+from files.RunManifest import InputHash
+from files.EnhanceVideos import ListVideos, _sentence_number
+from files.Metrics import METRICS
+
+# Checkout and virtualenv created by rife.sh
+RIFE_DIR = os.environ.get("RIFE_DIR", "rife")
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RifeWorker.py")
+
+# Must match files/RifeWorker.py
+HEADER = struct.Struct("<III")
+READY = b"RIFE"
+
+# "fps" keeps the clip length and raises the frame rate; "duration" keeps the
+# frame rate and stretches the clip (so the Space can be asked for shorter clips)
+MODES = ("fps", "duration")
+
+class RifeInterpolator:
+    """
+    A long-lived RIFE process (files/RifeWorker.py under the rife/ virtualenv)
+    that inserts multiplier - 1 frames between every pair of input frames on
+    the CPU. The model is loaded once; frames are streamed over the worker's
+    stdin/stdout in batches, and each batch of pairs is one forward pass.
+
+    The worker remembers the last frame it saw, so consecutive batches of one
+    clip are joined seamlessly. Call reset() before starting another clip.
+    """
+
+    def __init__(self, multiplier: int = 2, rife_dir: str = RIFE_DIR, threads: int = None,
+                 scale: float = 1.0):
+        if multiplier < 2 or multiplier & (multiplier - 1):
+            raise ValueError(f"multiplier must be a power of two >= 2, got {multiplier}")
+        python = os.path.join(rife_dir, "venv", "bin", "python")
+        if not os.path.isfile(python):
+            raise FileNotFoundError(f"RIFE virtualenv not found at {python} (run rife.sh)")
+
+        self.multiplier = multiplier
+        self.proc = subprocess.Popen([
+            python, WORKER_SCRIPT,
+            "--model-dir", os.path.join(os.path.abspath(rife_dir), "train_log"),
+            "--exp", str(multiplier.bit_length() - 1),
+            "--scale", str(scale),
+            "--threads", str(threads or 0),
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        if self.proc.stdout.read(len(READY)) != READY:
+            self.proc.wait()
+            raise RuntimeError("RIFE worker failed to load the model")
+        self._has_previous = False
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Forgets the previous frame, so the next batch starts a new clip.
+        """
+        with self._lock:
+            self.proc.stdin.write(HEADER.pack(0, 0, 0))
+            self.proc.stdin.flush()
+            self._has_previous = False
+
+    def interpolate_batch(self, frames, width: int, height: int) -> list:
+        """
+        Sends raw RGB frames of the current clip and returns the output frames:
+        for every input frame, the in-betweens since the previous one followed
+        by the frame itself.
+        """
+        frames = list(frames)
+        if not frames:
+            return []
+
+        frame_size = width * height * CHANNELS
+        with self._lock:
+            expected = len(frames) * self.multiplier
+            if not self._has_previous:
+                expected -= self.multiplier - 1
+
+            self.proc.stdin.write(HEADER.pack(len(frames), width, height))
+            for frame in frames:
+                self.proc.stdin.write(frame)
+            self.proc.stdin.flush()
+
+            output = []
+            for _ in range(expected):
+                frame = self.proc.stdout.read(frame_size)
+                if len(frame) < frame_size:
+                    raise RuntimeError("RIFE worker exited mid-batch")
+                output.append(frame)
+            self._has_previous = True
+        return output
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class InterpolatorPool:
+    """
+    A fixed set of RifeInterpolator processes. Each clip holds one for its
+    whole length, since an interpolator carries state between batches.
+    """
+
+    def __init__(self, size: int = 1, **kwargs):
+        self.interpolators = [RifeInterpolator(**kwargs) for _ in range(max(1, size))]
+        self._idle = queue.Queue()
+        for interpolator in self.interpolators:
+            self._idle.put(interpolator)
+
+    @contextmanager
+    def acquire(self):
+        interpolator = self._idle.get()
+        try:
+            yield interpolator
+        finally:
+            self._idle.put(interpolator)
+
+    def close(self):
+        for interpolator in self.interpolators:
+            interpolator.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def InterpolateVideo(input_video_path, output_video_path, interpolator, mode="fps",
+                     queue_size=8, batch_size=4, profile=FINAL_PROFILE):
+    """
+    Interpolates a silent video with RIFE on the CPU, streaming frames from the
+    decoder through the interpolator into the encoder without touching the disk.
+
+    mode="fps" multiplies the frame rate and keeps the duration; mode="duration"
+    keeps the frame rate and stretches the clip by the interpolator's multiplier.
+    Frames are handed to RIFE in batches of batch_size (batch_size pairs per
+    forward pass). profile is the EncodeProfile of the output.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    os.makedirs(os.path.dirname(output_video_path), exist_ok=True)
+
+    info = ProbeVideo(input_video_path)
+    fps = info.fps * interpolator.multiplier if mode == "fps" else info.fps
+
+    interpolator.reset()
+    encoder = FrameEncoder(output_video_path, info.width, info.height, fps, profile)
+    progress = tqdm(desc="Interpolating Frames", unit="frame")
+
+    def interpolate(frames):
+        output = interpolator.interpolate_batch(frames, info.width, info.height)
+        progress.update(len(frames))
+        return output
+
+    try:
+        written = RunFramePipeline(DecodeFrames(input_video_path, info), interpolate,
+                                   encoder.write, queue_size, batch_size)
+        encoder.close()
+    except BaseException:
+        encoder.abort()
+        raise
+    finally:
+        progress.close()
+
+    METRICS.count("frames_processed", written)
+    print("✅ Video interpolated successfully:", output_video_path)
+
+def InterpolateInputHash(input_path, multiplier, mode, profile=FINAL_PROFILE) -> str:
+    """
+    RunManifest input hash of an interpolated video: input digest plus settings.
+    """
+    return InputHash(input_video=FileDigest(input_path), multiplier=multiplier, mode=mode,
+                     encode=profile.args())
+
+def InterpolateVideoJob(input_path, output_path, interpolator, mode="fps",
+                        cache=None, manifest=None, profile=FINAL_PROFILE) -> bool:
+    """
+    Interpolates a single video_N.mp4 with cache and RunManifest bookkeeping.
+    Returns True on success; failures are printed and recorded, not raised.
+    """
+    sentence = _sentence_number(input_path)
+    input_hash = None
+    if manifest is not None:
+        input_hash = InterpolateInputHash(input_path, interpolator.multiplier, mode, profile)
+        if manifest.is_done("interpolated", sentence, input_hash, output_path):
+            print(f"⏭️  {os.path.basename(output_path)} is up to date, skipping.")
+            return True
+
+    try:
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key("interpolated", input_video=FileDigest(input_path),
+                                  multiplier=interpolator.multiplier, mode=mode,
+                                  encode=profile.args())
+        if cache_key is not None and cache.get(cache_key, output_path):
+            print(f"♻️  Interpolated video served from cache: {output_path}")
+        else:
+            with METRICS.span("interpolate_video", stage="interpolate", sentence=sentence):
+                InterpolateVideo(input_path, output_path, interpolator, mode, profile=profile)
+            if cache_key is not None:
+                cache.put(cache_key, output_path)
+    except Exception as e:
+        print(f"❌ Interpolating {os.path.basename(input_path)} failed: {e}")
+        if manifest is not None:
+            manifest.mark_failed("interpolated", sentence, input_hash, str(e))
+        return False
+
+    if manifest is not None:
+        manifest.mark_done("interpolated", sentence, input_hash, output_path)
+    return True
+
+def InterpolateVideos(input_videos_folder, output_videos_folder, multiplier=2, mode="fps",
+                      threads=None, cache=None, manifest=None, profile=FINAL_PROFILE) -> bool:
+    """
+    Interpolates every video_*.mp4 in input_videos_folder into output_videos_folder
+    with one warm RIFE worker. Can run before enhancement (cheaper, fewer pixels)
+    or after it (interpolates the final detail).
+
+    Returns True if every video was interpolated, False otherwise.
+    """
+    jobs = ListVideos(input_videos_folder, output_videos_folder)
+    if not jobs:
+        return True
+
+    os.makedirs(output_videos_folder, exist_ok=True)
+    ok = True
+    with RifeInterpolator(multiplier=multiplier, threads=threads) as interpolator:
+        for input_path, output_path in jobs:
+            ok = InterpolateVideoJob(input_path, output_path, interpolator, mode,
+                                     cache, manifest, profile) and ok
+    return ok
@@ -0,0 +1,154 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+class MetricsRecorder:
+    """
+    Collects spans (timed sections) and counters for a run, tagged with the
+    pipeline stage and sentence they belong to.
+
+    Spans nest per thread: a span opened inside another inherits its stage
+    and sentence, so inner calls (remote inference, downloads, decoding) do
+    not need to know which sentence they serve. Every event can be streamed
+    to a JSON-lines file as it happens; summary() and prometheus() aggregate
+    everything recorded so far.
+    """
+
+    def __init__(self, jsonl_path: str = None):
+        self.jsonl_path = jsonl_path
+        self._events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _context(self) -> dict:
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else {}
+
+    def _emit(self, event: dict):
+        with self._lock:
+            self._events.append(event)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event) + "\n")
+
+    @contextmanager
+    def span(self, name: str, stage: str = None, sentence: int = None, **attrs):
+        """
+        Times the block and records a span event. Failures are recorded with
+        ok=False and re-raised.
+        """
+        context = dict(self._context())
+        if stage is not None:
+            context["stage"] = stage
+        if sentence is not None:
+            context["sentence"] = sentence
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(context)
+
+        start = time.time()
+        started = time.monotonic()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            stack.pop()
+            self.record_span(name, start, time.monotonic() - started, ok, **context, **attrs)
+
+    def record_span(self, name: str, start: float, seconds: float, ok: bool = True, **attrs):
+        """
+        Records a span measured elsewhere (e.g. from job submit to completion).
+        """
+        self._emit({"type": "span", "name": name, "start": start, "seconds": seconds,
+                    "ok": ok, **self._context(), **attrs})
+
+    def count(self, name: str, value: float = 1, **attrs):
+        """
+        Adds value to a counter (retries, bytes transferred, frames processed...).
+        """
+        self._emit({"type": "counter", "name": name, "value": value, "time": time.time(),
+                    **self._context(), **attrs})
+
+    def drain(self) -> list:
+        """
+        Returns and forgets every event, e.g. to ship them from a worker process.
+        """
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def merge(self, events: list):
+        """
+        Adds events recorded by another process.
+        """
+        for event in events:
+            self._emit(event)
+
+    def summary(self) -> dict:
+        """
+        Returns {"spans": {(stage, name): {...}}, "counters": {(stage, name): total}}.
+        """
+        spans = {}
+        counters = {}
+        with self._lock:
+            events = list(self._events)
+        for event in events:
+            key = (event.get("stage", ""), event["name"])
+            if event["type"] == "span":
+                entry = spans.setdefault(key, {"count": 0, "seconds": 0.0, "max": 0.0, "failed": 0})
+                entry["count"] += 1
+                entry["seconds"] += event["seconds"]
+                entry["max"] = max(entry["max"], event["seconds"])
+                entry["failed"] += 0 if event["ok"] else 1
+            else:
+                counters[key] = counters.get(key, 0) + event["value"]
+        return {"spans": spans, "counters": counters}
+
+    def report(self):
+        summary = self.summary()
+        print("⏱️ Run metrics:")
+        for (stage, name), entry in sorted(summary["spans"].items()):
+            failed = f", {entry['failed']} failed" if entry["failed"] else ""
+            print(f"   {stage or '-'}/{name}: {entry['count']}x, {entry['seconds']:.1f}s total, "
+                  f"{entry['seconds'] / entry['count']:.2f}s mean, {entry['max']:.2f}s max{failed}")
+        for (stage, name), total in sorted(summary["counters"].items()):
+            print(f"   {stage or '-'}/{name}: {total:g}")
+
+    def prometheus(self, prefix: str = "artifyflux") -> str:
+        """
+        The aggregated metrics in Prometheus text exposition format.
+        """
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_span_seconds summary"]
+        for (stage, name), entry in sorted(summary["spans"].items()):
+            labels = f'stage="{stage}",span="{name}"'
+            lines.append(f"{prefix}_span_seconds_sum{{{labels}}} {entry['seconds']:.6f}")
+            lines.append(f"{prefix}_span_seconds_count{{{labels}}} {entry['count']}")
+        lines.append(f"# TYPE {prefix}_span_failures_total counter")
+        for (stage, name), entry in sorted(summary["spans"].items()):
+            lines.append(f'{prefix}_span_failures_total{{stage="{stage}",span="{name}"}} {entry["failed"]}')
+        for (stage, name), total in sorted(summary["counters"].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f'{metric}{{stage="{stage}"}} {total:g}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+
+# Shared by every stage in the process
+METRICS = MetricsRecorder()
+
+def ConfigureMetrics(jsonl_path: str = None):
+    """
+    Streams every event of this run to jsonl_path (None = keep them in memory only).
+    """
+    if jsonl_path:
+        open(jsonl_path, "w").close()
+    METRICS.jsonl_path = jsonl_path
@@ -0,0 +1,119 @@
+import json
+import time
+import hashlib
+import threading
+
+from files.ArtifactCache import SqliteTransaction
+from files.PromptRecords import SentencePrompt
+
+DEFAULT_PROMPT_CACHE = ".prompt_cache.sqlite"
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+DEFAULT_TTL = 30 * 24 * 3600
+
+class PromptCache:
+    """
+    Persistent cache of LLM prompt blocks, one entry per script sentence.
+
+    Entries are keyed by the model, a hash of the system prompt and the exact
+    sentence text, so editing one sentence of a script only sends that sentence
+    to the model and changing the system prompt invalidates everything.
+    Entries older than ttl seconds are dropped, and once the stored prompts
+    exceed max_bytes the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_PROMPT_CACHE, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with SqliteTransaction(self.path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS prompts (
+                    key TEXT PRIMARY KEY,
+                    image_prompt TEXT NOT NULL,
+                    video_prompt TEXT NOT NULL,
+                    negative_prompt TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def key(model: str, system_prompt: str, sentence: str, endpoint: str = "") -> str:
+        """
+        Builds the cache key of one script sentence.
+        """
+        payload = json.dumps({
+            "model": model,
+            "endpoint": endpoint,
+            "system": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+            "sentence": sentence.strip(),
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, number: int):
+        """
+        Returns the cached SentencePrompt for key, numbered `number`, or None.
+        """
+        now = time.time()
+        with SqliteTransaction(self.path) as db:
+            row = db.execute(
+                "SELECT image_prompt, video_prompt, negative_prompt, created "
+                "FROM prompts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[3] > self.ttl:
+                db.execute("DELETE FROM prompts WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                db.execute("UPDATE prompts SET last_used = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return SentencePrompt(number, row[0], row[1], row[2])
+
+    def put(self, key: str, record: SentencePrompt):
+        """
+        Stores a sentence's prompts under key and evicts old entries if needed.
+        """
+        texts = (record.image_prompt, record.video_prompt, record.negative_prompt)
+        size = sum(len(text.encode("utf-8")) for text in texts)
+        now = time.time()
+        with SqliteTransaction(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO prompts "
+                "(key, image_prompt, video_prompt, negative_prompt, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, *texts, size, now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then least recently used ones until the cache
+        fits in max_bytes.
+        """
+        with SqliteTransaction(self.path) as db:
+            db.execute("DELETE FROM prompts WHERE created < ?", (time.time() - self.ttl,))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM prompts").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in db.execute("SELECT key, size FROM prompts ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM prompts WHERE key = ?", (key,))
+                total -= size
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        print(f"🗃️ Prompt cache: {self.hits} hits, {self.misses} misses "
+              f"({self.hit_rate():.0%} hit rate)")
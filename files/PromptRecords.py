@@ -0,0 +1,152 @@
+import re
+from dataclasses import dataclass, replace
+from xml.sax.saxutils import escape
+
+@dataclass(frozen=True, slots=True)
+class SentencePrompt:
+    """
+    The prompts of one script sentence, parsed once from the LLM output.
+    """
+    number: int
+    image_prompt: str = ""
+    video_prompt: str = ""
+    negative_prompt: str = ""
+
+# XML tag of each prompt field, in prompts.txt order
+FIELD_TAGS = {
+    "image_prompt": "image_generator_prompt",
+    "video_prompt": "image_to_video_prompt",
+    "negative_prompt": "image_to_video_negative_prompt",
+}
+
+# Word limits from the system prompt: (minimum, maximum)
+WORD_LIMITS = {
+    "image_prompt": (150, 200),
+    "video_prompt": (40, 80),
+    "negative_prompt": (30, 60),
+}
+
+# Only letters, spaces, full stops and commas are allowed in prompts
+DISALLOWED_CHARS = re.compile(r"[^A-Za-z .,]")
+
+@dataclass
+class PromptProblem:
+    number: int
+    field: str
+    message: str
+    repairable: bool
+
+def CheckPrompt(record: SentencePrompt, enforce_min_words: bool = False) -> list:
+    """
+    Checks a record against the system prompt's rules: every field present,
+    only allowed characters, single line, and within the word limits.
+    Under-length prompts are only reported when enforce_min_words is set.
+    Returns a list of PromptProblem (empty when the record is valid).
+    """
+    problems = []
+    for field, (min_words, max_words) in WORD_LIMITS.items():
+        text = getattr(record, field)
+        tag = FIELD_TAGS[field]
+        if not text:
+            problems.append(PromptProblem(record.number, field, f"missing <{tag}>", False))
+            continue
+
+        bad = sorted(set(DISALLOWED_CHARS.findall(text.replace("\n", " "))))
+        if bad:
+            problems.append(PromptProblem(record.number, field,
+                                          f"disallowed characters {''.join(bad)!r}", True))
+        if "\n" in text:
+            problems.append(PromptProblem(record.number, field, "spans several lines", True))
+
+        words = len(text.split())
+        if words > max_words:
+            problems.append(PromptProblem(record.number, field,
+                                          f"{words} words (max {max_words})", True))
+        elif enforce_min_words and words < min_words:
+            problems.append(PromptProblem(record.number, field,
+                                          f"{words} words (min {min_words})", False))
+    return problems
+
+def RepairPrompt(record: SentencePrompt) -> SentencePrompt:
+    """
+    Fixes what can be fixed without the LLM: disallowed characters become
+    spaces (so "half-buried" reads "half buried"), whitespace and line breaks
+    are collapsed, and over-length prompts are cut back to the word limit.
+    """
+    fields = {}
+    for field, (_, max_words) in WORD_LIMITS.items():
+        text = DISALLOWED_CHARS.sub(" ", getattr(record, field))
+        words = text.split()[:max_words]
+        text = " ".join(words).replace(" ,", ",").replace(" .", ".").strip(" ,")
+        fields[field] = text
+    return replace(record, **fields)
+
+def ValidatePrompts(records, regenerate=None, max_attempts: int = 2,
+                    enforce_min_words: bool = False):
+    """
+    Validation gate run before any paid generation. Records with repairable
+    problems are repaired locally; records that still fail (missing fields,
+    under-length when enforced) are re-requested through regenerate(record),
+    which returns a new SentencePrompt or None, up to max_attempts times.
+
+    Returns (valid_records, problems) where problems lists what could not be fixed.
+    """
+    valid = []
+    unresolved = []
+    for record in records:
+        record, problems = ValidatePrompt(record, regenerate, max_attempts, enforce_min_words)
+        if problems:
+            unresolved.extend(problems)
+        else:
+            valid.append(record)
+    return valid, unresolved
+
+def ValidatePrompt(record: SentencePrompt, regenerate=None, max_attempts: int = 2,
+                   enforce_min_words: bool = False):
+    """
+    Validates, repairs and if needed re-requests a single record.
+    Returns (record, remaining_problems).
+    """
+    attempts = 0
+    while True:
+        problems = CheckPrompt(record, enforce_min_words)
+        if problems and all(p.repairable for p in problems):
+            record = RepairPrompt(record)
+            problems = CheckPrompt(record, enforce_min_words)
+        if not problems:
+            return record, []
+
+        if regenerate is None or attempts >= max_attempts:
+            return record, problems
+        attempts += 1
+        print(f"🔁 Re-requesting prompts for sentence_{record.number}: "
+              + "; ".join(f"{p.field} {p.message}" for p in problems))
+        new_record = regenerate(record)
+        if new_record is None:
+            return record, problems
+        record = replace(new_record, number=record.number)
+
+def PrintPromptProblems(problems):
+    for p in problems:
+        print(f"❌ sentence_{p.number} {p.field}: {p.message}")
+
+def WritePromptRecords(records, prompts_file: str):
+    """
+    Writes records back out in the prompts.txt <visuals> format.
+    """
+    lines = ["<visuals>"]
+    for record in sorted(records, key=lambda r: r.number):
+        lines.append(f"<sentence_{record.number}>")
+        for field, tag in FIELD_TAGS.items():
+            lines.append(f"<{tag}>{escape(getattr(record, field))}</{tag}>")
+        lines.append(f"</sentence_{record.number}>")
+    lines.append("</visuals>")
+    with open(prompts_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def SplitScriptSentences(script: str) -> list:
+    """
+    Splits a video script into its sentences (sentence_1 is the first one).
+    """
+    parts = re.split(r"(?<=[.!?])\s+", script.strip())
+    return [part.strip() for part in parts if part.strip()]
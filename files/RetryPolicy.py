@@ -0,0 +1,280 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+class NonRetryableError(Exception):
+    """
+    A failure that will not go away by asking again (bad input, a rejected
+    prompt, a missing endpoint). Raise it to stop retrying immediately.
+    """
+
+class RetryableError(Exception):
+    """
+    A failure that is always worth another attempt (e.g. a corrupt result
+    file), whatever its message says.
+    """
+
+class RetryBudgetExceeded(Exception):
+    """
+    Raised when an operation is still failing after its attempts or its
+    deadline ran out. The last underlying error is its __cause__.
+    """
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an endpoint whose circuit breaker is open.
+    retry_after is the number of seconds until a circuit lets a trial call
+    through (None if unknown).
+    """
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Message fragments of errors a retry cannot fix (matched case-insensitively)
+PERMANENT_MARKERS = ("nsfw", "unsafe content", "invalid", "unauthorized", "forbidden",
+                     "api_name", "cannot find a function")
+
+# Fragments of errors worth a longer wait (the Space is saturated, not broken)
+THROTTLE_MARKERS = ("quota", "rate limit", "too many requests", "queue is full")
+
+def IsRetryable(error: BaseException) -> bool:
+    """
+    Classifies an error as transient (network trouble, timeouts, overloaded
+    or crashing Space) or permanent (malformed request, rejected prompt,
+    authentication, unknown endpoint).
+    """
+    if isinstance(error, (NonRetryableError, CircuitOpenError, RetryBudgetExceeded)):
+        return False
+    if isinstance(error, RetryableError):
+        return True
+    # requests.HTTPError and friends carry the response (checked by attribute,
+    # so this module does not pull in requests)
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status in (408, 429)
+    if isinstance(error, (TypeError, KeyError)):
+        return False
+    message = str(error).lower()
+    if any(marker in message for marker in THROTTLE_MARKERS):
+        return True
+    return not any(marker in message for marker in PERMANENT_MARKERS)
+
+def CanRetryLater(error: BaseException) -> bool:
+    """
+    True for retryable errors and for open circuits that will half-open:
+    the operation is worth another attempt, possibly after a longer wait.
+    """
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after is not None
+    return IsRetryable(error)
+
+def IsThrottled(error: BaseException) -> bool:
+    return any(marker in str(error).lower() for marker in THROTTLE_MARKERS)
+
+class Deadline:
+    """
+    A point in time by which work has to finish. seconds=None never expires.
+    """
+
+    def __init__(self, seconds: float = None):
+        self.reset(seconds)
+
+    def reset(self, seconds: float = None):
+        self.seconds = seconds
+        self._end = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        if self._end is None:
+            return float("inf")
+        return max(0.0, self._end - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def earliest(self, other: "Deadline") -> "Deadline":
+        return self if self.remaining() <= other.remaining() else other
+
+class CircuitBreaker:
+    """
+    Stops calling an endpoint after failure_threshold consecutive failures.
+    While open, calls fail fast with CircuitOpenError; after reset_after
+    seconds one trial call is let through (half-open) and its outcome closes
+    or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_after: float = 120):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the circuit lets a trial call through (0 when closed).
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half-open" and self._trial_running):
+                wait = max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+                raise CircuitOpenError(f"Circuit for {self.name} is open "
+                                       f"({self.failures} consecutive failures, "
+                                       f"retry in {wait:.0f}s)", retry_after=wait)
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    print(f"🔌 Circuit for {self.name} opened after {self.failures} failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+class CircuitBreakers:
+    """
+    One CircuitBreaker per endpoint URL, created on first use.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 120):
+        self._lock = threading.Lock()
+        self.configure(failure_threshold, reset_after)
+
+    def configure(self, failure_threshold: int, reset_after: float):
+        # Drops every existing breaker
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.reset_after = reset_after
+            self._breakers = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, self.failure_threshold, self.reset_after)
+                self._breakers[name] = breaker
+            return breaker
+
+@dataclass
+class RetryPolicy:
+    """
+    How a remote operation is retried: up to max_attempts tries with
+    exponential backoff (base_delay * 2^n, capped at max_delay) and
+    jitter, never past the per-item deadline (item_deadline seconds) or the
+    run's deadline. job_timeout bounds a single remote job. Throttling
+    errors (quota, rate limits) wait throttle_factor times longer.
+    """
+    max_attempts: int = 6
+    base_delay: float = 5.0
+    max_delay: float = 120.0
+    job_timeout: float = 300.0
+    item_deadline: float = 1800.0
+    throttle_factor: float = 4.0
+
+    def delay(self, attempt: int, error: BaseException = None) -> float:
+        # "Equal jitter": uniform in [cap / 2, cap], so concurrent retries spread
+        # out but still wait long enough for a new Tor circuit to build
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if error is not None and IsThrottled(error):
+            cap = min(self.max_delay, cap * self.throttle_factor)
+        return random.uniform(cap / 2, cap)
+
+    def run(self, func, description: str, breaker: CircuitBreaker = None, on_retry=None,
+            deadline: Deadline = None):
+        """
+        Calls func(timeout) until it returns, passing the seconds a single
+        remote job may take. Retryable failures call on_retry(error, attempt)
+        and back off; when func finds every endpoint's circuit open, the wait
+        lasts until one half-opens. Permanent failures, breaker's own open
+        circuit and an exhausted budget raise. Returns func's result.
+        """
+        deadline = Deadline(self.item_deadline).earliest(deadline or RUN_DEADLINE)
+        last_error = None
+        for attempt in range(1, self.max_attempts + 1):
+            if deadline.expired():
+                break
+            if breaker is not None:
+                breaker.before_call()
+            try:
+                result = func(min(self.job_timeout, deadline.remaining()))
+            except Exception as e:
+                last_error = e
+                retryable = IsRetryable(e)
+                if breaker is not None and retryable:
+                    breaker.record_failure()
+                elif breaker is not None and not isinstance(e, CircuitOpenError):
+                    # A permanent error is about the request, not the endpoint's health
+                    breaker.record_success()
+                if not CanRetryLater(e):
+                    print(f"⛔ {description}: permanent failure, not retrying: {e}")
+                    raise
+                print(f"❌ {description} failed (attempt {attempt}/{self.max_attempts}): {e}")
+                if attempt == self.max_attempts:
+                    break
+                wait = self.delay(attempt, e)
+                if isinstance(e, CircuitOpenError):
+                    # Every endpoint is resting; come back when one takes a trial call
+                    wait = max(wait, e.retry_after)
+                if wait >= deadline.remaining():
+                    break
+                if on_retry is not None:
+                    on_retry(e, attempt)
+                print(f"🔄 Retrying in {wait:.1f}s…")
+                time.sleep(wait)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+        reason = "deadline reached" if deadline.expired() else f"{self.max_attempts} attempts"
+        raise RetryBudgetExceeded(f"{description}: gave up ({reason}): {last_error}") from last_error
+
+# Shared by every stage in the process, updated in place by ConfigureRetries
+RETRY_POLICY = RetryPolicy()
+BREAKERS = CircuitBreakers()
+RUN_DEADLINE = Deadline()
+
+def ConfigureRetries(policy: RetryPolicy = None, run_deadline: float = None,
+                     failure_threshold: int = 5, reset_after: float = 120,
+                     reset_breakers: bool = True):
+    """
+    Sets the retry policy, circuit breakers and overall run deadline
+    (seconds from now, None = unlimited) used by the generation stages.
+    With reset_breakers=False the existing breakers (and what they learned
+    about the endpoints) are kept unless their settings change.
+    """
+    for name, value in vars(policy or RetryPolicy()).items():
+        setattr(RETRY_POLICY, name, value)
+    settings = (failure_threshold, reset_after)
+    if reset_breakers or settings != (BREAKERS.failure_threshold, BREAKERS.reset_after):
+        BREAKERS.configure(failure_threshold, reset_after)
+    RUN_DEADLINE.reset(run_deadline)
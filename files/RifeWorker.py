@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+RIFE frame interpolation worker.
+
+Runs under the RIFE virtualenv created by rife.sh (it needs torch and the
+ECCV2022-RIFE sources, which the main environment does not have) and is
+driven by files/InterpolateVideos.py over stdin/stdout:
+
+    parent -> worker:  header (count, width, height) + count raw rgb24 frames
+                       (count = 0 forgets the previous frame, i.e. a new clip)
+    worker -> parent:  for every input frame, the in-between frames since the
+                       previous input frame followed by the frame itself
+
+The model is loaded once and every batch of frame pairs is interpolated in a
+single forward pass.
+"""
+import os
+import sys
+import struct
+import argparse
+
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+HEADER = struct.Struct("<III")
+READY = b"RIFE"
+
+def read_exact(stream, size: int):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+def load_model(model_dir: str):
+    # train_log/RIFE_HDv3.py imports from the repository's own packages
+    sys.path.insert(0, os.path.dirname(os.path.abspath(model_dir)))
+    from train_log.RIFE_HDv3 import Model
+
+    model = Model()
+    model.load_model(model_dir, -1)
+    model.eval()
+    model.device()
+    return model
+
+def to_tensor(data: bytes, count: int, width: int, height: int, padded: tuple):
+    frames = np.frombuffer(data, dtype=np.uint8).reshape(count, height, width, 3)
+    tensor = torch.from_numpy(frames.copy()).permute(0, 3, 1, 2).float() / 255.0
+    pad_h, pad_w = padded
+    return F.pad(tensor, (0, pad_w - width, 0, pad_h - height))
+
+def to_frames(tensor, width: int, height: int) -> list:
+    frames = (tensor[:, :, :height, :width] * 255.0).round().clamp(0, 255).byte()
+    frames = frames.permute(0, 2, 3, 1).contiguous().cpu().numpy()
+    return [frame.tobytes() for frame in frames]
+
+def in_betweens(model, start, end, exp: int, scale: float) -> list:
+    """
+    Returns 2**exp - 1 batches of frames evenly spaced between start and end,
+    in time order, by recursive midpoint interpolation.
+    """
+    if exp == 0:
+        return []
+    middle = model.inference(start, end, scale=scale)
+    return (in_betweens(model, start, middle, exp - 1, scale) + [middle]
+            + in_betweens(model, middle, end, exp - 1, scale))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--exp", type=int, default=1, help="insert 2**exp - 1 frames per pair")
+    parser.add_argument("--scale", type=float, default=1.0, help="RIFE flow scale (0.5 for 4K)")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.set_grad_enabled(False)
+    model = load_model(args.model_dir)
+
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    stdout.write(READY)
+    stdout.flush()
+
+    previous = None  # last frame of the clip as a (1, 3, H, W) tensor
+    dims = None
+    while True:
+        header = read_exact(stdin, HEADER.size)
+        if header is None:
+            break
+        count, width, height = HEADER.unpack(header)
+        if count == 0 or (width, height) != dims:
+            previous = None
+        if count == 0:
+            continue
+        dims = (width, height)
+
+        data = read_exact(stdin, count * width * height * 3)
+        if data is None:
+            break
+
+        multiple = max(32, int(32 / args.scale))
+        padded = (((height - 1) // multiple + 1) * multiple,
+                  ((width - 1) // multiple + 1) * multiple)
+        frames = to_tensor(data, count, width, height, padded)
+
+        if previous is None:
+            stdout.write(to_frames(frames[:1], width, height)[0])
+            starts, ends = frames[:-1], frames[1:]
+        else:
+            starts, ends = torch.cat([previous, frames[:-1]]), frames
+
+        if len(ends):
+            middles = [to_frames(batch, width, height)
+                       for batch in in_betweens(model, starts, ends, args.exp, args.scale)]
+            finals = to_frames(ends, width, height)
+            for i, final in enumerate(finals):
+                for batch in middles:
+                    stdout.write(batch[i])
+                stdout.write(final)
+
+        stdout.flush()
+        previous = frames[-1:]
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import hashlib
+import xml.etree.ElementTree as ET
+
+from files.ArtifactCache import FileDigest, SqliteTransaction
+from files.ExtractPrompts import LoadSentencePrompts
+
+DEFAULT_MANIFEST = "run_manifest.sqlite"
+
+# Pipeline stages tracked per sentence, in order
+STAGES = ("script", "prompt", "image", "video", "interpolated", "enhanced")
+
+def InputHash(**inputs) -> str:
+    """
+    Hashes everything a stage's output depends on (prompts, upstream file
+    digests, settings). Upstream changes therefore invalidate downstream items.
+    """
+    payload = json.dumps(inputs, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def TextDigest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class RunManifest:
+    """
+    SQLite record of every sentence at every stage: the hash of its inputs,
+    its output path and checksum, and whether it succeeded. A rerun asks
+    is_done() before doing any work and only redoes stale or failed items.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST):
+        self.path = path
+        with SqliteTransaction(self.path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    stage TEXT NOT NULL,
+                    sentence INTEGER NOT NULL,
+                    input_hash TEXT NOT NULL,
+                    output_path TEXT,
+                    output_checksum TEXT,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (stage, sentence)
+                )
+            """)
+
+    def is_done(self, stage: str, sentence: int, input_hash: str, output_path: str = None) -> bool:
+        """
+        True if the item finished with the same inputs and its output file still
+        exists with the recorded checksum.
+        """
+        with SqliteTransaction(self.path) as db:
+            row = db.execute(
+                "SELECT input_hash, output_path, output_checksum, status FROM items "
+                "WHERE stage = ? AND sentence = ?", (stage, sentence)
+            ).fetchone()
+
+        if row is None:
+            return False
+        recorded_hash, recorded_path, checksum, status = row
+        if status != "done" or recorded_hash != input_hash:
+            return False
+        if output_path is None:
+            return True
+        if recorded_path != output_path or not os.path.isfile(output_path):
+            return False
+        return FileDigest(output_path) == checksum
+
+    def mark_done(self, stage: str, sentence: int, input_hash: str,
+                  output_path: str = None, output_checksum: str = None):
+        """
+        Records a finished item. The checksum is computed from output_path unless given.
+        """
+        if output_checksum is None and output_path is not None:
+            output_checksum = FileDigest(output_path)
+        self._write(stage, sentence, input_hash, output_path, output_checksum, "done", None)
+
+    def mark_failed(self, stage: str, sentence: int, input_hash: str, error: str):
+        self._write(stage, sentence, input_hash, None, None, "failed", error)
+
+    def _write(self, stage, sentence, input_hash, output_path, output_checksum, status, error):
+        with SqliteTransaction(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO items "
+                "(stage, sentence, input_hash, output_path, output_checksum, status, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (stage, sentence, input_hash, output_path, output_checksum, status, error, time.time()),
+            )
+
+    def summary(self) -> dict:
+        """
+        Returns {stage: {status: count}} for every recorded item.
+        """
+        counts = {}
+        with SqliteTransaction(self.path) as db:
+            for stage, status, count in db.execute(
+                "SELECT stage, status, COUNT(*) FROM items GROUP BY stage, status"
+            ):
+                counts.setdefault(stage, {})[status] = count
+        return counts
+
+    def print_summary(self):
+        print("📒 Run manifest:")
+        counts = self.summary()
+        for stage in STAGES:
+            if stage in counts:
+                states = ", ".join(f"{n} {status}" for status, n in sorted(counts[stage].items()))
+                print(f"   {stage}: {states}")
+
+def RecordPrompts(manifest: RunManifest, prompts) -> bool:
+    """
+    Records the "prompt" stage of every sentence, using the sentence's prompt
+    texts as both its input and its checksum. prompts is a list of
+    SentencePrompt records or the path of a prompts file.
+    """
+    if isinstance(prompts, str):
+        try:
+            prompts = LoadSentencePrompts(prompts)
+        except (ET.ParseError, OSError) as e:
+            print(f"Error reading prompts file: {e}")
+            return False
+
+    for record in prompts:
+        text = "\n".join((record.image_prompt, record.video_prompt, record.negative_prompt))
+        digest = TextDigest(text)
+        manifest.mark_done("prompt", record.number, digest, output_checksum=digest)
+    return True
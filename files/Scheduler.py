@@ -0,0 +1,107 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from files.Metrics import METRICS
+
+@dataclass
+class Stage:
+    """
+    One step a sentence flows through. func(sentence) is a blocking call that
+    returns True on success (False or an exception stops that sentence).
+    At most `limit` sentences are inside the stage at the same time.
+    """
+    name: str
+    func: object
+    limit: int = 1
+
+@dataclass
+class SentenceResult:
+    number: int
+    ok: bool = True
+    failed_stage: str = ""
+    error: str = ""
+    seconds: dict = field(default_factory=dict)  # stage name -> wall time
+
+def _traced(stage, sentence):
+    # Runs on the executor thread, so everything the stage records is tagged
+    with METRICS.span("stage", stage=stage.name, sentence=sentence.number):
+        return stage.func(sentence)
+
+async def _run_sentence(sentence, stages, semaphores, executor, result):
+    loop = asyncio.get_running_loop()
+    for stage in stages:
+        queued = time.time()
+        queued_at = time.monotonic()
+        async with semaphores[stage.name]:
+            METRICS.record_span("queue_wait", queued, time.monotonic() - queued_at,
+                                stage=stage.name, sentence=sentence.number)
+            start = time.monotonic()
+            try:
+                ok = await loop.run_in_executor(executor, _traced, stage, sentence)
+                error = "" if ok is not False else "stage returned False"
+            except Exception as e:
+                ok, error = False, str(e)
+            result.seconds[stage.name] = time.monotonic() - start
+
+        if ok is False:
+            result.ok = False
+            result.failed_stage = stage.name
+            result.error = error
+            print(f"❌ sentence_{result.number} failed at {stage.name}: {error}")
+            return
+    print(f"✅ sentence_{result.number} finished all stages")
+
+async def _run_pipeline(sentences, stages, executor):
+    loop = asyncio.get_running_loop()
+    semaphores = {stage.name: asyncio.Semaphore(stage.limit) for stage in stages}
+    results = []
+    tasks = []
+
+    # The sentence source may block (e.g. a live LLM stream), so it is
+    # advanced on a worker thread and each sentence starts as soon as it arrives
+    iterator = iter(sentences)
+    done = object()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentence-source") as source:
+        while True:
+            sentence = await loop.run_in_executor(source, next, iterator, done)
+            if sentence is done:
+                break
+            result = SentenceResult(sentence.number)
+            results.append(result)
+            tasks.append(asyncio.create_task(
+                _run_sentence(sentence, stages, semaphores, executor, result)))
+
+    await asyncio.gather(*tasks)
+    return results
+
+def RunPipeline(sentences, stages) -> list:
+    """
+    Pushes every sentence through the stages (e.g. image -> video -> enhance)
+    as an independent unit. Each stage has its own concurrency limit, so
+    sentence 1 can be upscaled while sentence 2's video and sentence 3's image
+    are still in flight; total wall time approaches that of the slowest stage
+    instead of the sum of all stages.
+
+    sentences is any iterable of records with a `number` attribute, such as
+    SentencePrompt (it may yield lazily). Returns one SentenceResult per
+    sentence, in arrival order.
+    """
+    workers = sum(stage.limit for stage in stages)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage") as executor:
+        start = time.monotonic()
+        results = asyncio.run(_run_pipeline(sentences, stages, executor))
+        elapsed = time.monotonic() - start
+
+    PrintPipelineReport(results, stages, elapsed)
+    return results
+
+def PrintPipelineReport(results, stages, elapsed):
+    failed = [r for r in results if not r.ok]
+    print(f"📊 {len(results) - len(failed)}/{len(results)} sentences finished in {elapsed:.1f}s")
+    for stage in stages:
+        total = sum(r.seconds.get(stage.name, 0.0) for r in results)
+        print(f"   {stage.name}: {total:.1f}s busy (limit {stage.limit})")
+    for r in failed:
+        print(f"   ❌ sentence_{r.number} at {r.failed_stage}: {r.error}")
@@ -0,0 +1,74 @@
+import os
+from tqdm import tqdm
+from files.FrameStream import ProbeVideo, DecodeFrames, FrameEncoder, RunFramePipeline, FINAL_PROFILE
+from files.FrameDedup import FrameDeduplicator
+
+def RenderVideo(clip_paths, output_video_path, upscaler=None, interpolator=None,
+                interpolate="before", mode="fps", profile=FINAL_PROFILE,
+                dedup_threshold=None, queue_size=8, batch_size=4):
+    """
+    Single-encode mode: turns the generated clips straight into the final video.
+
+    Every clip is decoded once, its frames are interpolated (RIFE) and enhanced
+    (Real-ESRGAN) in memory, and all clips are written in order into one
+    encoder, so the only lossy step after the Space is the final encode with
+    profile. No per-clip files, intermediate encodes or concat pass are made.
+
+    interpolate is "before" or "after" enhancement; mode is "fps" or
+    "duration" as in InterpolateVideo. upscaler and interpolator are optional
+    warm instances (either may be None to skip that step). All clips must
+    share size and frame rate, which holds for clips from one Space.
+    """
+    clip_paths = list(clip_paths)
+    if not clip_paths:
+        raise ValueError("No clips to render")
+
+    info = ProbeVideo(clip_paths[0])
+    for path in clip_paths[1:]:
+        other = ProbeVideo(path)
+        if (other.width, other.height, other.fps) != (info.width, info.height, info.fps):
+            raise ValueError(f"{path} is {other.width}x{other.height}@{other.fps}, expected "
+                             f"{info.width}x{info.height}@{info.fps}")
+
+    if upscaler is not None and dedup_threshold is not None:
+        upscaler = FrameDeduplicator(upscaler, threshold=dedup_threshold)
+    fps = info.fps
+    if interpolator is not None and mode == "fps":
+        fps *= interpolator.multiplier
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_video_path)), exist_ok=True)
+    out_width, out_height = info.width, info.height
+    if upscaler is not None:
+        out_width, out_height = upscaler.output_size(info.width, info.height)
+    encoder = FrameEncoder(output_video_path, out_width, out_height, fps, profile)
+    progress = tqdm(desc="Rendering Frames", unit="frame")
+
+    def process(frames):
+        width, height = info.width, info.height
+        if interpolator is not None and interpolate == "before":
+            frames = interpolator.interpolate_batch(frames, width, height)
+        if upscaler is not None:
+            frames = upscaler.upscale_batch(frames, width, height)
+            width, height = out_width, out_height
+        if interpolator is not None and interpolate == "after":
+            frames = interpolator.interpolate_batch(frames, width, height)
+        progress.update(len(frames))
+        return frames
+
+    try:
+        for path in clip_paths:
+            # Clips are cut apart, so no frames are interpolated across them
+            if interpolator is not None:
+                interpolator.reset()
+            RunFramePipeline(DecodeFrames(path, info), process, encoder.write,
+                             queue_size, batch_size)
+        encoder.close()
+    except BaseException:
+        encoder.abort()
+        raise
+    finally:
+        progress.close()
+
+    if upscaler is not None and dedup_threshold is not None:
+        print(upscaler.report())
+    print(f"🎬 Rendered {len(clip_paths)} clips into {output_video_path}")
@@ -0,0 +1,72 @@
+import os
+import requests
+
+from stem import Signal
+from stem.control import Controller
+
+# route Space traffic through Tor (USE_TOR=0 for local stand-in apps)
+USE_TOR = os.environ.get("USE_TOR", "1") != "0"
+
+# Tor's SOCKS port, resolving hostnames through Tor as well
+TOR_PROXY = "socks5h://127.0.0.1:9050"
+TOR_PROXIES = {"http": TOR_PROXY, "https": TOR_PROXY}
+
+def change_ip():
+    """
+    Signal Tor for a new circuit (NEWNYM). The retry backoff gives it time to build.
+    """
+    if not USE_TOR:
+        return
+    pw = "this_is_my_password"
+    if not pw:
+        print("⚠️ TOR_CONTROL_PASSWORD not set — cannot change IP")
+        return
+
+    print("🔄 Requesting new Tor identity…")
+    try:
+        with Controller.from_port(port=9051) as ctrl:
+            ctrl.authenticate(password=pw)
+            ctrl.signal(Signal.NEWNYM)
+        print("✅ Tor is building a new circuit.")
+    except Exception as e:
+        print(f"❌ Failed to signal Tor NEWNYM: {e}")
+
+def tor_ip_ok():
+    """
+    Returns True if we can fetch our IP over Tor.
+    """
+    if not USE_TOR:
+        return True
+    try:
+        ip = requests.get("https://api.ipify.org", timeout=10, proxies=TOR_PROXIES).text
+        print(f"🌐 Current exit-node IP: {ip}")
+        return True
+    except Exception as e:
+        print(f"❌ Tor connection test failed: {e}")
+        return False
+
+def use_tor_proxy():
+    """
+    Routes this process's HTTP traffic (including gradio_client) through Tor.
+    """
+    if not USE_TOR:
+        return
+    os.environ["HTTP_PROXY"]  = TOR_PROXY
+    os.environ["HTTPS_PROXY"] = TOR_PROXY
+    os.environ["ALL_PROXY"]   = TOR_PROXY
+
+def print_exit_node_country():
+    """
+    Prints the current Tor exit node IP and its country using ipinfo.io.
+    """
+    if not USE_TOR:
+        return
+    try:
+        response = requests.get("https://ipinfo.io/json", timeout=10, proxies=TOR_PROXIES)
+        data = response.json()
+        ip = data.get("ip", "Unknown")
+        country = data.get("country", "Unknown")
+        print(f"🌐 Current Tor exit node IP: {ip}")
+        print(f"🗺️  Exit node country: {country}")
+    except Exception as e:
+        print(f"❌ Failed to fetch exit node country: {e}")
@@ -0,0 +1,365 @@
+import os
+import queue
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from files.FrameStream import CHANNELS
+
+# Output scale of each realesrgan_ncnn_py model index
+MODEL_SCALES = {0: 2, 1: 3, 2: 4, 3: 4, 4: 4}
+
+DEFAULT_MODEL = 2
+DEFAULT_TILESIZE = 128
+
+# Smallest model of the default family per scale (realesr-animevideov3 x2/x3/x4)
+SCALE_MODELS = {2: 0, 3: 1, 4: DEFAULT_MODEL}
+
+# Input rows added above and below each strip so Real-ESRGAN and the
+# Lanczos filter see the same neighbourhood as on the whole frame
+STRIP_PADDING = 10
+
+@dataclass(frozen=True)
+class ResolutionProfile:
+    """
+    Output resolution of the enhance stage. Frames are upscaled with the
+    smallest model that reaches width x height, then downscaled (Lanczos) to
+    fit inside it, keeping the aspect ratio and even dimensions for yuv420p.
+
+    The frame is upscaled in horizontal strips of strip_rows input rows, each
+    downscaled into the output before the next one starts, so the full-size
+    Real-ESRGAN frame never exists. Peak memory of a worker per frame in
+    flight is bounded by peak_frame_bytes(): the input frame, one upscaled
+    strip (strip_rows + 2 * STRIP_PADDING rows) and the output frame, plus
+    ncnn's working memory for one tile of tilesize pixels.
+    """
+    width: int
+    height: int
+    strip_rows: int = 64
+
+    def fit(self, width: int, height: int) -> tuple:
+        ratio = min(self.width / width, self.height / height)
+        return (max(2, round(width * ratio / 2) * 2), max(2, round(height * ratio / 2) * 2))
+
+    def model_for(self, width: int, height: int) -> int:
+        """
+        The model index with the smallest scale that reaches the fitted size
+        from a width x height input (the x4 default when none does).
+        """
+        out_width, out_height = self.fit(width, height)
+        needed = max(out_width / width, out_height / height)
+        for scale in sorted(SCALE_MODELS):
+            if scale >= needed:
+                return SCALE_MODELS[scale]
+        return DEFAULT_MODEL
+
+    def peak_frame_bytes(self, width: int, height: int, scale: int) -> int:
+        out_width, out_height = self.fit(width, height)
+        strip = width * scale * (min(height, self.strip_rows) + 2 * STRIP_PADDING) * scale
+        return (width * height + strip + out_width * out_height) * CHANNELS
+
+    def key(self) -> tuple:
+        return (self.width, self.height, self.strip_rows)
+
+# Vertical 1080p delivery of the video Space's 640x1152 clips
+VERTICAL_1080P = ResolutionProfile(1080, 1920)
+
+def OutputSize(width: int, height: int, scale: int, target: ResolutionProfile = None) -> tuple:
+    """
+    Size of an enhanced width x height frame: the model's scale, or the
+    target's fitted size.
+    """
+    if target is None:
+        return width * scale, height * scale
+    return target.fit(width, height)
+
+class LocalUpscaler:
+    """
+    Real-ESRGAN loaded once in the current process. Frames are raw RGB buffers
+    (bytes, bytearray or memoryview) and are upscaled without touching the disk.
+    With a target ResolutionProfile, frames come out at the target's size.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, tilesize=DEFAULT_TILESIZE, gpuid=-1, target=None):
+        # Imported here so worker processes can set OMP_NUM_THREADS first
+        from realesrgan_ncnn_py import Realesrgan
+        from PIL import Image
+
+        self._image = Image
+        self.realesrgan = Realesrgan(gpuid=gpuid, model=model, tilesize=tilesize)
+        self.model = model
+        self.tilesize = tilesize
+        self.scale = MODEL_SCALES[model]
+        self.target = target
+
+    def output_size(self, width: int, height: int) -> tuple:
+        return OutputSize(width, height, self.scale, self.target)
+
+    def upscale(self, frame, width: int, height: int) -> bytes:
+        img = self._image.frombuffer("RGB", (width, height), frame, "raw", "RGB", 0, 1)
+        if self.target is None:
+            return self.realesrgan.process_pil(img).tobytes()
+        return self._upscale_to_target(img).tobytes()
+
+    def _upscale_to_target(self, img):
+        width, height = img.size
+        out_width, out_height = self.target.fit(width, height)
+        scale = self.scale
+        output = self._image.new("RGB", (out_width, out_height))
+
+        for top in range(0, height, self.target.strip_rows):
+            bottom = min(height, top + self.target.strip_rows)
+            # Output rows this strip produces, and where they lie in the padded upscaled strip
+            out_top = round(top * out_height / height)
+            out_bottom = round(bottom * out_height / height)
+            if out_bottom <= out_top:
+                continue
+            padded_top = max(0, top - STRIP_PADDING)
+            padded_bottom = min(height, bottom + STRIP_PADDING)
+            strip = self.realesrgan.process_pil(img.crop((0, padded_top, width, padded_bottom)))
+            box = (0, out_top * height * scale / out_height - padded_top * scale,
+                   width * scale, out_bottom * height * scale / out_height - padded_top * scale)
+            output.paste(strip.resize((out_width, out_bottom - out_top),
+                                      self._image.LANCZOS, box=box), (0, out_top))
+        return output
+
+    def upscale_batch(self, frames, width: int, height: int) -> list:
+        return [self.upscale(frame, width, height) for frame in frames]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _attach(name: str) -> SharedMemory:
+    shm = SharedMemory(name=name)
+    # The parent owns the segment; stop this process's tracker from unlinking it
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+def _worker_main(conn, model, tilesize, gpuid, threads, target):
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+
+    try:
+        upscaler = LocalUpscaler(model=model, tilesize=tilesize, gpuid=gpuid, target=target)
+    except Exception as e:
+        conn.send(("error", f"model load failed: {e}"))
+        return
+    conn.send(("ready", upscaler.scale))
+
+    segments = {}
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+
+            _, in_name, out_name, count, width, height = message
+            try:
+                # Segments replaced by the parent (after growing) are dropped
+                for name in list(segments):
+                    if name not in (in_name, out_name):
+                        segments.pop(name).close()
+                for name in (in_name, out_name):
+                    if name not in segments:
+                        segments[name] = _attach(name)
+                in_buf = segments[in_name].buf
+                out_buf = segments[out_name].buf
+
+                in_size = width * height * CHANNELS
+                out_width, out_height = upscaler.output_size(width, height)
+                out_size = out_width * out_height * CHANNELS
+                for i in range(count):
+                    frame = in_buf[i * in_size:(i + 1) * in_size]
+                    out_buf[i * out_size:(i + 1) * out_size] = upscaler.upscale(frame, width, height)
+                    frame.release()
+                conn.send(("ok", count))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        for shm in segments.values():
+            shm.close()
+
+class UpscalerWorker:
+    """
+    A long-lived Real-ESRGAN process. The model is loaded once when the worker
+    starts; batches of frames are exchanged through shared memory segments that
+    are reused (and only grown) between calls, so only the pipe messages are
+    serialised. With a target ResolutionProfile the output segment only holds
+    target-sized frames.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, tilesize=DEFAULT_TILESIZE, gpuid=-1, threads=None,
+                 target=None):
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(child_conn, model, tilesize, gpuid, threads, target),
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+        status, value = self._conn.recv()
+        if status != "ready":
+            self._process.join()
+            raise RuntimeError(value)
+        self.scale = value
+        self.model = model
+        self.tilesize = tilesize
+        self.target = target
+
+        self._in_shm = None
+        self._out_shm = None
+        self._lock = threading.Lock()
+
+    def _ensure_segments(self, in_bytes: int, out_bytes: int):
+        if self._in_shm is None or self._in_shm.size < in_bytes:
+            self._release(self._in_shm)
+            self._in_shm = SharedMemory(create=True, size=in_bytes)
+        if self._out_shm is None or self._out_shm.size < out_bytes:
+            self._release(self._out_shm)
+            self._out_shm = SharedMemory(create=True, size=out_bytes)
+
+    def output_size(self, width: int, height: int) -> tuple:
+        return OutputSize(width, height, self.scale, self.target)
+
+    @staticmethod
+    def _release(shm):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def upscale_batch(self, frames, width: int, height: int) -> list:
+        """
+        Upscales a batch of raw RGB frames and returns the upscaled frames as bytes.
+        """
+        frames = list(frames)
+        if not frames:
+            return []
+
+        in_size = width * height * CHANNELS
+        out_width, out_height = self.output_size(width, height)
+        out_size = out_width * out_height * CHANNELS
+
+        with self._lock:
+            self._ensure_segments(in_size * len(frames), out_size * len(frames))
+            for i, frame in enumerate(frames):
+                self._in_shm.buf[i * in_size:(i + 1) * in_size] = frame
+
+            self._conn.send(("batch", self._in_shm.name, self._out_shm.name,
+                             len(frames), width, height))
+            status, value = self._conn.recv()
+            if status != "ok":
+                raise RuntimeError(f"Upscaler worker failed: {value}")
+
+            return [bytes(self._out_shm.buf[i * out_size:(i + 1) * out_size])
+                    for i in range(len(frames))]
+
+    def upscale(self, frame, width: int, height: int) -> bytes:
+        return self.upscale_batch([frame], width, height)[0]
+
+    def close(self):
+        if self._process.is_alive():
+            try:
+                self._conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.join(timeout=10)
+            if self._process.is_alive():
+                self._process.kill()
+        self._conn.close()
+        self._release(self._in_shm)
+        self._release(self._out_shm)
+        self._in_shm = self._out_shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class UpscalerPool:
+    """
+    A fixed set of UpscalerWorker processes sharing the machine's cores.
+    Each batch is split across the idle workers and processed concurrently.
+    """
+
+    def __init__(self, workers=None, model=DEFAULT_MODEL, tilesize=DEFAULT_TILESIZE,
+                 gpuid=-1, threads_per_worker=None, target=None):
+        cpus = os.cpu_count() or 1
+        if workers is None:
+            workers = max(1, cpus // 4)
+        if threads_per_worker is None:
+            threads_per_worker = max(1, cpus // workers)
+
+        self.workers = [
+            UpscalerWorker(model=model, tilesize=tilesize, gpuid=gpuid, threads=threads_per_worker,
+                           target=target)
+            for _ in range(workers)
+        ]
+        self.scale = self.workers[0].scale
+        self.model = model
+        self.tilesize = tilesize
+        self.target = target
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def output_size(self, width: int, height: int) -> tuple:
+        return OutputSize(width, height, self.scale, self.target)
+
+    def _run_on_idle_worker(self, frames, width, height):
+        worker = self._idle.get()
+        try:
+            return worker.upscale_batch(frames, width, height)
+        finally:
+            self._idle.put(worker)
+
+    def upscale_batch(self, frames, width: int, height: int) -> list:
+        frames = list(frames)
+        if len(frames) <= 1 or len(self.workers) == 1:
+            return self._run_on_idle_worker(frames, width, height)
+
+        # One contiguous slice per worker, processed in parallel
+        step = -(-len(frames) // len(self.workers))
+        slices = [frames[i:i + step] for i in range(0, len(frames), step)]
+        results = [None] * len(slices)
+        errors = []
+
+        def run(index):
+            try:
+                results[index] = self._run_on_idle_worker(slices[index], width, height)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(slices))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        return [frame for part in results for frame in part]
+
+    def upscale(self, frame, width: int, height: int) -> bytes:
+        return self._run_on_idle_worker([frame], width, height)[0]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,134 @@
+import os
+import json
+import subprocess
+
+from files.Metrics import METRICS
+from files.RetryPolicy import RetryableError
+
+# Spaces round the requested size to their model's block size (pixels)
+SIZE_TOLERANCE = 32
+
+# An image whose thumbnail has a per-channel standard deviation (0-255) below
+# this in every channel is one flat colour (e.g. a black safety-filter image)
+BLANK_STDDEV = 3.0
+THUMBNAIL_SIZE = (64, 64)
+
+# Shortest acceptable clip: frames, and fraction of the requested duration
+MIN_CLIP_FRAMES = 8
+MIN_DURATION_RATIO = 0.5
+
+class ArtifactError(RetryableError):
+    """
+    A generated file that is missing, truncated, blank or the wrong size.
+    Retryable, so the job that produced it is resubmitted.
+    """
+
+def ExpectedSize(params: dict):
+    """
+    The (width, height) a backend was asked for, or None if its params do not say.
+    """
+    if "width" in params and "height" in params:
+        return params["width"], params["height"]
+    return None
+
+def _check_size(name: str, size, expected_size):
+    if expected_size is None:
+        return
+    if any(abs(actual - wanted) > SIZE_TOLERANCE for actual, wanted in zip(size, expected_size)):
+        raise ArtifactError(f"{name} is {size[0]}x{size[1]}, expected about "
+                            f"{expected_size[0]}x{expected_size[1]}")
+
+def _reject(path: str, kind: str, error: ArtifactError, discard: bool):
+    METRICS.count("rejected_artifacts", kind=kind)
+    if discard and os.path.exists(path):
+        os.unlink(path)
+    raise error
+
+def ValidateImage(path: str, expected_size=None, discard: bool = False):
+    """
+    Checks that path is a decodable image of about expected_size (width,
+    height) that is not blank. Raises ArtifactError otherwise; with discard
+    the bad file is deleted first so no later stage picks it up.
+    """
+    from PIL import Image, ImageStat
+
+    name = os.path.basename(path)
+    with METRICS.span("validate", kind="image"):
+        try:
+            if not os.path.isfile(path) or os.path.getsize(path) == 0:
+                raise ArtifactError(f"{name} is missing or empty")
+            try:
+                with Image.open(path) as img:
+                    # The size comes from the header; the thumbnail decodes
+                    # every pixel, so truncated files fail here
+                    _check_size(name, img.size, expected_size)
+                    thumb = img.convert("RGB").resize(THUMBNAIL_SIZE, Image.BILINEAR)
+            except (OSError, SyntaxError, ValueError) as e:
+                raise ArtifactError(f"{name} does not decode: {e}") from e
+            if max(ImageStat.Stat(thumb).stddev) < BLANK_STDDEV:
+                raise ArtifactError(f"{name} is blank (a single flat colour)")
+        except ArtifactError as e:
+            _reject(path, "image", e, discard)
+
+def ProbeClip(path: str) -> dict:
+    """
+    Reads size, frame count and duration of a clip with ffprobe. Packets are
+    counted without decoding, so this takes milliseconds.
+    """
+    result = subprocess.run([
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+        "-show_entries", "stream=width,height,nb_read_packets:format=duration",
+        "-of", "json", path
+    ], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ArtifactError(f"{os.path.basename(path)} does not probe: "
+                            f"{result.stderr.strip() or result.returncode}")
+    data = json.loads(result.stdout)
+    if not data.get("streams"):
+        raise ArtifactError(f"{os.path.basename(path)} has no video stream")
+    stream = data["streams"][0]
+    try:
+        duration = float(data.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = 0.0
+    return {
+        "width": int(stream.get("width", 0)),
+        "height": int(stream.get("height", 0)),
+        "frames": int(stream.get("nb_read_packets", 0)),
+        "duration": duration,
+    }
+
+def ValidateClip(path: str, expected_size=None, expected_duration: float = None,
+                 discard: bool = False):
+    """
+    Checks that path is a readable clip of about expected_size with at least
+    MIN_CLIP_FRAMES frames and MIN_DURATION_RATIO of expected_duration
+    seconds. Raises ArtifactError otherwise; with discard the bad file is
+    deleted first.
+    """
+    name = os.path.basename(path)
+    with METRICS.span("validate", kind="video"):
+        try:
+            if not os.path.isfile(path) or os.path.getsize(path) == 0:
+                raise ArtifactError(f"{name} is missing or empty")
+            info = ProbeClip(path)
+            _check_size(name, (info["width"], info["height"]), expected_size)
+            if info["frames"] < MIN_CLIP_FRAMES:
+                raise ArtifactError(f"{name} has only {info['frames']} frames")
+            if expected_duration and info["duration"] < expected_duration * MIN_DURATION_RATIO:
+                raise ArtifactError(f"{name} lasts {info['duration']:.2f}s, expected about "
+                                    f"{expected_duration:g}s")
+        except ArtifactError as e:
+            _reject(path, "video", e, discard)
+
+def IsValid(validate, path: str, *args) -> bool:
+    """
+    Runs validate(path, *args, discard=True) and reports a failure instead of
+    raising, e.g. for artifacts served from a cache.
+    """
+    try:
+        validate(path, *args, discard=True)
+        return True
+    except ArtifactError as e:
+        print(f"⚠️  Rejected: {e}")
+        return False
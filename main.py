@@ -1,12 +1,137 @@
 import re
 import os
-from files.GeneratePrompts import GeneratePrompts
-from files.ExtractPrompts import ExtractPrompts
-from files.GenerateImages import ImageGen
-from files.GenerateVideos import VideoGen
-from files.EnhanceVideos import EnhanceVideos
+import sys
+import argparse
+from contextlib import ExitStack
 
-HF_TOKEN_1 = ""
+# Only standard-library-backed modules are imported up front. Stage modules
+# (gradio_client, huggingface_hub, stem, Real-ESRGAN, PIL...) are imported by
+# the wrappers that use them, so e.g. `python main.py extract` starts instantly.
+from files.PromptRecords import (ValidatePrompts, ValidatePrompt, PrintPromptProblems,
+                                 WritePromptRecords, SplitScriptSentences)
+from files.ExtractPrompts import ExtractPrompts, LoadSentencePrompts
+from files.FrameStream import EncodeProfile, INTERMEDIATE_PROFILE
+from files.UpscaleService import VERTICAL_1080P
+from files.ArtifactCache import ArtifactCache
+from files.RunManifest import RunManifest, RecordPrompts, InputHash
+from files.PromptCache import PromptCache
+from files.Metrics import METRICS, ConfigureMetrics
+from files.RetryPolicy import RetryPolicy, ConfigureRetries
+
+# Hugging Face token for prompt generation (or set HF_TOKEN)
+HF_TOKEN_1 = os.environ.get("HF_TOKEN", "")
+
+# OpenAI-compatible server used instead of the provider, e.g. a local stand-in (None = provider)
+PROMPT_BASE_URL = None
+
+# Script sentences per prompt request; chunks are generated concurrently (None = one request)
+PROMPT_CHUNK_SIZE = None
+PROMPT_CONCURRENCY = 4
+
+# Per-sentence cache of LLM prompt blocks; only changed sentences are re-sent (None = off)
+PROMPT_CACHE = ".prompt_cache.sqlite"
+PROMPT_CACHE_MAX_BYTES = 64 * 1024 ** 2
+PROMPT_CACHE_TTL = 30 * 24 * 3600
+
+# Number of videos enhanced at once (None = this host's autotuned count,
+# else one worker per 4 cores; run `python -m files.Autotune` to tune)
+ENHANCE_WORKERS = None
+
+# Cores the local Real-ESRGAN and RIFE workers of this process may use
+# together (None = all; `batch work` gives each runner its share)
+RUNNER_CPUS = None
+
+# Output resolution of the enhance stage: Real-ESRGAN runs at the smallest scale
+# that reaches it and frames are downscaled in memory before encoding
+# (None = the model's full x4 size, e.g. 2560x4608 for the Space's 640x1152 clips)
+ENHANCE_TARGET = VERTICAL_1080P
+
+# Reuse enhanced frames whose thumbnails differ by at most this much (None = off)
+ENHANCE_DEDUP_THRESHOLD = None
+
+# Derive generation seeds from the prompts so reruns are reproducible
+DETERMINISTIC_SEEDS = False
+
+# On-disk cache for images, videos and enhanced videos (None = off)
+ARTIFACT_CACHE_DIR = ".artifact_cache"
+ARTIFACT_CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+# Per-sentence record of finished work; reruns skip what is done and valid (None = off)
+RUN_MANIFEST = "run_manifest.sqlite"
+
+# Run image -> video -> enhance per sentence with overlapping stages
+# instead of finishing each stage for every sentence first
+PIPELINED = True
+
+# When pipelined, start generating images while the LLM is still streaming prompts
+STREAM_PROMPTS = True
+
+# Local RIFE frame interpolation of the clips (see rife.sh): None = off,
+# "before" or "after" enhancement. Interpolating first touches fewer pixels.
+INTERPOLATE = None
+INTERPOLATE_MULTIPLIER = 2
+# "fps" raises the frame rate, "duration" stretches the clip at the same frame rate
+INTERPOLATE_MODE = "fps"
+
+# Final video joined from videos/video_N.mp4 by stream copy (None = off)
+ASSEMBLE_OUTPUT = "final_video.mp4"
+
+# Encoder settings of every deliverable video: slower presets and higher CRF
+# give smaller files, threads=0 lets x264 use every core
+ENCODE_PROFILE = EncodeProfile(preset="medium", crf=20, threads=0)
+
+# Decode each generated clip once, interpolate and enhance it in memory and
+# encode everything once into ASSEMBLE_OUTPUT, instead of writing per-stage clips
+SINGLE_ENCODE = False
+
+# How many sentences may be inside each stage at once when pipelined
+STAGE_LIMITS = {"image": 2, "video": 2, "interpolate": 1, "enhance": 1}
+
+# Remote jobs kept in flight per endpoint by the stage-by-stage chain
+MAX_JOBS_IN_FLIGHT = 4
+
+# Image and video endpoints; jobs are spread over them by health and observed
+# latency (None = the Spaces in IMAGE_SPACE_URL / VIDEO_SPACE_URL). Set to a
+# function returning backends from files.Backends, so they load lazily, e.g.
+#   def IMAGE_BACKENDS():
+#       from files.Backends import GradioImageBackend
+#       return [GradioImageBackend("https://a.hf.space"), GradioImageBackend("https://b.hf.space")]
+IMAGE_BACKENDS = None
+VIDEO_BACKENDS = None
+
+# How remote image/video jobs are retried: attempts, backoff, one job's timeout
+# and the budget per sentence (seconds)
+RETRY_POLICY = RetryPolicy(max_attempts=6, base_delay=5, max_delay=120,
+                           job_timeout=300, item_deadline=30 * 60)
+
+# Give up on everything still failing after this many seconds (None = no limit)
+RUN_DEADLINE = None
+
+# Consecutive failures that open an endpoint's circuit, and seconds before it is retried
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_AFTER = 120
+
+# Every span/counter of the run as JSON lines, and the totals for Prometheus (None = off)
+METRICS_JSONL = "metrics.jsonl"
+METRICS_PROMETHEUS = "metrics.prom"
+
+# Batch mode (`python main.py batch ...`): queued scripts each run in their own
+# directory under BATCH_PROJECTS. A `batch work` process runs one project at a
+# time (the stages resolve their paths from the project directory); start
+# several to work on projects in parallel. BATCH_MAX_RUNNING caps how many
+# projects all runners sharing the queue work on at once, and each runner
+# gets that fraction of STAGE_LIMITS, MAX_JOBS_IN_FLIGHT, PROMPT_CONCURRENCY
+# and the host's cores (at least one of each), so runners started on one host
+# with the same limit stay within them together. Worker pools and endpoint
+# circuit breakers belong to one runner process and are reused by its
+# successive projects, not shared between runners. A runner
+# renews its lease every BATCH_LEASE / 3 seconds, and a project is given up
+# after BATCH_MAX_ATTEMPTS runs that did not finish it.
+BATCH_QUEUE = "batch_queue.sqlite"
+BATCH_PROJECTS = "projects"
+BATCH_MAX_RUNNING = 2
+BATCH_LEASE = 300
+BATCH_MAX_ATTEMPTS = 3
 
 # ===============================
 
@@ -14,43 +139,559 @@ def read_file_as_string(filename):
     with open(filename, 'r', encoding='utf-8') as file:
         return file.read()
 
-def run_chain(functions):
+def run_chain(functions, cancelled=None) -> bool:
     for func in functions:
+        # Set when a batch runner loses its project's lease
+        if cancelled is not None and cancelled.is_set():
+            print(f"🛑 Cancelled before {func.__name__}. Halting chain.")
+            return False
         result = func()
 
         # If function returns a bool, respect it
         if isinstance(result, bool):
             if not result:
                 print(f"{func.__name__} failed. Halting chain.")
-                return
+                return False
         else:
             # Void function or other return types are treated as success
             continue
+    return True
+
+def get_artifact_cache():
+    if ARTIFACT_CACHE_DIR is None:
+        return None
+    return ArtifactCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES)
+
+def get_prompt_cache():
+    if PROMPT_CACHE is None:
+        return None
+    return PromptCache(PROMPT_CACHE, PROMPT_CACHE_MAX_BYTES, PROMPT_CACHE_TTL)
+
+def get_manifest():
+    if RUN_MANIFEST is None:
+        return None
+    return RunManifest(RUN_MANIFEST)
+
+# Warm worker pools (Real-ESRGAN, RIFE) kept for the whole process, so
+# batch mode reuses them across projects
+_shared_pools = {}
+_pool_stack = ExitStack()
+
+def shared_pool(key, factory):
+    # The pool built by factory() for key, created on first use
+    if key not in _shared_pools:
+        _shared_pools[key] = _pool_stack.enter_context(factory())
+    return _shared_pools[key]
+
+def close_shared_pools():
+    _shared_pools.clear()
+    _pool_stack.close()
+
+_backends_configured = False
+
+def configure_backends():
+    # Swaps in IMAGE_BACKENDS / VIDEO_BACKENDS the first time a generation stage runs
+    global _backends_configured
+    if _backends_configured:
+        return
+    from files.Backends import IMAGE_ROUTER, VIDEO_ROUTER
+    if IMAGE_BACKENDS:
+        IMAGE_ROUTER.configure(IMAGE_BACKENDS())
+    if VIDEO_BACKENDS:
+        VIDEO_ROUTER.configure(VIDEO_BACKENDS())
+    _backends_configured = True
 
 # ==== Wrapper Functions ====
 
 def GeneratePromptsWrapper():
     prompt_script = read_file_as_string("script.txt")
-    return GeneratePrompts(HF_TOKEN_1, prompt_script, "temp.txt")
+    manifest = get_manifest()
+    script_hash = InputHash(script=prompt_script)
+    if manifest is not None and manifest.is_done("script", 0, script_hash, "temp.txt"):
+        print("⏭️  temp.txt is up to date with script.txt, skipping.")
+        return True
+
+    from files.GeneratePrompts import GeneratePrompts, GeneratePromptsChunked
+
+    prompt_cache = get_prompt_cache()
+    if PROMPT_CHUNK_SIZE or prompt_cache is not None:
+        ok = GeneratePromptsChunked(HF_TOKEN_1, prompt_script, "temp.txt", PROMPT_CHUNK_SIZE,
+                                    PROMPT_CONCURRENCY, base_url=PROMPT_BASE_URL,
+                                    cache=prompt_cache)
+    else:
+        ok = GeneratePrompts(HF_TOKEN_1, prompt_script, "temp.txt", base_url=PROMPT_BASE_URL)
+    if manifest is not None:
+        if ok:
+            manifest.mark_done("script", 0, script_hash, "temp.txt")
+        else:
+            manifest.mark_failed("script", 0, script_hash, "GeneratePrompts failed")
+    return ok
 
 def ExtractPromptsWrapper():
     return ExtractPrompts("temp.txt", "prompts.txt")
 
+def regenerate_prompt(record):
+    # Re-request the prompts of one sentence from its line in the script
+    script_sentences = SplitScriptSentences(read_file_as_string("script.txt"))
+    if record.number > len(script_sentences):
+        return None
+    from files.GeneratePrompts import RegenerateSentencePrompt
+    return RegenerateSentencePrompt(HF_TOKEN_1, script_sentences[record.number - 1],
+                                    base_url=PROMPT_BASE_URL)
+
+def save_valid_prompts(valid, total):
+    # Downstream stages only ever see sentences that passed the gate
+    WritePromptRecords(valid, "prompts.txt")
+    manifest = get_manifest()
+    if manifest is not None:
+        RecordPrompts(manifest, valid)
+    print(f"🛂 {len(valid)}/{total} sentences passed prompt validation")
+    return len(valid) > 0
+
+def ValidatePromptsWrapper():
+    records = LoadSentencePrompts("prompts.txt")
+    valid, problems = ValidatePrompts(records, regenerate_prompt)
+    PrintPromptProblems(problems)
+    return save_valid_prompts(valid, len(records))
+
+def validated(sentences, accepted, rejected):
+    # Validation gate for sentences arriving from a live prompt stream
+    for record in sentences:
+        record, problems = ValidatePrompt(record, regenerate_prompt)
+        if problems:
+            PrintPromptProblems(problems)
+            rejected.append(record)
+            continue
+        accepted.append(record)
+        yield record
+
 def GenerateImagesWrapper():
-    return ImageGen("prompts.txt", "generated_images")
+    from files.GenerateImages import ImageGen
+    configure_backends()
+    return ImageGen("prompts.txt", "generated_images", get_artifact_cache(), DETERMINISTIC_SEEDS,
+                    get_manifest(), MAX_JOBS_IN_FLIGHT)
 
 def VideoGenWrapper():
-    return VideoGen("prompts.txt", "generated_images", "generated_videos")
+    from files.GenerateVideos import VideoGen
+    configure_backends()
+    return VideoGen("prompts.txt", "generated_images", "generated_videos",
+                    get_artifact_cache(), DETERMINISTIC_SEEDS, get_manifest(), MAX_JOBS_IN_FLIGHT)
+
+def enhance_folders():
+    # (input, output) folders of the enhance stage
+    if INTERPOLATE == "before":
+        return "interpolated_videos", "videos"
+    if INTERPOLATE == "after":
+        return "generated_videos", "enhanced_videos"
+    return "generated_videos", "videos"
+
+def interpolate_folders():
+    # (input, output) folders of the interpolate stage
+    if INTERPOLATE == "before":
+        return "generated_videos", "interpolated_videos"
+    return "enhanced_videos", "videos"
+
+def enhance_profile():
+    # Clips another local stage reads again are stored losslessly
+    return INTERMEDIATE_PROFILE if INTERPOLATE == "after" else ENCODE_PROFILE
+
+def interpolate_profile():
+    return INTERMEDIATE_PROFILE if INTERPOLATE == "before" else ENCODE_PROFILE
+
+def InterpolateVideosWrapper():
+    if INTERPOLATE is None:
+        return True
+    from files.InterpolateVideos import InterpolateVideos
+    input_folder, output_folder = interpolate_folders()
+    return InterpolateVideos(input_folder, output_folder, INTERPOLATE_MULTIPLIER,
+                             INTERPOLATE_MODE, threads=RUNNER_CPUS, cache=get_artifact_cache(),
+                             manifest=get_manifest(), profile=interpolate_profile())
 
 def EnhanceVideosWrapper():
-    return EnhanceVideos("generated_videos", "videos")
+    from files.EnhanceVideos import EnhanceVideos
+    input_folder, output_folder = enhance_folders()
+    return EnhanceVideos(input_folder, output_folder, streaming=True,
+                         workers=ENHANCE_WORKERS,
+                         dedup_threshold=ENHANCE_DEDUP_THRESHOLD,
+                         cache=get_artifact_cache(),
+                         manifest=get_manifest(),
+                         profile=enhance_profile(),
+                         target=ENHANCE_TARGET,
+                         cpus=RUNNER_CPUS)
+
+def AssembleVideosWrapper():
+    if ASSEMBLE_OUTPUT is None:
+        return True
+    from files.AssembleVideos import AssembleVideos
+    numbers = [record.number for record in LoadSentencePrompts("prompts.txt")]
+    return AssembleVideos("videos", ASSEMBLE_OUTPUT, numbers, profile=ENCODE_PROFILE)
+
+def RenderWrapper():
+    from files.Autotune import TunedUpscalerPool
+    from files.InterpolateVideos import RifeInterpolator
+    from files.SingleEncode import RenderVideo
+
+    numbers = [record.number for record in LoadSentencePrompts("prompts.txt")]
+    clips = [os.path.join("generated_videos", f"video_{number}.mp4") for number in numbers]
+    try:
+        upscaler = shared_pool(("upscaler", ENHANCE_WORKERS), lambda: TunedUpscalerPool(
+            workers=ENHANCE_WORKERS, target=ENHANCE_TARGET, cpus=RUNNER_CPUS))
+        interpolator = None
+        if INTERPOLATE is not None:
+            interpolator = shared_pool(("rife", INTERPOLATE_MULTIPLIER),
+                                       lambda: RifeInterpolator(INTERPOLATE_MULTIPLIER,
+                                                                threads=RUNNER_CPUS))
+        RenderVideo(clips, ASSEMBLE_OUTPUT or "final_video.mp4", upscaler, interpolator,
+                    INTERPOLATE or "before", INTERPOLATE_MODE, ENCODE_PROFILE,
+                    ENHANCE_DEDUP_THRESHOLD)
+    except Exception as e:
+        print(f"❌ Rendering failed: {e}")
+        return False
+    return True
+
+def run_sentence_pipeline(sentences):
+    from files.GenerateImages import ImageGenSentence
+    from files.GenerateVideos import VideoGenSentence
+    from files.Scheduler import Stage, RunPipeline
+
+    configure_backends()
+    cache = get_artifact_cache()
+    manifest = get_manifest()
+
+    def image_stage(sentence):
+        if not sentence.image_prompt:
+            raise ValueError("missing <image_generator_prompt>")
+        return ImageGenSentence(sentence.number, sentence.image_prompt, "generated_images",
+                                cache, DETERMINISTIC_SEEDS, manifest)
+
+    def video_stage(sentence):
+        if not sentence.video_prompt or not sentence.negative_prompt:
+            raise ValueError("missing <image_to_video_prompt> or negative prompt")
+        return VideoGenSentence(sentence.number, sentence.video_prompt,
+                                sentence.negative_prompt, "generated_images",
+                                "generated_videos", cache, DETERMINISTIC_SEEDS, manifest)
+
+    stages = [
+        Stage("image", image_stage, STAGE_LIMITS["image"]),
+        Stage("video", video_stage, STAGE_LIMITS["video"]),
+    ]
+
+    # In single-encode mode the clips are finished by RenderWrapper instead
+    if not SINGLE_ENCODE:
+        from files.Autotune import TunedUpscalerPool
+        from files.EnhanceVideos import EnhanceVideoJob
+
+        # One warm Real-ESRGAN process per concurrent enhancement, kept for the process
+        upscaler = shared_pool(("upscaler", STAGE_LIMITS["enhance"]), lambda: TunedUpscalerPool(
+            workers=STAGE_LIMITS["enhance"], target=ENHANCE_TARGET, cpus=RUNNER_CPUS))
+
+        def enhance_stage(sentence):
+            filename = f"video_{sentence.number}.mp4"
+            input_folder, output_folder = enhance_folders()
+            result = EnhanceVideoJob(os.path.join(input_folder, filename),
+                                     os.path.join(output_folder, filename), streaming=True,
+                                     upscaler=upscaler,
+                                     dedup_threshold=ENHANCE_DEDUP_THRESHOLD,
+                                     cache=cache, manifest=manifest,
+                                     profile=enhance_profile())
+            if not result.ok:
+                raise RuntimeError(result.error)
+            return True
+
+        stages.append(Stage("enhance", enhance_stage, STAGE_LIMITS["enhance"]))
+
+    if not SINGLE_ENCODE and INTERPOLATE is not None:
+        from files.InterpolateVideos import InterpolateVideoJob, InterpolatorPool
+
+        # One warm RIFE process per concurrent interpolation
+        rife_threads = None
+        if RUNNER_CPUS is not None:
+            rife_threads = max(1, RUNNER_CPUS // STAGE_LIMITS["interpolate"])
+        interpolators = shared_pool(("interpolators", STAGE_LIMITS["interpolate"]),
+                                    lambda: InterpolatorPool(STAGE_LIMITS["interpolate"],
+                                                             multiplier=INTERPOLATE_MULTIPLIER,
+                                                             threads=rife_threads))
+
+        def interpolate_stage(sentence):
+            filename = f"video_{sentence.number}.mp4"
+            input_folder, output_folder = interpolate_folders()
+            with interpolators.acquire() as interpolator:
+                return InterpolateVideoJob(os.path.join(input_folder, filename),
+                                           os.path.join(output_folder, filename),
+                                           interpolator, INTERPOLATE_MODE, cache, manifest,
+                                           interpolate_profile())
+
+        position = 2 if INTERPOLATE == "before" else 3
+        stages.insert(position, Stage("interpolate", interpolate_stage,
+                                      STAGE_LIMITS["interpolate"]))
+
+    results = RunPipeline(sentences, stages)
+
+    return all(r.ok for r in results)
+
+def PipelineWrapper():
+    return run_sentence_pipeline(LoadSentencePrompts("prompts.txt"))
+
+def StreamingPipelineWrapper():
+    prompt_script = read_file_as_string("script.txt")
+    manifest = get_manifest()
+    script_hash = InputHash(script=prompt_script)
+    if manifest is not None and manifest.is_done("script", 0, script_hash, "temp.txt"):
+        print("⏭️  temp.txt is up to date with script.txt, skipping.")
+        return ExtractPromptsWrapper() and ValidatePromptsWrapper() and PipelineWrapper()
+
+    from files.GeneratePrompts import PromptStream
+
+    # Sentences enter the pipeline as soon as the LLM finishes writing them
+    stream = PromptStream(HF_TOKEN_1, prompt_script, "temp.txt", PROMPT_CHUNK_SIZE,
+                          PROMPT_CONCURRENCY, PROMPT_BASE_URL, get_prompt_cache())
+    accepted, rejected = [], []
+    ok = run_sentence_pipeline(validated(stream, accepted, rejected))
+
+    if not stream.ok:
+        if manifest is not None:
+            manifest.mark_failed("script", 0, script_hash, "GeneratePrompts failed")
+        return False
+    if manifest is not None:
+        manifest.mark_done("script", 0, script_hash, "temp.txt")
+    return save_valid_prompts(accepted, len(accepted) + len(rejected)) and ok
+
+# ==== Command line ====
+
+# Every stage in the default run order
+STAGES = ("prompts", "extract", "validate", "images", "videos", "interpolate", "enhance",
+          "assemble")
+
+STAGE_HELP = {
+    "prompts": "generate temp.txt from script.txt with the LLM",
+    "extract": "extract prompts.txt from temp.txt",
+    "validate": "validate prompts.txt, re-requesting bad sentences",
+    "images": "generate an image per sentence",
+    "videos": "animate every image into a clip",
+    "interpolate": "RIFE frame interpolation (when INTERPOLATE is set)",
+    "enhance": "upscale the clips with Real-ESRGAN",
+    "assemble": "join the clips into ASSEMBLE_OUTPUT",
+}
+
+STAGE_WRAPPERS = {
+    "prompts": GeneratePromptsWrapper,
+    "extract": ExtractPromptsWrapper,
+    "validate": ValidatePromptsWrapper,
+    "images": GenerateImagesWrapper,
+    "videos": VideoGenWrapper,
+    "interpolate": InterpolateVideosWrapper,
+    "enhance": EnhanceVideosWrapper,
+    "assemble": AssembleVideosWrapper,
+}
+
+def stage_order():
+    # Interpolation runs after enhancement with INTERPOLATE = "after"
+    if INTERPOLATE == "after":
+        return ("prompts", "extract", "validate", "images", "videos", "enhance", "interpolate",
+                "assemble")
+    return STAGES
+
+def chain_steps():
+    """
+    The configured chain as (stages it covers, wrapper) steps.
+    """
+    # Pipelined runs interpolate and enhance per sentence, unless the clips
+    # are finished by RenderWrapper
+    per_sentence = ("images", "videos")
+    if not SINGLE_ENCODE:
+        per_sentence += ("interpolate", "enhance")
+    if PIPELINED and STREAM_PROMPTS:
+        steps = [(("prompts", "extract", "validate") + per_sentence, StreamingPipelineWrapper)]
+    elif PIPELINED:
+        steps = [((stage,), STAGE_WRAPPERS[stage]) for stage in ("prompts", "extract", "validate")]
+        steps.append((per_sentence, PipelineWrapper))
+    else:
+        steps = [((stage,), STAGE_WRAPPERS[stage]) for stage in stage_order()[:5]]
+
+    if SINGLE_ENCODE:
+        steps.append((("interpolate", "enhance", "assemble"), RenderWrapper))
+    else:
+        done = {stage for covered, _ in steps for stage in covered}
+        steps += [((stage,), STAGE_WRAPPERS[stage]) for stage in stage_order()
+                  if stage not in done]
+    return steps
+
+def select_steps(first: str = None, last: str = None) -> list:
+    """
+    Wrappers of the configured chain from stage first to last. A combined
+    step (e.g. the pipeline) that only partly falls in the range is replaced
+    by the single-stage wrappers of the stages inside it; the streaming
+    pipeline first falls back to prompts, extract, validate and the pipeline.
+    """
+    order = stage_order()
+    start = order.index(first) if first else 0
+    end = order.index(last) if last else len(order) - 1
+    if start > end:
+        raise SystemExit(f"--from {first} comes after --to {last}")
+    wanted = set(order[start:end + 1])
+
+    wrappers = []
+    steps = chain_steps()
+    while steps:
+        covered, wrapper = steps.pop(0)
+        if set(covered) <= wanted:
+            wrappers.append(wrapper)
+        elif wrapper is StreamingPipelineWrapper:
+            # Keep the per-sentence pipeline for the stages after the prompts
+            steps[:0] = [((stage,), STAGE_WRAPPERS[stage]) for stage in covered[:3]]
+            steps.insert(3, (covered[3:], PipelineWrapper))
+        else:
+            wrappers += [STAGE_WRAPPERS[stage] for stage in order
+                         if stage in covered and stage in wanted]
+    return wrappers
+
+def start_run(reset_breakers=True):
+    ConfigureMetrics(METRICS_JSONL)
+    ConfigureRetries(RETRY_POLICY, RUN_DEADLINE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_AFTER,
+                     reset_breakers)
+
+def finish_run():
+    if RUN_MANIFEST is not None:
+        get_manifest().print_summary()
+    # Endpoint stats only exist if a generation stage ran
+    if "files.Backends" in sys.modules:
+        from files.Backends import IMAGE_ROUTER, VIDEO_ROUTER
+        IMAGE_ROUTER.report()
+        VIDEO_ROUTER.report()
+    METRICS.report()
+    if METRICS_PROMETHEUS:
+        METRICS.write_prometheus(METRICS_PROMETHEUS)
+
+def share_paths():
+    """
+    Makes the caches, the tuning file and the RIFE checkout shared by every
+    project of a batch absolute before runners change into project directories.
+    """
+    global ARTIFACT_CACHE_DIR, PROMPT_CACHE
+    if ARTIFACT_CACHE_DIR is not None:
+        ARTIFACT_CACHE_DIR = os.path.abspath(ARTIFACT_CACHE_DIR)
+    if PROMPT_CACHE is not None:
+        PROMPT_CACHE = os.path.abspath(PROMPT_CACHE)
+    # Read by files.Autotune and files.InterpolateVideos when first imported
+    os.environ["ENHANCE_TUNING_FILE"] = os.path.abspath(
+        os.environ.get("ENHANCE_TUNING_FILE", ".enhance_tuning.json"))
+    os.environ["RIFE_DIR"] = os.path.abspath(os.environ.get("RIFE_DIR", "rife"))
+
+def share_resources(runners: int):
+    """
+    Gives this runner its 1/runners share of the stage limits, the remote
+    job and prompt request concurrency and the host's cores, so the runners
+    of a batch together stay within the configured limits.
+    """
+    global MAX_JOBS_IN_FLIGHT, PROMPT_CONCURRENCY, RUNNER_CPUS
+    runners = max(1, runners)
+    for stage, limit in STAGE_LIMITS.items():
+        STAGE_LIMITS[stage] = max(1, limit // runners)
+    MAX_JOBS_IN_FLIGHT = max(1, MAX_JOBS_IN_FLIGHT // runners)
+    PROMPT_CONCURRENCY = max(1, PROMPT_CONCURRENCY // runners)
+    RUNNER_CPUS = max(1, (RUNNER_CPUS or os.cpu_count() or 1) // runners)
+    print(f"⚖️  Runner share of {runners}: stage limits {STAGE_LIMITS}, "
+          f"{MAX_JOBS_IN_FLIGHT} jobs in flight, {RUNNER_CPUS} cores")
+
+def run_project(project, cancelled=None) -> bool:
+    # Runs the configured chain inside the project's own directory, stopping
+    # between stages once cancelled is set. This runner's endpoint routers,
+    # circuit breakers, caches and warm pools carry over from its previous
+    # projects; metrics and the run deadline start afresh.
+    previous_dir = os.getcwd()
+    os.chdir(project.directory)
+    try:
+        METRICS.drain()
+        start_run(reset_breakers=False)
+        ok = run_chain(select_steps(), cancelled)
+        finish_run()
+        return ok
+    finally:
+        os.chdir(previous_dir)
+
+def run_batch(args) -> bool:
+    from files.BatchQueue import BatchQueue, RunQueue
+
+    queue = BatchQueue(BATCH_QUEUE, BATCH_PROJECTS, BATCH_LEASE, BATCH_MAX_ATTEMPTS)
+    if args.batch_command == "add":
+        added = [queue.add(path, args.name) for path in args.scripts]
+        return all(project is not None for project in added)
+    if args.batch_command == "retry":
+        ok = True
+        for name in args.names:
+            if not queue.retry(name):
+                print(f"❌ {name} is not a finished or failed project")
+                ok = False
+        return ok
+    if args.batch_command == "work":
+        share_paths()
+        max_running = args.max_running or BATCH_MAX_RUNNING
+        share_resources(max_running)
+        return RunQueue(queue, run_project, max_running=max_running, poll=args.poll)
+    queue.print_summary()
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Turn script.txt into a finished video. Settings are the constants "
+                    "at the top of main.py; finished, unchanged work is skipped via the "
+                    "run manifest, so any command can be re-run to resume.")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    run = commands.add_parser("run", help="run the configured chain (the default command)")
+    run.add_argument("--from", dest="first", choices=STAGES, help="first stage to run")
+    run.add_argument("--to", dest="last", choices=STAGES, help="last stage to run")
+
+    for stage in STAGES:
+        commands.add_parser(stage, help=STAGE_HELP[stage])
+    commands.add_parser("pipeline", help="images -> videos -> enhance per sentence, "
+                                         "from prompts.txt")
+    commands.add_parser("render", help="decode, interpolate, enhance and encode every clip "
+                                       "once into ASSEMBLE_OUTPUT")
+
+    batch = commands.add_parser("batch", help="queue many scripts as projects and run them")
+    batch_commands = batch.add_subparsers(dest="batch_command", metavar="batch_command")
+    add = batch_commands.add_parser("add", help="queue scripts, each as its own project")
+    add.add_argument("scripts", nargs="+", help="script files")
+    add.add_argument("--name", help="project name (default: from the file name)")
+    work = batch_commands.add_parser("work", help="run queued projects until none is left")
+    work.add_argument("--max-running", type=int,
+                      help=f"projects in progress across all runners (default {BATCH_MAX_RUNNING})")
+    work.add_argument("--poll", type=float,
+                      help="keep waiting for new projects, checking every POLL seconds")
+    retry = batch_commands.add_parser("retry", help="queue failed or finished projects again")
+    retry.add_argument("names", nargs="+")
+    batch_commands.add_parser("list", help="show every project and its state (the default)")
+    args = parser.parse_args(argv)
+    if args.command == "batch" and args.batch_command == "add" and args.name and len(args.scripts) > 1:
+        parser.error("--name needs a single script")
+    return args
+
+def main(argv=None) -> bool:
+    args = parse_args(argv)
+    command = args.command or "run"
+    if command == "batch":
+        try:
+            return run_batch(args)
+        finally:
+            close_shared_pools()
+    if command == "run":
+        steps = select_steps(getattr(args, "first", None), getattr(args, "last", None))
+    elif command == "pipeline":
+        steps = [PipelineWrapper]
+    elif command == "render":
+        steps = [RenderWrapper]
+    else:
+        steps = [STAGE_WRAPPERS[command]]
 
-# ==== Execute the chain ====
+    start_run()
+    try:
+        ok = run_chain(steps)
+    finally:
+        close_shared_pools()
+    finish_run()
+    return ok
 
-run_chain([
-    #GeneratePromptsWrapper,
-    #ExtractPromptsWrapper,
-    #GenerateImagesWrapper,
-    #VideoGenWrapper,
-    EnhanceVideosWrapper,
-])
\ No newline at end of file
+# Guarded so spawned enhancement workers can import this module safely
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)